@@ -0,0 +1,43 @@
+# Compares writing the JSON "AST" of a document by building it with
+# `template_to_ast` and encoding that, against `render_ast`, which writes it
+# as it goes. Time is for a parsed document (as nodes), and peak memory is for
+# the whole of reading, parsing and writing a document out.
+#
+#   python -m bench.ast
+
+import io
+
+from glue.codegen import js_encoder, render_ast, streamast
+from glue.library import Standard
+from glue.parser import parse
+from glue.util import template_to_ast
+from bench.common import best_of, table
+from bench.memory import document, measure
+
+
+def built(text):
+  for s in js_encoder.iterencode(template_to_ast(parse(Standard, text))):
+    pass
+
+def streamed(text):
+  for s in streamast(Standard, io.StringIO(text)):
+    pass
+
+
+def main():
+  parse(Standard, 'warm *up*')
+  rows = []
+  for n in (300, 3000):
+    text = document(n)
+    html = parse(Standard, text, nodes=True)
+    for name, encode, f in (('template_to_ast', lambda: js_encoder.encode(template_to_ast(html)), built),
+                            ('render_ast', lambda: render_ast(html), streamed)):
+      elapsed = best_of(encode, repeat=3)
+      peak = measure(lambda: f(text))[1]
+      rows.append([n, name, f'{elapsed * 1000:.1f}', f'{peak / 1e6:.2f}'])
+
+  table(['sections', 'writer', 'ms', 'peak MB'], rows)
+
+
+if __name__ == '__main__':
+  main()
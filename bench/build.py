@@ -0,0 +1,51 @@
+# Measures how a batch `build` of many small documents scales with the number
+# of worker processes, and how long a rebuild takes with a build cache, when
+# nothing or one file has changed.
+#
+#   python -m bench.build [max workers]
+
+import os
+import sys
+import tempfile
+
+from glue.build import build
+from glue.library import Standard
+from bench.common import best_of, table
+from bench.render import document
+
+
+def main():
+  workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+  with tempfile.TemporaryDirectory() as tmp:
+    files = []
+    for i in range(400):
+      files.append(os.path.join(tmp, f'doc_{i}.glu'))
+      with open(files[-1], 'w') as f:
+        f.write(document(10))
+
+    def run(n, cache=None):
+      for f, error in build(Standard, files, ['html', 'mithril'], os.path.join(tmp, 'out'), n, cache=cache):
+        assert error is None, error
+
+    rows = []
+    serial = best_of(lambda: run(1), repeat=3)
+    for n in range(1, workers + 1):
+      elapsed = serial if n == 1 else best_of(lambda: run(n), repeat=3)
+      rows.append([n, f'{elapsed:.2f}', f'{len(files) / elapsed:.0f}', f'{serial / elapsed:.2f}'])
+
+    cache = os.path.join(tmp, 'cache')
+    cold = best_of(lambda: run(1, cache), repeat=1)
+    warm = best_of(lambda: run(1, cache), repeat=3)
+    def touch():
+      with open(files[0], 'a') as f:
+        f.write('\nOne more line.\n')
+      run(1, cache)
+    edited = best_of(touch, repeat=3)
+
+  table(['workers', 'seconds', 'files/s', 'speedup'], rows)
+  print()
+  table(['cache', 'seconds'], [['cold', f'{cold:.2f}'], ['warm', f'{warm:.2f}'], ['one file edited', f'{edited:.2f}']])
+
+
+if __name__ == '__main__':
+  main()
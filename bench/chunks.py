@@ -0,0 +1,33 @@
+# Time to the first chunk of a page with `render_chunks`, against the time to
+# render all of it, which is when the first byte goes out if the page is
+# concatenated before it's sent.
+#
+#   python -m bench.chunks
+
+import time
+
+from glue.html import render, render_chunks
+from glue.library import Standard
+from glue.parser import parse
+from glue.util import unwind
+from bench.common import best_of, table
+from bench.render import document
+
+
+def first_chunk(html, size):
+  start = time.perf_counter()
+  next(iter(render_chunks(html, size=size, encoding='utf-8')))
+  return time.perf_counter() - start
+
+
+def main():
+  html = unwind(parse(Standard, document(5000)))
+  whole = best_of(lambda: render(html).encode('utf-8'))
+  rows = [['whole page', f'{whole * 1000:.2f}']]
+  for size in (1 << 10, 1 << 13, 1 << 16):
+    rows.append([f'first {size} chars', f'{min(first_chunk(html, size) for _ in range(5)) * 1000:.2f}'])
+  table(['', 'ms'], rows)
+
+
+if __name__ == '__main__':
+  main()
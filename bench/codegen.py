@@ -0,0 +1,25 @@
+# Throughput of the mithril, elm and imba code generators, on a parsed
+# document (as nodes, so it can be generated from more than once).
+#
+#   python -m bench.codegen
+
+from glue.codegen import render_mithril, render_elm, render_imba
+from glue.library import Standard
+from glue.parser import parse
+from bench.common import best_of, table
+from bench.render import document
+
+
+def main():
+  html = parse(Standard, document(2000), nodes=True)
+  rows = []
+  for name, f in (('mithril', render_mithril), ('elm', render_elm), ('imba', render_imba)):
+    size = len(f(html))
+    elapsed = best_of(lambda: f(html), repeat=3)
+    rows.append([name, f'{elapsed * 1000:.1f}', f'{size / elapsed / 1e6:.2f}'])
+
+  table(['backend', 'ms', 'MB/s of code'], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,62 @@
+# Helpers shared by the benchmark scripts in this directory.
+# The scripts are meant to be run from the root of the repo, eg:
+#
+#   python -m bench.dispatch
+#
+# They print their results as plain tables, so they're easy to paste into
+# an issue or a PR.
+
+import time
+
+from glue.elements import SingleGroupInline
+from glue.library import Standard
+
+
+def best_of(f, repeat=5, number=1):
+  """Best wall clock time in seconds of `number` calls to `f`, over `repeat` runs."""
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    for _ in range(number):
+      f()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+# first characters for the custom elements, none of which start a standard one.
+CUSTOM_STARTS = '%&=$|;'
+
+def custom_inlines(n: int):
+  """`n` distinct single group inline elements, like `%3:text:%`."""
+  return [SingleGroupInline(f'custom-{i}', f'{CUSTOM_STARTS[i % len(CUSTOM_STARTS)]}{i}:',
+                            f':{CUSTOM_STARTS[i % len(CUSTOM_STARTS)]}', 'span', {'class': f'c{i}'})
+          for i in range(n)]
+
+
+def custom_registry(n: int):
+  """The `Standard` registry with `n` custom inline elements added to it."""
+  return Standard + custom_inlines(n)
+
+
+def sample_text(elements, paragraphs=200):
+  """
+  A document with a mix of plain text, standard markup and one use of each of
+  the custom `elements` per paragraph (cycling through them).
+  """
+  lines = []
+  for i in range(paragraphs):
+    e = elements[i % len(elements)] if elements else None
+    custom = f'{e.delimiters[0]}custom{e.delimiters[1]}' if e else ''
+    lines.append(f'Some *bold* and _italic_ text with a [link](http://example.com) '
+                 f'and `code`, {custom} followed by a longer run of plain words '
+                 f'that do not contain any markup at all.\n')
+  return '\n'.join(lines)
+
+
+def table(header, rows):
+  """Prints rows as a simple aligned table."""
+  rows = [[str(x) for x in r] for r in rows]
+  widths = [max(len(str(h)), *(len(r[i]) for r in rows)) for i, h in enumerate(header)]
+  print('  '.join(str(h).rjust(w) for h, w in zip(header, widths)))
+  for r in rows:
+    print('  '.join(x.rjust(w) for x, w in zip(r, widths)))
@@ -0,0 +1,50 @@
+# Measures the cost of routing an inline match back to the element that made it,
+# as the registry grows. The old approach scanned `m.groups()` for the first
+# non-None group and then scanned the group offsets of every element; the
+# matcher now looks the element up by `m.lastindex`.
+#
+#   python -m bench.dispatch
+
+import operator as op
+import toolz as t
+
+from glue.library import Paragraphs
+from glue.parser import matchers
+from glue.util import indexby, num_groups
+from bench.common import best_of, custom_inlines, custom_registry, sample_text, table
+
+
+def linear_dispatch(matcher, grouplengths, m):
+  # this is what parseinline used to do for every match.
+  groupind = indexby(lambda x: x is not None, m.groups())
+  matchind = indexby(lambda x: x >= groupind, grouplengths)
+  return matcher.inlines[matchind][1]
+
+
+def lastindex_dispatch(matcher, m):
+  parser, elem, ids = matcher.dispatch[m.lastindex]
+  return parser, elem, matcher.groups(m, ids)
+
+
+def main():
+  rows = []
+  for n in (0, 50, 100, 200, 300):
+    registry = custom_registry(n)
+    matcher = matchers.get(registry, Paragraphs)
+    text = sample_text(custom_inlines(n))
+    found = list(matcher.patt.finditer(text))
+
+    # the group offsets of each element, with the wrapper groups counted in.
+    grouplengths = list(t.cons(0, t.accumulate(
+      op.add, t.map(lambda x: num_groups(x[0]) + 1, matcher.inlines))))
+
+    linear = best_of(lambda: [linear_dispatch(matcher, grouplengths, m) for m in found])
+    lastindex = best_of(lambda: [lastindex_dispatch(matcher, m) for m in found])
+    rows.append([len(matcher.inlines), len(found),
+                 f'{linear / len(found) * 1e6:.2f}', f'{lastindex / len(found) * 1e6:.2f}'])
+
+  table(['elements', 'matches', 'linear us/match', 'lastindex us/match'], rows)
+
+
+if __name__ == '__main__':
+  main()
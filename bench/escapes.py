@@ -0,0 +1,29 @@
+# Compares `parseinline` with `parseinline_sentinel`, which matches patterns
+# without the escape prefix against text whose escapes are swapped out first,
+# on text with no escapes in it and on text that's full of them.
+#
+#   python -m bench.escapes
+
+from glue.library import Standard, Paragraphs
+from glue.parser import parseinline, parseinline_sentinel
+from glue.util import unpack
+from bench.common import best_of, table
+
+
+PLAIN = 'Some *bold* text, some _italic_ text, `code` and a [link](https://example.com).\n'
+ESCAPED = r'Some \*not bold\* text, \_not\_ italic, a \\*bold\\* one and \[not a link\](x).' + '\n'
+
+
+def main():
+  rows = []
+  for name, line in (('escape-free', PLAIN), ('escape-heavy', ESCAPED)):
+    text = line * 2000
+    times = [best_of(lambda: [unpack(x) for x in f(Standard, Paragraphs, text)])
+             for f in (parseinline, parseinline_sentinel)]
+    rows.append([name, len(text)] + [f'{len(text) / x / 1e6:.2f}' for x in times])
+
+  table(['text', 'chars', 'prefix MB/s', 'sentinel MB/s'], rows)
+
+
+if __name__ == '__main__':
+  main()
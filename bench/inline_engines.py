@@ -0,0 +1,36 @@
+# Compares `parseinline` with the single pass `parseinline_tokens` on text where
+# inline elements are nested deeper and deeper.
+#
+#   python -m bench.inline_engines
+
+from glue.library import Standard, Paragraphs
+from glue.parser import parseinline, parseinline_tokens
+from glue.util import unpack
+from bench.common import best_of, table
+
+# delimiters that can be nested inside each other in the Standard registry.
+FRAMES = [('*', '*'), ('_', '_'), ('~', '~'), ('^{', '}'), ('{++', '++}'), ('{--', '--}'), ('{==', '==}')]
+
+
+def nested(depth: int, words: int = 50):
+  text = ' '.join(['word'] * words)
+  for i in range(depth):
+    start, end = FRAMES[i % len(FRAMES)]
+    text = f'{start}{text} {i}{end} and some more text'
+  return '\n'.join([text] * 20)
+
+
+def main():
+  rows = []
+  for depth in (1, 2, 4, 7):
+    text = nested(depth)
+    # unpack consumes the generators, so the lazy parts get timed too.
+    old = best_of(lambda: [unpack(x) for x in parseinline(Standard, Paragraphs, text)])
+    new = best_of(lambda: [unpack(x) for x in parseinline_tokens(Standard, Paragraphs, text)])
+    rows.append([depth, len(text), f'{old * 1e3:.2f}', f'{new * 1e3:.2f}'])
+
+  table(['depth', 'chars', 'parseinline ms', 'parseinline_tokens ms'], rows)
+
+
+if __name__ == '__main__':
+  main()
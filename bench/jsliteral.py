@@ -0,0 +1,30 @@
+# Serializing big component props (like a `YamlComponent` with a lot of data)
+# to a JS literal, against the old way: python's `str` of the dict, with
+# booleans patched up after.
+#
+#   python -m bench.jsliteral
+
+from glue.codegen import js_literal
+from bench.common import best_of, table
+
+
+def props(rows: int):
+  return {'title': 'Chart', 'live': True,
+          'rows': [{'id': i, 'label': f'row {i}', 'ok': i % 2 == 0, 'values': [i, i * 0.5, None]}
+                   for i in range(rows)]}
+
+
+def main():
+  rows = []
+  for n in (10000, 40000, 160000):
+    p = props(n)
+    size = len(js_literal(p)) / 1e6
+    old = best_of(lambda: str(p).replace('True', 'true').replace('False', 'false'), repeat=3)
+    new = best_of(lambda: js_literal(p), repeat=3)
+    rows.append([f'{size:.1f}', f'{old * 1000:.1f}', f'{new * 1000:.1f}', f'{size / new:.1f}'])
+
+  table(['MB', 'str+replace ms', 'js_literal ms', 'js_literal MB/s'], rows)
+
+
+if __name__ == '__main__':
+  main()
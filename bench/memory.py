@@ -0,0 +1,50 @@
+# Measures the memory taken by a parsed document: the html kept once parsing is
+# done, the peak while parsing, and the number of live allocations, for the
+# cottonmouth lists that `parse` returns and for the nodes it builds them from
+# (`parse(..., nodes=True)`), which is what the renderers are given.
+#
+#   python -m bench.memory
+
+import gc
+import tracemalloc
+
+from glue.library import Standard
+from glue.parser import parse
+from glue.util import unwind
+from bench.common import table
+
+
+def document(sections: int):
+  return ''.join(f'# Section {i}\n\nSome *bold* and _it_ text, a [link](u) and `code`.\n'
+                 f'More ^sup^ here.\n\n---blockquote\nA *quote*.\n...\n'
+                 for i in range(sections))
+
+
+def measure(f):
+  """`(retained, peak, blocks)` of the result of `f()`, in bytes and allocations."""
+  gc.collect()
+  tracemalloc.start()
+  result = f()
+  gc.collect()
+  retained, peak = tracemalloc.get_traced_memory()
+  blocks = sum(s.count for s in tracemalloc.take_snapshot().statistics('filename'))
+  tracemalloc.stop()
+  del result
+  return retained, peak, blocks
+
+
+def main():
+  parse(Standard, 'warm *up*')
+  rows = []
+  for n in (300, 3000):
+    text = document(n)
+    for name, f in (('lists', lambda: unwind(parse(Standard, text))),
+                    ('nodes', lambda: parse(Standard, text, nodes=True))):
+      retained, peak, blocks = measure(f)
+      rows.append([n, name, f'{retained / 1e6:.2f}', f'{peak / 1e6:.2f}', blocks])
+
+  table(['sections', 'tree', 'retained MB', 'peak MB', 'blocks'], rows)
+
+
+if __name__ == '__main__':
+  main()
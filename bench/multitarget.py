@@ -0,0 +1,32 @@
+# Compares generating html, mithril and elm for a document with a `to*` call
+# each, which parses it every time, against `tomany`, which parses it once.
+#
+#   python -m bench.multitarget
+
+from glue.codegen import tomany, toprettyhtml, tomithril, toelm
+from glue.library import Standard
+from bench.common import best_of, table
+from bench.render import document
+
+
+def separately(text):
+  return {'html': toprettyhtml(Standard, text), 'mithril': tomithril(Standard, text), 'elm': toelm(Standard, text)}
+
+def together(text):
+  return tomany(Standard, text, ['html', 'mithril', 'elm'])
+
+
+def main():
+  rows = []
+  for n in (100, 1000):
+    text = document(n)
+    assert separately(text) == together(text)
+    slow = best_of(lambda: separately(text), repeat=3)
+    fast = best_of(lambda: together(text), repeat=3)
+    rows.append([n, f'{slow * 1000:.1f}', f'{fast * 1000:.1f}', f'{slow / fast:.2f}x'])
+
+  table(['sections', 'to* ms', 'tomany ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+  main()
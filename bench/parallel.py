@@ -0,0 +1,44 @@
+# Measures how `parse` scales with the number of worker processes, on a big
+# document made of many independent top level chunks.
+#
+#   python -m bench.parallel [max workers]
+
+import os
+import sys
+
+from glue.library import Standard
+from glue.parser import parse
+from glue.util import unwind
+from bench.common import best_of, table
+
+
+CHUNK = '''# Section
+
+Some *bold* text, some _italic_ text and a [link](https://example.com).
+A ^superscript^ and ~subscript~ for good measure.
+
+---blockquote
+A quote, with **emphasis** inside it.
+...
+
+- a list
+- of things
+
+'''
+
+def main():
+  workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+  text = CHUNK * 5000
+  rows = []
+  serial = best_of(lambda: unwind(parse(Standard, text)), repeat=3)
+  rows.append(['serial', f'{serial:.2f}', '1.00'])
+  for n in range(1, workers + 1):
+    elapsed = best_of(lambda: unwind(parse(Standard, text, workers=n)), repeat=3)
+    rows.append([n, f'{elapsed:.2f}', f'{serial / elapsed:.2f}'])
+
+  print(f'{len(text)} chars')
+  table(['workers', 'seconds', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,36 @@
+# Measures inline parsing throughput as the registry grows, with and without the
+# first character buckets in `InlineMatcher`.
+#
+#   python -m bench.registry_size
+
+from glue.library import Paragraphs
+from glue.parser import InlineMatcher, parseinline
+from glue.util import unpack
+from bench.common import best_of, custom_inlines, custom_registry, sample_text, table
+
+
+def run(registry, text):
+  return [unpack(x) for x in parseinline(registry, Paragraphs, text)]
+
+
+def main():
+  rows = []
+  for n in (0, 50, 100, 200, 300, 500):
+    registry = custom_registry(n)
+    text = sample_text(custom_inlines(n))
+    bucketed = best_of(lambda: run(registry, text))
+
+    # swap an unbucketed matcher into the cache to time the single big pattern.
+    subinline = list(registry.inline_subscriptions(Paragraphs.subinline))
+    registry.cache[(InlineMatcher, id(Paragraphs), id(None))] = (
+      Paragraphs, None, InlineMatcher(subinline, bucketed=False))
+    combined = best_of(lambda: run(registry, text))
+
+    rows.append([len(subinline), len(text),
+                 f'{len(text) / combined / 1e6:.2f}', f'{len(text) / bucketed / 1e6:.2f}'])
+
+  table(['elements', 'chars', 'combined MB/s', 'bucketed MB/s'], rows)
+
+
+if __name__ == '__main__':
+  main()
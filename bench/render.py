@@ -0,0 +1,33 @@
+# Compares `render`, which yields through nested generators, with
+# `render_fast`, which appends to a list and caches tag strings, on the html of
+# a parsed document.
+#
+#   python -m bench.render
+
+from glue.html import render, render_fast
+from glue.library import Standard
+from glue.parser import parse
+from glue.util import unwind
+from bench.common import best_of, table
+
+
+def document(sections: int):
+  return ''.join(f'# Section {i}\n\nSome *bold* and _it_ text, a [link](u) and `code`.\n'
+                 f'![image](/img/{i}.png)\n\n---blockquote\nA *quote*.\n...\n'
+                 for i in range(sections))
+
+
+def main():
+  rows = []
+  for n in (100, 1000, 5000):
+    html = unwind(parse(Standard, document(n)))
+    assert render(html) == render_fast(html)
+    slow = best_of(lambda: render(html))
+    fast = best_of(lambda: render_fast(html))
+    rows.append([n, f'{slow * 1000:.1f}', f'{fast * 1000:.1f}', f'{slow / fast:.2f}x'])
+
+  table(['sections', 'render ms', 'render_fast ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,68 @@
+# Compares glue.serialize with pickle and JSON for caching parsed documents,
+# on paragraphs of `parseinline` output (with its `(elem, html)` tuples): the
+# size, and the time to write and read back each form. Elements can't be
+# pickled, so pickle stores them by name with `persistent_id`, and JSON writes
+# the names without turning them back into elements.
+#
+#   python -m bench.serialize
+
+import io
+import pickle
+import simplejson as json
+
+from glue.elements import Element
+from glue.library import Standard
+from glue.parser import parseinline
+from glue.serialize import dumps, loads, lazyloads
+from bench.common import best_of, table, sample_text
+
+
+class ElementPickler(pickle.Pickler):
+  def persistent_id(self, obj):
+    return obj.name if isinstance(obj, Element) else None
+
+class ElementUnpickler(pickle.Unpickler):
+  def persistent_load(self, name):
+    return elements[name]
+
+elements = {e.name: e for e in Standard.values()}
+
+def pickle_dumps(html):
+  f = io.BytesIO()
+  ElementPickler(f, pickle.HIGHEST_PROTOCOL).dump(html)
+  return f.getvalue()
+
+def pickle_loads(data):
+  return ElementUnpickler(io.BytesIO(data)).load()
+
+def json_dumps(html):
+  return json.dumps(html, default=lambda e: e.name).encode()
+
+def skim(data):
+  """Reads the top level of a document with `lazyloads`, skipping the paragraphs."""
+  return list(lazyloads(data, Standard))
+
+
+def document(paragraphs: int):
+  return ['div', *(['p', *parseinline(Standard, Standard.top, p)]
+                   for p in sample_text([], paragraphs).split('\n\n'))]
+
+
+def main():
+  rows = []
+  for n in (2000, 20000):
+    html = document(n)
+    for name, write, read in (('glue', lambda html: dumps(html, Standard), lambda data: loads(data, Standard)),
+                              ('glue lazy, top level', lambda html: dumps(html, Standard), skim),
+                              ('pickle', pickle_dumps, pickle_loads),
+                              ('json', json_dumps, json.loads)):
+      data = write(html)
+      written = best_of(lambda: write(html), repeat=3)
+      read_back = best_of(lambda: read(data), repeat=3)
+      rows.append([n, name, f'{len(data) / 1e3:.0f}', f'{written * 1000:.1f}', f'{read_back * 1000:.1f}'])
+
+  table(['paragraphs', 'format', 'KB', 'write ms', 'read ms'], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,33 @@
+# Measures the last step of parsing a SUB block: running its parser over the
+# text with placeholders in it, and splicing the children back in.
+#
+#   python -m bench.splice
+
+from glue.library import Paragraphs, Bold, Blockquote
+from glue.parser import splicesubs
+from glue.util import unwind
+from bench.common import best_of, table
+
+
+def children(paragraphs: int):
+  """What a paragraph heavy document parses to, before `splicesubs`."""
+  blocks = []
+  for i in range(paragraphs):
+    blocks += ['Paragraph ', (Bold, ['strong', {}, 'bold']), ' text\nmore text\n\n']
+    if i % 10 == 0:
+      blocks.append((Blockquote, ['div.blockquote', ['p', 'quote']]))
+  return blocks
+
+
+def main():
+  rows = []
+  for n in (1000, 10000, 50000):
+    blocks = children(n)
+    elapsed = best_of(lambda: unwind(splicesubs(Paragraphs, blocks)))
+    rows.append([n, f'{elapsed * 1000:.1f}', f'{n / elapsed / 1000:.1f}'])
+
+  table(['paragraphs', 'ms', 'k paragraphs/s'], rows)
+
+
+if __name__ == '__main__':
+  main()
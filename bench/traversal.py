@@ -0,0 +1,65 @@
+# Measures the per node cost of the tree traversals, which use an explicit
+# stack instead of recursion: on a bushy document shaped tree, and on chains
+# nested deeper than the recursion limit.
+#
+#   python -m bench.traversal
+
+from glue.codegen import render_mithril, render_imba
+from glue.html import render
+from glue.util import unwind, unpack, tonode, tolist, template_to_ast
+from bench.common import best_of, table
+
+
+def bushy(sections: int):
+  """A document like tree, `sections` wide and a few levels deep."""
+  return ['div', {}, *(['section', {'class': 'x'},
+                        ['h1', 'title'],
+                        ['p', 'some ', ['strong', 'bold'], ' text ', ['a', {'href': 'u'}, 'link']],
+                        ['ul', *(['li', ['p', 'item']] for _ in range(3))]]
+                       for _ in range(sections))]
+
+
+def chain(depth: int):
+  html = 'leaf'
+  for _ in range(depth):
+    html = ['div', {}, html]
+  return html
+
+
+def size(html) -> int:
+  """Number of tags and strings in `html`."""
+  n, stack = 0, [html]
+  while stack:
+    x = stack.pop()
+    n += 1
+    if isinstance(x, list):
+      stack.extend(y for y in x if not isinstance(y, dict))
+  return n
+
+
+def main():
+  traversals = [
+    ('unwind', unwind),
+    ('unpack', unpack),
+    ('tonode', tonode),
+    ('tolist', lambda html: tolist(tonode(html))),
+    ('template_to_ast', template_to_ast),
+    ('render', render),
+    ('render_mithril', render_mithril),
+    ('render_imba', render_imba),
+  ]
+  trees = [('bushy', bushy(2000)), ('chain 500', chain(500)), ('chain 10000', chain(10000))]
+
+  rows = []
+  for name, f in traversals:
+    row = [name]
+    for _, html in trees:
+      elapsed = best_of(lambda: f(html), repeat=3)
+      row.append(f'{elapsed / size(html) * 1e9:.0f}')
+    rows.append(row)
+
+  table(['traversal', *(f'{name} ns/node' for name, _ in trees)], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,47 @@
+# Compares the cost of an edit when each one runs `python -m glue` on the
+# changed file, against a `Watcher` that's already running and just polls.
+#
+#   python -m bench.watch
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from glue.watch import Watcher
+from bench.common import best_of, table
+from bench.render import document
+
+
+def main():
+  with tempfile.TemporaryDirectory() as tmp:
+    docs = os.path.join(tmp, 'docs')
+    os.mkdir(docs)
+    for i in range(200):
+      with open(os.path.join(docs, f'doc_{i}.glu'), 'w') as f:
+        f.write(document(5))
+    edited = os.path.join(docs, 'doc_0.glu')
+    out = os.path.join(tmp, 'out')
+    w = Watcher([docs], ['html'], out)
+    w.poll()
+
+    def edit():
+      with open(edited, 'a') as f:
+        f.write('\nOne more *line*.\n')
+
+    def cli():
+      edit()
+      subprocess.run([sys.executable, '-m', 'glue', '-o', out, edited], check=True)
+
+    def poll():
+      edit()
+      assert len(w.poll()) == 1
+
+    rows = [['python -m glue', f'{best_of(cli, repeat=3) * 1000:.0f}'],
+            ['Watcher.poll', f'{best_of(poll, repeat=3) * 1000:.0f}']]
+
+  table(['per edit', 'ms'], rows)
+
+
+if __name__ == '__main__':
+  main()
@@ -5,7 +5,7 @@
 __version__ = "0.0.1"
 
 from glue.codegen import tohtml
-from glue.parser import parse
+from glue.parser import parse, ParseSession
 from glue.elements import Nesting, Block, Inline, block, inline
 from glue.registry import Registry
 
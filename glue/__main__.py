@@ -1,15 +1,19 @@
 import sys
 import glue.codegen as codegen
+from glue.build import build, convert, component, EXTENSIONS
+from glue.watch import Watcher
+from glue.html import write_chunks
+from glue.parser import parse
 from glue.library import Standard
-from bs4 import BeautifulSoup
 from getopt import getopt
 import importlib
+import os
 import os.path as path
 import inflection
 
 def usage():
   return """
-  glue [hm:l:]
+  glue [han:m:l:so:j:c:w]
   
   Converts a text file into some form of rich output, either HTML, a
   frontend component library (mithril, react, etc) or a raw compiler template
@@ -19,42 +23,92 @@ def usage():
   -a  --assets include all assets from registry in the output of the file.
   -m  --module python file containing a definition of a registry. Default is the Standard registry if this isn't included.
   -n  --name   the name of the component being generated if using a js library style output.
-  -l  --language is the output language. can be one of html (default), elm, mithril, imba, or react. See the docs for instructions on how to add a different output language.
+  -l  --language is the output language. can be one of html (default), elm, mithril, imba, react, or ast (the {tag, attrs, body} structure as JSON). See the docs for instructions on how to add a different output language.
+      Several languages can be given separated by commas (eg, html,mithril,elm). The input is parsed once for all of them, and each is written to a file.
+  -o  --out    directory to write the output files to, named after the input files (or --name), with an extension for the language. Default is stdout for a single language, and the current directory for several.
+  -j  --jobs   converts the input files on this many processes (batch mode), writing each to --out. a file that fails is reported, and the rest carry on.
+  -c  --cache  directory of a cache of outputs, keyed by the input text, the registry, the language and the glue version. files whose outputs are in it aren't converted again. used with --out.
+  -w  --watch  watches the directories given (or the current one) for changes to .glu files, and to the --module, and rebuilds the outputs of the files that change into --out, until interrupted.
+  -s  --stream html or ast is written out as the input is read, instead of all at once at the end. The html is not prettified.
   """
 
 if __name__ == '__main__':
-  opts, args = getopt(sys.argv[1:], 'han:m:l:', ["help", 'assets', 'name=', 'module=','language='])
-  language = 'html'
+  opts, args = getopt(sys.argv[1:], 'han:m:l:so:j:c:w', ["help", 'assets', 'name=', 'module=','language=', 'stream', 'out=', 'jobs=', 'cache=', 'watch'])
+  languages = ['html']
+  out = None
+  jobs = None
+  cache = None
+  watch = False
   registry_module = None
   name = 'UnidentifiedComponent'
   assets = False
+  stream = False
   for (o,a) in opts:
     if o == '-h':
       print(usage())
       exit()
     if o == '-l' or o == '--language':
-      language = a
+      languages = a.split(',')
+    if o == '-o' or o == '--out':
+      out = a
+    if o == '-j' or o == '--jobs':
+      jobs = int(a)
+    if o == '-c' or o == '--cache':
+      cache = a
+    if o == '-w' or o == '--watch':
+      watch = True
     if o == '-m' or o == '--module':
       registry_module = a
     if o == '-n' or o == '--name':
       name = a
     if o == '-a' or o == '--assets':
       assets = True
+    if o == '-s' or o == '--stream':
+      stream = True
   
   registry = importlib.import_module(registry_module).__getattribute__('registry') if registry_module else Standard
   
-  def process(s: str, name: str) -> None:
+  language = languages[0]
+
+  def process(s: str, name: str, stem: str) -> None:
     if assets: 
       print(registry.assets)
       return 
-    if language == 'html':
-      print(BeautifulSoup(codegen.tohtml(registry, s), 'html.parser').prettify())
+    if len(languages) > 1 or out is not None:
+      os.makedirs(out or '.', exist_ok=True)
+      for l, code in convert(registry, s, languages, name).items():
+        with open(path.join(out or '.', stem + EXTENSIONS[l]), 'w') as f:
+          f.write(code + '\n')
+    elif language == 'html':
+      print(codegen.toprettyhtml(registry, s))
+    elif language == 'ast':
+      write_chunks(sys.stdout, codegen.render_ast_chunks(parse(registry, s, nodes=True)))
+      sys.stdout.write('\n')
     else:
-      print(codegen.__getattribute__(f'render_{language}_component')(
-        inflection.dasherize(inflection.underscore(name)) if language == 'imba' or language == "mithril" else name,
-        codegen.__getattribute__(f'to{language}')(registry, s)))
+      print(component(language, name, codegen.__getattribute__(f'to{language}')(registry, s)))
   
-  if len(args) == 0: process(sys.stdin.read(), name)
+  def processstream(lines) -> None:
+    write_chunks(sys.stdout, (codegen.streamast if language == 'ast' else codegen.streamhtml)(registry, lines))
+    sys.stdout.write('\n')
+
+  if watch:
+    Watcher(args or ['.'], languages, out or '.', registry_module, cache).run()
+  elif stream and len(languages) == 1 and out is None and language in ('html', 'ast') and not assets:
+    if len(args) == 0: processstream(sys.stdin)
+    else:
+      for f in args:
+        with open(f) as lines:
+          processstream(lines)
+  elif len(args) == 0: process(sys.stdin.read(), name, name)
+  elif not assets and (len(languages) > 1 or out is not None or jobs is not None or cache is not None):
+    failed = 0
+    for f, error in build(registry, args, languages, out or '.', jobs or 1, cache=cache):
+      if error is not None:
+        failed += 1
+        print(f'{f}: {error}', file=sys.stderr)
+    if failed:
+      print(f'{failed} of {len(args)} files failed', file=sys.stderr)
+      exit(1)
   else:
     for f in args:
-      process(open(f).read(), inflection.camelize(inflection.underscore(path.splitext(path.basename(f))[0])))
+      process(open(f).read(), inflection.camelize(inflection.underscore(path.splitext(path.basename(f))[0])), None)
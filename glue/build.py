@@ -0,0 +1,178 @@
+# Converting a batch of files (eg, all the documents of a site) to output files,
+# one per file and language, on a pool of processes.
+#
+# A build can keep a cache directory of the outputs it's made, keyed by a hash
+# of the input text, the registry's fingerprint, the output language and glue's
+# version, so that unchanged files aren't converted again on the next build.
+
+import filecmp
+import hashlib
+import multiprocessing
+import os
+import os.path as path
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import inflection
+
+import glue
+import glue.codegen as codegen
+
+# the extension of the files each language is written to.
+EXTENSIONS = {
+  'html': '.html',
+  'minifiedhtml': '.min.html',
+  'react': '.jsx',
+  'mithril': '.js',
+  'elm': '.elm',
+  'imba': '.imba',
+  'ast': '.json',
+}
+
+# the languages whose code isn't wrapped up as a component.
+PLAIN = ('html', 'minifiedhtml', 'ast')
+
+
+def component(language: str, name: str, code: str) -> str:
+  """Wraps `code` as a component called `name`, for the js library style languages."""
+  if language in PLAIN:
+    return code
+  return codegen.__getattribute__(f'render_{language}_component')(
+    inflection.dasherize(inflection.underscore(name)) if language == 'imba' or language == "mithril" else name,
+    code)
+
+def componentname(file: str) -> str:
+  """The name of the component made from `file`, eg. `my_doc.glu` is `MyDoc`."""
+  return inflection.camelize(inflection.underscore(path.splitext(path.basename(file))[0]))
+
+def convert(registry, s: str, languages, name: str) -> dict:
+  """
+  The code for `s` in each of `languages`, from one parse of it (see `codegen.tomany`),
+  wrapped as a component called `name` where the language needs one.
+  """
+  return {l: component(l, name, code) for l, code in codegen.tomany(registry, s, languages).items()}
+
+def outputs(file: str, languages, out: str, root: str) -> dict:
+  """
+  Where the output for `file` goes in each of `languages`: the same path
+  relative to `out` as `file` has to `root`, with the extension of the language.
+  """
+  stem = path.splitext(path.relpath(path.abspath(file), root))[0]
+  return {l: path.join(out, stem + EXTENSIONS[l]) for l in languages}
+
+def writefile(target: str, text: str):
+  """
+  Writes `text` to `target` atomically: it's written to a temporary file next
+  to it first, and moved into place, so readers never see half a file.
+  """
+  directory = path.dirname(target) or '.'
+  os.makedirs(directory, exist_ok=True)
+  fd, temp = tempfile.mkstemp(dir=directory, prefix='.' + path.basename(target), suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write(text)
+    os.replace(temp, target)
+  except BaseException:
+    os.unlink(temp)
+    raise
+
+
+def cachekey(text: str, fingerprint: str, language: str, name: str) -> str:
+  """
+  The key in a build cache of the `language` output, with component `name`, for
+  `text` converted with a registry that has `fingerprint`.
+  """
+  h = hashlib.blake2b(digest_size=20)
+  for part in (glue.__version__, fingerprint, language, '' if language in PLAIN else name):
+    h.update(part.encode() + b'\0')
+  h.update(text.encode('utf-8', 'surrogatepass'))
+  return h.hexdigest()
+
+def cachepath(cache: str, key: str) -> str:
+  return path.join(cache, key[:2], key)
+
+def convertfile(registry, file: str, languages, out: str, root: str, cache: str=None, fingerprint: str=None):
+  """
+  Converts `file` to each of `languages`, writing the code to its `outputs`.
+  With a `cache` directory (and the `fingerprint` of the registry), outputs that
+  are in it are copied from it instead, if the file that's there is different,
+  and only the rest are converted and added to it.
+  """
+  with open(file) as f:
+    text = f.read()
+  name = componentname(file)
+  targets = outputs(file, languages, out, root)
+  cached = {}
+  if cache is not None:
+    cached = {l: cachepath(cache, cachekey(text, fingerprint, l, name)) for l in languages}
+    cached = {l: entry for l, entry in cached.items() if path.exists(entry)}
+
+  missing = [l for l in languages if l not in cached]
+  code = convert(registry, text, missing, name) if missing else {}
+  for l in languages:
+    if l in cached:
+      if not (path.exists(targets[l]) and filecmp.cmp(cached[l], targets[l], shallow=False)):
+        with open(cached[l]) as f:
+          writefile(targets[l], f.read())
+    else:
+      writefile(targets[l], code[l] + '\n')
+      if cache is not None:
+        writefile(cachepath(cache, cachekey(text, fingerprint, l, name)), code[l] + '\n')
+
+
+# registry, languages, output directory, root of the inputs, cache directory
+# and registry fingerprint of a `build` worker process. like the parser's
+# workers, they're handed over when the process starts, so each worker has one
+# copy of the registry.
+_worker = None
+
+def initworker(registry, languages, out: str, root: str, cache: str=None, fingerprint: str=None):
+  global _worker
+  _worker = (registry, languages, out, root, cache, fingerprint)
+
+def buildfile(file: str):
+  """
+  Converts one file of a `build`, in a worker process.
+  :return: `(file, error)`, where error is a description of what went wrong, or None.
+  """
+  registry, *args = _worker
+  try:
+    convertfile(registry, file, *args)
+  except Exception as e:
+    return file, '{}: {}'.format(type(e).__name__, e)
+  return file, None
+
+
+def build(registry, files, languages=('html',), out: str='.', workers: int=None, chunksize: int=16,
+          cache: str=None):
+  """
+  Converts each of `files` to each of `languages`, on a pool of `workers`
+  processes (the number of cpus by default), writing the output under `out`
+  with the same layout the files have under the directory they all share.
+
+  A file that fails to convert doesn't stop the others. Like `parseparallel`,
+  the workers are forked, so on a platform without `fork`, or with one worker,
+  the files are converted in this process.
+  :param chunksize: how many files are handed to a worker at a time.
+  :param cache: directory of a build cache (see `convertfile`), if any.
+  :return: iterator of `(file, error)` for each file, in order, with the
+  error as a string, or None if the file was converted.
+  """
+  languages = list(languages)
+  for l in languages:
+    if l not in EXTENSIONS:
+      raise ValueError('{} is not an output language, it should be one of {}'.format(l, ', '.join(EXTENSIONS)))
+  files = list(files)
+  if not files:
+    return iter(())
+  root = path.commonpath([path.dirname(path.abspath(f)) for f in files])
+  args = (registry, languages, out, root, cache, registry.fingerprint if cache is not None else None)
+
+  if workers == 1 or len(files) == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+    initworker(*args)
+    return map(buildfile, files)
+  return buildpool(files, args, workers, chunksize)
+
+def buildpool(files, args, workers: int, chunksize: int):
+  with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                           initializer=initworker, initargs=args) as pool:
+    yield from pool.map(buildfile, files, chunksize=chunksize)
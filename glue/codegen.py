@@ -1,15 +1,35 @@
+import collections.abc as abc
 import textwrap
+import simplejson as json
+from simplejson.encoder import encode_basestring
 import toolz as t
 from inflection import camelize, underscore
 
-from glue.util import unwind, indented_tree
-from glue.html import render
-from glue.parser import parse
+from glue.util import Node, tonode, parsetag, ast_attrs, iscomponent
+from glue.html import render_fast, render_pretty, render_minified, render_content
+from glue.parser import parse, parsestream
+
+_end = object()
+
+# JSON is valid JS, and simplejson's encoder is in C. Values that JSON doesn't
+# have, like the dates that YAML props can have, are written as strings.
+# namedtuple and circular checks cost more than the encoding itself on big props.
+js_encoder = json.JSONEncoder(ensure_ascii=False, default=str,
+                              namedtuple_as_object=False, check_circular=False)
+
+def js_literal(value) -> str:
+  """The JS literal for a python value (dicts, lists, strings, numbers, bools, None)."""
+  s = js_encoder.encode(value)
+  # these two are fine in JSON, but not in JS strings in older engines.
+  if '\u2028' in s or '\u2029' in s:
+    s = s.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+  return s
 
 def attr_values_to_str(attrs: dict):
-  return str({k: ' '.join('{}:{};'.format(k2,v2) for k2,v2 in v.items())
-              if isinstance(v, dict)
-              else v for (k,v) in attrs.items()})
+  """JS object literal for the attributes of an html tag, with dict values (`style`) as css."""
+  return js_literal({k: ' '.join('{}:{};'.format(k2,v2) for k2,v2 in v.items())
+                     if isinstance(v, dict)
+                     else v for (k,v) in attrs.items()})
 
 def component_attrs_to_str(attrs: dict):
   # f"'{k}':'{v}'" is what should be in the join call. i'm not wrapping v in
@@ -19,7 +39,120 @@ def component_attrs_to_str(attrs: dict):
   # page run arbitrary js, which is a security issue.
   
   # TODO(vishesh): probably should write some tests to make sure that this hole is covered.
-  return ('{'+', '.join(f"'{k}':{v}" for (k,v) in attrs.items())+'}')
+  return ('{'+', '.join(f"{js_literal(str(k))}:{v if isinstance(v, str) else js_literal(v)}" for (k,v) in attrs.items())+'}')
+
+class Emitter:
+  """
+  Generates code for html in one pass over it, writing into one buffer, and
+  consuming the generators in the html (eg straight out of `parse`) as it goes.
+  `(elem, html)` tuples and `Node`s are read as the html in them.
+
+  A backend is a subclass that says what to write for each part of the html:
+  * `leaf(s, depth)` for a string, or None.
+  * `enter(tag, attrs, empty, depth)` when a tag starts. `attrs` is its
+    attribute dict or None, and `empty` is whether there's nothing after the tag.
+  * `fragment(depth)` when a list of tags with no tag of its own starts.
+
+  `enter` and `fragment` return `(first, rest, closing)`: what to write before
+  the first child, before each of the others, and after the last one. If they
+  return None, the children are skipped.
+  """
+  def __init__(self):
+    self.out = []
+    self.write = self.out.append
+
+  def leaf(self, s, depth: int):
+    raise NotImplementedError
+
+  def enter(self, tag: str, attrs, empty: bool, depth: int):
+    raise NotImplementedError
+
+  def fragment(self, depth: int):
+    raise NotImplementedError
+
+  def visit(self, html, depth: int):
+    """Writes the start of `html`, and returns its children and the frame for them, if any."""
+    while isinstance(html, tuple):
+      html = html[1]
+    if isinstance(html, Node):
+      frame = self.enter(html.tag, html.attrs, html.attrs is None and not html.children, depth)
+      return frame and (iter(html.children), *frame)
+    if isinstance(html, str) or html is None:
+      return self.leaf(html, depth)
+    if not isinstance(html, abc.Iterable):
+      raise ValueError('{} is not convertible into html'.format(html))
+
+    it = iter(html)
+    head = next(it, _end)
+    if head is _end:
+      return self.leaf(None, depth)
+    if not isinstance(head, str):
+      frame = self.fragment(depth)
+      return frame and (t.cons(head, it), *frame)
+    first = next(it, _end)
+    if isinstance(first, dict):
+      frame = self.enter(head, first, False, depth)
+    else:
+      frame = self.enter(head, None, first is _end, depth)
+      if first is not _end:
+        it = t.cons(first, it)
+    return frame and (it, *frame)
+
+  def emit(self, html) -> str:
+    """The code for `html`."""
+    return ''.join(self.iteremit(html))
+
+  def iteremit(self, html, size: int = 1024):
+    """
+    `emit` a bit at a time: yields the code as it's generated, roughly every
+    `size` writes, so the code for a large document is never all in memory.
+    """
+    out, write = self.out, self.write
+    # each frame is `[children, before the next child, before the rest, closing]`
+    stack = [[iter((html,)), '', '', '']]
+    while stack:
+      frame = stack[-1]
+      for x in frame[0]:
+        write(frame[1])
+        frame[1] = frame[2]
+        children = self.visit(x, len(stack) - 1)
+        if children:
+          stack.append(list(children))
+          break
+      else:
+        stack.pop()
+        write(frame[3])
+      if len(out) >= size:
+        yield ''.join(out)
+        out.clear()
+    yield ''.join(out)
+    out.clear()
+
+
+class MithrilEmitter(Emitter):
+  """Emits a mithril template, `m(tag, attrs, children...)`."""
+  def leaf(self, s, depth):
+    if s is not None:
+      self.write(repr(s))
+
+  def enter(self, tag, attrs, empty, depth):
+    name = repr(tag)
+    # dangerous components get their props as they are, everything else gets
+    # css strings for dicts.
+    attr = ((component_attrs_to_str if name[1] == 'ℂ' and name[2].isupper()
+             else attr_values_to_str)(attrs)
+            if attrs is not None
+            else {})
+    if name[1].isupper():
+      self.write('m({}, {})'.format(tag.lstrip('ℂ'), attr))
+      return None
+    self.write('m(' + name if attrs is None else 'm({}, {}'.format(name, attr))
+    return ', ', ', ', ')'
+
+  def fragment(self, depth):
+    self.write('[')
+    return '', ',', ']'
+
 
 def render_mithril(html) -> str:
   """
@@ -31,31 +164,7 @@ def render_mithril(html) -> str:
   ### Return
   a string that is a valid mithril template of the same HTML.
   """
-  if html is None: return ''
-  elif isinstance(html, list):
-    if isinstance(html[0], list):
-      # nested list, need to unpack:
-      return '[{}]'.format(','.join(render_mithril(x) for x in html))
-    else:
-      tag = repr(html[0])
-      attr = ((component_attrs_to_str if tag[1] == 'ℂ' and tag[2].isupper() else attr_values_to_str)(html[1]).replace('True', 'true').replace('False', 'false')
-              if len(html) > 1 and isinstance(html[1], dict)
-              else {})
-      if tag[1].isupper():
-        return 'm({}, {})'.format(html[0].lstrip('ℂ'), attr)
-      elif len(html) == 1:
-        return 'm(' + tag + ')'
-      elif len(html) == 2 and isinstance(html[1], dict):
-        return 'm({}, {})'.format(tag, attr)
-      elif len(html) >= 3 and isinstance(html[1], dict):
-        return 'm({}, {}, {})'.format(tag, attr,
-                                      ', '.join(map(render_mithril, html[2:])))
-    # no attr dictionary
-    return 'm({}, {})'.format(tag, ', '.join(map(render_mithril, html[1:])))
-  elif isinstance(html, str):
-    return repr(html)
-  else:
-    raise ValueError('{} is not convertible into html'.format(html))
+  return MithrilEmitter().emit(html)
 
 def render_mithril_component(name: str, expr: str):
   """
@@ -91,8 +200,29 @@ def double_quoted_repr(s: str):
   return '"' + repr(s)[1:-1].replace('"', '\\"').replace("\\'", "'") + '"'
 
 def render_elm_attrs(attrs: dict):
-  return ', '.join(['attribute {} {}'.format(double_quoted_repr(k),double_quoted_repr(v))
-                    for (k,v) in attr_values_to_str(attrs.items())])
+  return ', '.join(['attribute {} {}'.format(double_quoted_repr(k), double_quoted_repr(
+                      ' '.join('{}:{};'.format(k2,v2) for k2,v2 in v.items()) if isinstance(v, dict) else str(v)))
+                    for (k,v) in attrs.items()])
+
+class ElmEmitter(Emitter):
+  """Emits an Elm view, `Html.node tag [attrs] [children]`."""
+  def leaf(self, s, depth):
+    if s is not None:
+      self.write('text ' + double_quoted_repr(s))
+
+  def enter(self, tag, attrs, empty, depth):
+    name = double_quoted_repr(tag)
+    if name[1].isupper():
+      # components are not well supported this way in Elm. They are more complicated than just adding a call to a
+      # known wrapper function, thanks to Elm's architecture requiring very structured nesting for the various actions, updates etc.
+      # return 'm.component({}, {})'.format(html[0], attr)
+      return None
+    self.write('Html.node {} [{}] ['.format(name, render_elm_attrs(attrs or {})))
+    return '', ', ', ']'
+
+  def fragment(self, depth):
+    return '', ',', ''
+
 
 def render_elm(html: list):
   """
@@ -102,33 +232,7 @@ def render_elm(html: list):
   :param html: cottonmouth form html ['div', {attrs}, body]
   :return: string that should be written to a .elm file eg `python3 -m glue -l elm about.glu > about.elm`
   """
-  if html is None: return ''
-  elif isinstance(html, list):
-    if isinstance(html[0], list):
-      # nested list, need to unpack:
-      return '{}'.format(','.join(render_elm(x) for x in html))
-    else:
-      tag = double_quoted_repr(html[0])
-      attr = render_elm_attrs(html[1]
-              if len(html) > 1 and isinstance(html[1], dict)
-              else {})
-      if tag[1].isupper():
-        # components are not well supported this way in Elm. They are more complicated than just adding a call to a
-        # known wrapper function, thanks to Elm's architecture requiring very structured nesting for the various actions, updates etc.
-        # return 'm.component({}, {})'.format(html[0], attr)
-        return ''
-      elif len(html) == 1:
-        return 'Html.node {tag} [] []'.format(tag=tag)
-      elif len(html) == 2 and isinstance(html[1], dict):
-        return 'Html.node {} [{}] []'.format(tag, attr)
-      elif len(html) >= 3 and isinstance(html[1], dict):
-        return 'Html.node {} [{}] [{}]'.format(tag, attr, ', '.join(map(render_elm, html[2:])))
-    # no attr dictionary
-    return 'Html.node {} [] [{}]'.format(tag, ', '.join(map(render_elm, html[1:])))
-  elif isinstance(html, str):
-    return 'text ' + double_quoted_repr(html)
-  else:
-    raise ValueError('{} is not convertible into html'.format(html))
+  return ElmEmitter().emit(html)
 
 
 def render_elm_component(name: str, expr: str):
@@ -139,44 +243,45 @@ def render_elm_component(name: str, expr: str):
 
 def render_imba_attrs(attrs: dict, dangerous=False): 
   style = ''
-  if 'style' in attrs and len(attrs['style']) > 0:
-    style = (f'[{" ".join(f"{k}:{v}" for (k,v) in attrs["style"].items())}]' 
-             if isinstance(attrs["style"], dict) 
-             else f'style={attrs["style"]}') + ' '
+  # only dict styles have special syntax, others are like any other attribute.
+  styled = isinstance(attrs.get('style'), dict)
+  if styled and len(attrs['style']) > 0:
+    style = f'[{" ".join(f"{k}:{v}" for (k,v) in attrs["style"].items())}] '
   
-  return style + ' '.join(f'{"className" if k == "class" else k}={"true" if type(v) == bool and v == True else "false" if type(v) == bool and v == False else repr(v) if not dangerous else v}' 
+  return style + ' '.join(f'{"className" if k == "class" else k}={v if dangerous and isinstance(v, str) else js_literal(v)}' 
                           for (k,v) in attrs.items() 
-                          if k != 'style')
+                          if not (styled and k == 'style'))
 
-def generate_imba(html: list):
-  """
-  At no time can you have a list of list of nodes, either.
-  :param html: cottonmouth form html ['div', {attrs}, body]
-  :return: string that should be written to a .elm file eg `python3 -m glue -l elm about.glu > about.elm`
-  """
-  if html is None or html == []: return ''
-  elif isinstance(html, list):
-    if isinstance(html[0], list):
-      # nested list, need to unpack:
-      return ['<>' , *(generate_imba(x) for x in html)]
+class ImbaEmitter(Emitter):
+  """Emits an Imba template, a tag per line, with its children indented below it."""
+  def leaf(self, s, depth):
+    if s is not None:
+      self.write(repr(s))
+
+  def enter(self, tag, attrs, empty, depth):
+    name = tag.lstrip('ℂ')
+    if empty:
+      self.write(f'<{name}/>')
+      return None
+    if attrs is None:
+      self.write(f'<{name}>')
     else:
-      dangerous = html[0][0] == 'ℂ'
-      tag = html[0].lstrip('ℂ')
-      attrs = render_imba_attrs(html[1]
-              if len(html) > 1 and isinstance(html[1], dict)
-              else {}, dangerous = dangerous)
-      if len(html) == 1:
-        return f'<{tag}/>'
-      elif isinstance(html[1], dict):
-        return [f'<{tag} {attrs}>', *(generate_imba(x) for x in html[2:])]
-      else:
-        return [f'<{tag}>', *(generate_imba(x) for x in html[1:])]
-  elif isinstance(html, str):
-    return repr(html)
-  else:
-    raise ValueError('{} is not convertible into html'.format(html))
+      self.write(f'<{name} {render_imba_attrs(attrs, dangerous=tag[0] == "ℂ")}>')
+    indent = '\n' + '\t' * (depth + 1)
+    return indent, indent, ''
+
+  def fragment(self, depth):
+    self.write('<>')
+    indent = '\n' + '\t' * (depth + 1)
+    return indent, indent, ''
 
-render_imba = t.compose(lambda x: x if isinstance(x, str) else indented_tree(x, ch="\t"), generate_imba)
+
+def render_imba(html) -> str:
+  """
+  Generates an Imba template for cottonmouth form html: a tag per line, with
+  its children indented below it with tabs.
+  """
+  return ImbaEmitter().emit(html)
 
 def render_imba_component(name: str, expr: str):
   return '''
@@ -184,8 +289,120 @@ export tag {name}
 \t<self>
 \t\t{expr}'''.format(name=name, expr=expr.replace('\n', '\n\t\t'))
 
-tohtml = t.compose(render, parse)
-tomithril = t.compose(render_mithril, unwind, parse)
-toreact = t.compose(render, parse)
-toelm = t.compose(render_elm, unwind, parse)
-toimba = t.compose(render_imba, unwind, parse)
+class AstEmitter(Emitter):
+  """
+  Emits the JSON for `template_to_ast(html)`, so that clients can render a
+  document without parsing html. Each element is written as it's reached, so
+  the dicts for the whole document are never built.
+  """
+  def __init__(self):
+    super().__init__()
+    # whether something has been written at each depth yet, for the commas.
+    # skipped (None) children mean the separators can't come from the frames.
+    self.started = [False, False]
+    self.heads = {}
+
+  def item(self, depth: int):
+    started = self.started
+    if started[depth]:
+      self.write(', ')
+    started[depth] = True
+    if len(started) == depth + 1:
+      started.append(False)
+    else:
+      started[depth + 1] = False
+
+  def leaf(self, s, depth):
+    if s is not None:
+      self.item(depth)
+      s = encode_basestring(s)
+      if '\u2028' in s or '\u2029' in s:
+        s = s.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+      self.write(s)
+
+  def enter(self, tag, attrs, empty, depth):
+    self.item(depth)
+    if not attrs:
+      # most tags have no attrs, and only a few names, so their start is kept.
+      head = self.heads.get(tag)
+      if head is None:
+        head = self.heads[tag] = self.head(tag, {})
+      self.write(head)
+    else:
+      self.write(self.head(tag, attrs))
+    return '', '', ']}'
+
+  @staticmethod
+  def head(tag, attrs):
+    tag, idsclasses = parsetag(tag)
+    attrs = js_literal(ast_attrs(idsclasses, attrs))
+    if iscomponent(tag):
+      return f'{{"name": {js_literal(tag)}, "props": {attrs}, "children": ['
+    return f'{{"tag": {js_literal(tag)}, "attrs": {attrs}, "body": ['
+
+  def fragment(self, depth):
+    self.item(depth)
+    self.write('[')
+    return '', '', ']'
+
+
+def render_ast(html) -> str:
+  """
+  The "AST" of cottonmouth form html as JSON, the same as `template_to_ast`
+  and then `json.dumps`, but without building the dicts.
+  """
+  return AstEmitter().emit(html)
+
+def render_ast_chunks(html):
+  """`render_ast` as a generator of JSON strings, written as `html` is consumed."""
+  return AstEmitter().iteremit(html)
+
+
+# the renderers all take nodes, which are quicker to build and walk than lists.
+parsenodes = t.partial(parse, nodes=True)
+
+tohtml = t.compose(render_fast, parsenodes)
+toprettyhtml = t.compose(render_pretty, parsenodes)
+tominifiedhtml = t.compose(render_minified, parsenodes)
+tomithril = t.compose(render_mithril, parsenodes)
+toreact = t.compose(render_fast, parsenodes)
+toelm = t.compose(render_elm, parsenodes)
+toimba = t.compose(render_imba, parsenodes)
+toast = t.compose(render_ast, parsenodes)
+
+# what each output language is generated with, from parsed html.
+RENDERERS = {
+  'html': render_pretty,
+  'minifiedhtml': render_minified,
+  'react': render_fast,
+  'mithril': render_mithril,
+  'elm': render_elm,
+  'imba': render_imba,
+  'ast': render_ast,
+}
+
+def tomany(registry, s: str, languages) -> dict:
+  """
+  The code for `s` in each of `languages` (names from `RENDERERS`), from a
+  single parse of it: the html is kept as nodes, which every backend reads.
+  :return: dict of language to code.
+  """
+  for l in languages:
+    if l not in RENDERERS:
+      raise ValueError('{} is not an output language, it should be one of {}'.format(l, ', '.join(RENDERERS)))
+  html = parsenodes(registry, s)
+  return {l: RENDERERS[l](html) for l in languages}
+
+def streamhtml(registry, lines):
+  """
+  `tohtml` for a document that's read a bit at a time (see `parsestream`).
+  :return: generator of html strings, produced as the input is read.
+  """
+  return render_content(parsestream(registry, lines, nodes=True))
+
+def streamast(registry, lines):
+  """
+  `toast` for a document that's read a bit at a time (see `parsestream`).
+  :return: generator of JSON strings, produced as the input is read.
+  """
+  return render_ast_chunks(parsestream(registry, lines, nodes=True))
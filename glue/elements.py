@@ -48,16 +48,25 @@ POST: text in the block should be parsed AFTER this block is
       parsed. This is the default, and is suitable for most situations.
 
 SUB: the inside of the text is parsed for child nodes (inline and
-     block) first, and the corresponding sections are replaced with [|*|] style
+     block) first, and the corresponding sections are replaced with placeholder
      tags that are meant to be left UNTOUCHED. After this block is parsed,
      then the tags are replaced with the appropriate parsed sections. This could
      have also been called 'PRE', since it pre-parses the contents before
      calling the block's parsing function.
+     A placeholder is the child's number between two `INLINE_PLACEHOLDER`
+     characters, or two `BLOCK_PLACEHOLDER` characters for blocks and inline
+     elements with `Display.BLOCK`. They're private use code points, and any
+     that are in the text already are swapped out for placeholders too, so
+     they can't clash with anything in the text.
 
 NONE: terminal element. The parser's output is taken verbatim, with out any
       further processing of its insides.
 """
 
+# marks the placeholders a Nesting.SUB parser gets in place of its children.
+INLINE_PLACEHOLDER = '\ue000'
+BLOCK_PLACEHOLDER = '\ue001'
+
 Display = Enum('Display', 'BLOCK INLINE')
 Display.__doc__ = """
 You can set an inline element to be displayed like a block element. This is
@@ -267,17 +276,24 @@ class Inline(Element):
   Note that the regex for a Display.BLOCK type case is limited to exist on ONLY
   one line. This is a necessary restriction to not conflict with the multiline
   regex being used to split blocks. Please use Display.BLOCK sparingly.
+
+  `delimiters` is an optional `(start, end)` pair of literal strings, for
+  elements whose regex is just "start, some text, end" (see `inline_one`).
+  It lets the token based inline parser treat the start and the end as
+  separate tokens, rather than matching the whole element in one go.
   """
   def __init__(self, regex,
                      parser: Callable,
                      nest: Nesting = Nesting.FRAME,
                      sub: ['Inline'] = None,
                      escape: str = '',
-                     display: Display = Display.INLINE):
+                     display: Display = Display.INLINE,
+                     delimiters: (str, str) = None):
     super(Inline, self).__init__(parser, nest, sub or ['all'])
     self.regex = re.compile(regex) if isinstance(regex, str) else regex
     self.escape = escape
     self.display = display
+    self.delimiters = delimiters
     self.subinline = [x for x in (sub or ['all'])
                       if x == 'all' or x == 'inherit' or isinstance(x, Inline)]
 
@@ -368,7 +384,7 @@ def standalone_integration(outer_elem='div', inner_elem='div'):
   return standalone_integration_wrapper
 
 
-def inline(regex, nest=Nesting.FRAME, sub=None, escape='', display=Display.INLINE):
+def inline(regex, nest=Nesting.FRAME, sub=None, escape='', display=Display.INLINE, delimiters=None):
   """
   Decorator for an inline element that has exactly one pattern and parser.
   For more complex inline elements, it's best to just define the element
@@ -382,17 +398,19 @@ def inline(regex, nest=Nesting.FRAME, sub=None, escape='', display=Display.INLIN
   `['div', {'attr': 'value'}, 'text']`.
   """
   def inline_fn(parser:Callable) -> Inline:
-    return Inline(regex, parser, nest, sub, escape, display)
+    return Inline(regex, parser, nest, sub, escape, display, delimiters)
 
   return inline_fn
 
 def inline_one(start: str, end: str, nest=Nesting.FRAME, sub=None, display=Display.INLINE):
   """
+  Decorator for an inline element with one capture group, framed by the
+  literal strings `start` and `end`. Eg, `inline_one('*', '*')` for bold.
   """
   patt = re.compile(Patterns.single_group.value.format(
     re.escape(start), re.escape(end)))
   return inline(patt, escape=[start[0], end[0]],
-                nest=nest, display=display, sub=sub)
+                nest=nest, display=display, sub=sub, delimiters=(start, end))
   
 def SingleGroupInline(name: str, start: str, end: str, tag: str,
                       attr: Mapping[str, str]=None):
@@ -3,7 +3,11 @@
 # a dictionary value for an attribute is converted to: "key:value;key2:value2;"
 
 import collections.abc as abc
+import io
 import itertools
+import regex as re
+
+from glue.util import Node
 
 HTML_VOID_TAGS = [
   'area',
@@ -137,55 +141,76 @@ def render_content(content, **context):
     - A callable that will be called with the current **context
     - A sequence beginning with a literal HTML tag name
     - Any other value, coerced to unicode
+
+  Nested content is rendered with a stack of iterators rather than by
+  recursion, so there's no limit on how deep it can be.
   """
-  if content is None:
-    yield ''
-  elif isinstance(content, str):
-    yield content
-  elif isinstance(content, abc.Callable):
-    for e in render_content(content(**context), **context):
-      yield e
-  elif isinstance(content, abc.Iterable):
-    for e in render_iterable(content, **context):
-      yield e
-  else:
-    yield str(content)
+  stack = [iter((content,))]
+  while stack:
+    for content in stack[-1]:
+      if content is None:
+        yield ''
+      elif isinstance(content, str):
+        yield content
+      elif isinstance(content, abc.Callable):
+        stack.append(iter((content(**context),)))
+        break
+      elif isinstance(content, abc.Iterable):
+        tail = iter(content)
+        head = next(tail)
+        # Render nested lists: the head first, then the rest of the list
+        while not isinstance(head, str) and isinstance(head, abc.Iterable):
+          stack.append(tail)
+          tail = iter(head)
+          head = next(tail)
+        # Render tag around the content
+        if isinstance(head, str):
+          opening, remainder, closing = tag_parts(head, tail)
+          yield opening
+          stack.append(itertools.chain(remainder, closing))
+        break
+      else:
+        yield str(content)
+    else:
+      stack.pop()
 
 
 def render_iterable(content, **context):
   """
   Renders a list, tuple, or generator of content as HTML.
   """
-  tail = iter(content)
-  head = next(tail)
-
-  # Render tag around the content
-  if isinstance(head, str):
-    for e in render_tag(head, tail, **context):
-      yield e
-  # Render nested lists
-  elif isinstance(head, abc.Iterable):
-    for e in render_iterable(head, **context):
-      yield e
-    for content in tail:
-      for e in render_content(content, **context):
-        yield e
+  yield from render_content(iter(content), **context)
 
 
 def render_tag(tag, content, **context):
   """
   Renders an HTML tag with its content.
   """
+  opening, remainder, closing = tag_parts(tag, content)
+  yield opening
+  for content in remainder:
+    yield from render_content(content, **context)
+  yield from closing
+
+
+def tag_parts(tag, content):
+  """
+  Splits up an HTML tag with its content for rendering.
+  :return: `(opening tag, content to render inside it, closing tags)`, where
+  the closing tags are empty for void tags.
+  """
+  content = iter(content)
   try:
     # Parse extra attributes and remainder
-    content, remainder = itertools.tee(content)
-    extra = dict(**next(remainder))
+    first = next(content)
+    extra = dict(**first)
+    remainder = content
   except StopIteration:
     # If there is no remainder, we just render the tag
     extra, remainder = {}, []
   except TypeError:
-    # If the
-    extra, remainder = {}, content
+    # If the first item isn't an attribute dict, it's content
+    extra, remainder = {}, itertools.chain((first,), content)
 
   # Default to div if no explicit tag is provided
   if tag.startswith('#'):
@@ -216,13 +241,460 @@ def render_tag(tag, content, **context):
                                          else i[1])
                        for i in list(extra.items()))
 
-  # Start our tag sandwich
-  yield '<{}{}>'.format(tag, attributes)
+  # CLOSE THE TAG IF WE HAVE TO I GUESS
+  return ('<{}{}>'.format(tag, attributes), remainder,
+          () if tag in HTML_VOID_TAGS else ('</{}>'.format(tag),))
 
-  # Render the delicious filling or toppings
-  for content in remainder:
-    yield from render_content(content, **context)
 
-  # CLOSE THE TAG IF WE HAVE TO I GUESS
-  if tag not in HTML_VOID_TAGS:
-    yield '</{}>'.format(tag)
+# ---------------------------- CHUNKED WRITER --------------------------------
+# Rendering a page a chunk at a time, so the start of it can be sent while the
+# rest is still being rendered.
+
+# default size of a chunk, in characters.
+CHUNK_SIZE = 1 << 13
+
+
+def chunked(strings, size=CHUNK_SIZE, encoding=None):
+  """
+  Groups the pieces of html in `strings` into chunks of at least `size`
+  characters, except for the last one.
+  :param encoding: if given, the chunks are encoded to bytes with it, once per chunk.
+  :return: generator of chunks.
+  """
+  buffer, n = [], 0
+  for s in strings:
+    buffer.append(s)
+    n += len(s)
+    if n >= size:
+      chunk = ''.join(buffer)
+      buffer, n = [], 0
+      yield chunk.encode(encoding) if encoding else chunk
+  if buffer:
+    chunk = ''.join(buffer)
+    yield chunk.encode(encoding) if encoding else chunk
+
+
+def render_chunks(*content, size=CHUNK_SIZE, encoding=None, **context):
+  """
+  Renders a sequence of content as HTML, in chunks of about `size` characters
+  (see `chunked`). With an `encoding`, this is a WSGI style iterable of bytes.
+  """
+  return chunked((e for c in content for e in render_content(c, **context)), size, encoding)
+
+
+def isbinary(file) -> bool:
+  """Whether `file` takes bytes rather than strings."""
+  if isinstance(file, io.TextIOBase): return False
+  if isinstance(file, (io.RawIOBase, io.BufferedIOBase)): return True
+  return 'b' in getattr(file, 'mode', '')
+
+
+def write_chunks(file, strings, size=CHUNK_SIZE, encoding='utf-8'):
+  """
+  Writes the pieces of html in `strings` to the text or binary file-like
+  object `file`, a chunk at a time, flushing it after each chunk.
+  :param encoding: used for binary files.
+  """
+  flush = getattr(file, 'flush', None)
+  for chunk in chunked(strings, size, encoding if isbinary(file) else None):
+    file.write(chunk)
+    if flush: flush()
+
+
+def render_file(file, *content, size=CHUNK_SIZE, encoding='utf-8', **context):
+  """
+  Renders a sequence of content as HTML into the text or binary file-like
+  object `file`, a chunk of about `size` characters at a time.
+  """
+  write_chunks(file, (e for c in content for e in render_content(c, **context)), size, encoding)
+
+
+# ---------------------------- FAST RENDERER ---------------------------------
+# `render_fast` renders exactly what `render` does, but writes into one list
+# instead of yielding through generators, and caches the opening and closing
+# strings of tags, since the same tags and attribute dicts (eg the `style` of
+# every image) come up over and over in a page.
+
+# caches are cleared when they get bigger than this.
+CACHE_SIZE = 4096
+_tags = {}
+_openings = {}
+_minified = {}
+_styles = {}
+_end = object()
+
+
+def tag_name(tag: str):
+  """`(name, id, classes, closing tag)` for a tag like `div#id.class1.class2`."""
+  try:
+    return _tags[tag]
+  except KeyError:
+    pass
+  full = 'div{}'.format(tag) if tag.startswith('#') else tag
+  name, *classes = full.split('.')
+  id = None
+  if '#' in name:
+    name, id = name.split('#')
+  if len(_tags) > CACHE_SIZE:
+    _tags.clear()
+  _tags[tag] = parsed = (name, id, classes, '' if name in HTML_VOID_TAGS else '</{}>'.format(name))
+  return parsed
+
+
+def style_string(d: dict) -> str:
+  """`key:value;` for a dict valued attribute, like `style`."""
+  try:
+    key = (*d.items(), *map(type, d.values()))
+    return _styles[key]
+  except TypeError:
+    return ''.join('{}:{};'.format(*x) for x in d.items())
+  except KeyError:
+    pass
+  if len(_styles) > CACHE_SIZE:
+    _styles.clear()
+  _styles[key] = s = ''.join('{}:{};'.format(*x) for x in d.items())
+  return s
+
+
+def attribute_key(v):
+  """
+  A hashable stand in for the attribute value `v`, for the cache of opening
+  tags. Types are part of it, since True == 1 but they're rendered differently,
+  and dicts (eg, `style`) keep their order, which is the order they're rendered in.
+  """
+  if isinstance(v, dict):
+    return (dict, *((k, attribute_key(x)) for k, x in v.items()))
+  if isinstance(v, list):
+    return (list, *map(attribute_key, v))
+  return (type(v), v)
+
+def opening_tag(tag: str, attrs=None, minify=False) -> str:
+  """
+  The opening tag of `tag` with the attribute dict `attrs`, the way
+  `render_tag` formats it, or as short as possible if `minify` (see
+  `minified_attribute`).
+  Raises TypeError if `attrs` isn't a mapping of attributes, so it's content.
+  """
+  cache = _minified if minify else _openings
+  try:
+    key = (tag,) if attrs is None else (tag, *((k, attribute_key(v)) for k, v in attrs.items()))
+    return cache[key]
+  except (TypeError, AttributeError):
+    key = None
+  except KeyError:
+    pass
+
+  name, id, classes, _ = tag_name(tag)
+  extra = {} if attrs is None else dict(**attrs)
+  if id is not None:
+    extra['id'] = id
+  if classes or 'class' in extra:
+    given = extra.get('class', [])
+    given = [given] if isinstance(given, str) else list(given)
+    if given or classes:
+      extra['class'] = ' '.join(given + classes)
+  if minify:
+    opening = '<{}{}>'.format(name, ''.join(minified_attribute(k, v) for k, v in extra.items()))
+  else:
+    opening = '<{}{}>'.format(name, ''.join(
+      ' {}="{}"'.format(k, style_string(v) if isinstance(v, dict) else v)
+      for k, v in extra.items()))
+
+  if key is not None:
+    if len(cache) > CACHE_SIZE:
+      cache.clear()
+    cache[key] = opening
+  return opening
+
+
+unquoted_value = re.compile(r'[^\s"\'=<>`]+')
+
+def minified_attribute(k, v) -> str:
+  """
+  ` k=v`, as short as it can be: empty `id`s and `class`es and False valued
+  attributes are left out, True valued ones are just their name, and values
+  are only quoted if they need to be. Dicts, like `style`, lose the last `;`.
+  """
+  if v is False or (v == '' and k in ('id', 'class')):
+    return ''
+  if v is True:
+    return ' {}'.format(k)
+  v = style_string(v)[:-1] if isinstance(v, dict) else str(v)
+  if unquoted_value.fullmatch(v):
+    return ' {}={}'.format(k, v)
+  return " {}='{}'".format(k, v) if '"' in v and "'" not in v else ' {}="{}"'.format(k, v)
+
+
+def open_tag(tag: str, content):
+  """
+  `(opening tag, rest of the content)` for a tag whose content, an iterator,
+  may start with an attribute dict.
+  """
+  first = next(content, _end)
+  if first is _end:
+    return opening_tag(tag), content
+  if not (isinstance(first, (str, list)) or first is None):
+    try:
+      return opening_tag(tag, first), content
+    except TypeError:
+      pass
+  return opening_tag(tag), itertools.chain((first,), content)
+
+
+def render_into(write, content, **context):
+  """
+  Renders `content` like `render_content`, passing each piece of html to
+  `write`, eg `list.append` or the `write` of a `io.StringIO`.
+  """
+  stack = [(iter((content,)), '')]
+  while stack:
+    items, closing = stack[-1]
+    for content in items:
+      if isinstance(content, str):
+        write(content)
+      elif content is None:
+        pass
+      elif type(content) is Node:
+        write(opening_tag(content.tag, content.attrs))
+        stack.append((iter(content.children), tag_name(content.tag)[3]))
+        break
+      elif type(content) is not list and isinstance(content, abc.Callable):
+        stack.append((iter((content(**context),)), ''))
+        break
+      elif isinstance(content, abc.Iterable):
+        tail = iter(content)
+        head = next(tail, _end)
+        # nested lists: the head first, then the rest of the list
+        while not isinstance(head, str) and isinstance(head, abc.Iterable):
+          stack.append((tail, ''))
+          tail = iter(head)
+          head = next(tail, _end)
+        if head is _end:
+          raise ValueError('render_into: cannot render an empty list')
+        if isinstance(head, str):
+          opening, tail = open_tag(head, tail)
+          write(opening)
+          stack.append((tail, tag_name(head)[3]))
+        break
+      else:
+        write(str(content))
+    else:
+      stack.pop()
+      if closing:
+        write(closing)
+
+
+def render_fast(*content, **context):
+  """
+  Renders a sequence of content as HTML, same as `render`, but faster.
+  """
+  l = []
+  for c in content:
+    render_into(l.append, c, **context)
+  return ''.join(l)
+
+
+# ---------------------------- PRETTY PRINTER --------------------------------
+# `render_pretty` puts block tags on their own lines, indented by depth, in the
+# same pass that renders them. Inline tags stay where they are in the text, and
+# they and preformatted tags are rendered exactly as `render_fast` does, so no
+# whitespace is added that would change how the page looks.
+
+# every phrasing element, and the obsolete ones that were phrasing too, see
+# https://html.spec.whatwg.org/multipage/dom.html#phrasing-content
+HTML_INLINE_TAGS = {
+  'a', 'abbr', 'area', 'audio', 'b', 'bdi', 'bdo', 'br', 'button', 'canvas', 'cite',
+  'code', 'data', 'datalist', 'del', 'dfn', 'em', 'embed', 'i', 'iframe', 'img',
+  'input', 'ins', 'kbd', 'label', 'map', 'mark', 'math', 'meter', 'noscript',
+  'object', 'output', 'picture', 'progress', 'q', 'ruby', 'rp', 'rt', 's', 'samp',
+  'select', 'slot', 'small', 'span', 'strong', 'sub', 'sup', 'svg', 'template',
+  'textarea', 'time', 'u', 'var', 'video', 'wbr',
+  'acronym', 'big', 'blink', 'font', 'nobr', 'strike', 'tt',
+}
+
+HTML_PREFORMATTED_TAGS = {'pre', 'code', 'textarea', 'script', 'style'}
+
+
+def render_pretty(*content, indent='  ', **context):
+  """
+  Renders a sequence of content as indented HTML.
+  """
+  l = []
+  write = l.append
+  # the state of each tag that's open: [depth of its children, whether it has
+  # block children, whether the last thing in it was a block, closing tag].
+  # lists without a tag share the state of the tag they're in.
+  root = [0, False, False, '']
+  stack = [(iter(content), root, False)]
+
+  def newline(state):
+    if state[2] or l:
+      write('\n' + indent * state[0])
+
+  while stack:
+    items, state, owner = stack[-1]
+    for content in items:
+      if isinstance(content, str):
+        if state[2]:
+          content = content.lstrip()
+          if not content: continue
+          newline(state)
+          state[2] = False
+        write(content)
+      elif content is None:
+        pass
+      elif type(content) is not list and isinstance(content, abc.Callable):
+        stack.append((iter((content(**context),)), state, False))
+        break
+      elif isinstance(content, abc.Iterable):
+        tail = iter(content)
+        head = next(tail, _end)
+        while not isinstance(head, str) and isinstance(head, abc.Iterable):
+          stack.append((tail, state, False))
+          tail = iter(head)
+          head = next(tail, _end)
+        if head is _end:
+          raise ValueError('render_pretty: cannot render an empty list')
+        if not isinstance(head, str):
+          break
+        name = tag_name(head)[0]
+        if name in HTML_INLINE_TAGS:
+          if state[2]:
+            newline(state)
+            state[2] = False
+          render_into(write, itertools.chain((head,), tail), **context)
+        elif name in HTML_PREFORMATTED_TAGS:
+          newline(state)
+          render_into(write, itertools.chain((head,), tail), **context)
+          state[1] = state[2] = True
+        else:
+          newline(state)
+          opening, tail = open_tag(head, tail)
+          write(opening)
+          stack.append((tail, [state[0] + 1, False, False, tag_name(head)[3]], True))
+        break
+      else:
+        if state[2]:
+          newline(state)
+          state[2] = False
+        write(str(content))
+    else:
+      stack.pop()
+      if owner:
+        if state[1]:
+          write('\n' + indent * (state[0] - 1))
+        write(state[3])
+        parent = stack[-1][1]
+        parent[1] = parent[2] = True
+  return ''.join(l)
+
+
+# ---------------------------- MINIFIER --------------------------------------
+# `render_minified` renders html as short as it can be, in one pass: attributes
+# are shortened (see `minified_attribute`) and closing tags that html lets you
+# leave out are left out. Text is left as it is.
+
+# a p's closing tag can be left out when it's followed by one of these.
+P_FOLLOWERS = {
+  'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl', 'fieldset',
+  'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+  'header', 'hgroup', 'hr', 'main', 'menu', 'nav', 'ol', 'p', 'pre', 'section',
+  'table', 'ul',
+}
+
+# closing tags that can be left out, and what can directly follow them when
+# they are, `None` being the end of their parent. see
+# https://html.spec.whatwg.org/multipage/syntax.html#optional-tags
+OPTIONAL_CLOSING_TAGS = {
+  'li': {'li', None},
+  'dt': {'dt', 'dd'},
+  'dd': {'dt', 'dd', None},
+  'p': P_FOLLOWERS | {None},
+  'rt': {'rt', 'rp', None},
+  'rp': {'rt', 'rp', None},
+  'optgroup': {'optgroup', None},
+  'option': {'option', 'optgroup', None},
+  'thead': {'tbody', 'tfoot'},
+  'tbody': {'tbody', 'tfoot', None},
+  'tfoot': {None},
+  'tr': {'tr', None},
+  'td': {'td', 'th', None},
+  'th': {'td', 'th', None},
+}
+
+# a p has to be closed at the end of these.
+P_CLOSED_IN = {'a', 'audio', 'del', 'ins', 'map', 'noscript', 'video'}
+
+
+def render_minified(*content, **context):
+  """
+  Renders a sequence of content as HTML, as short as possible.
+  """
+  l = []
+  write = l.append
+  # the last tag that was closed, `(name, closing tag)`, if its closing tag can
+  # still be left out, depending on what comes next.
+  pending = None
+
+  def settle(follower):
+    nonlocal pending
+    if pending is not None:
+      if follower not in OPTIONAL_CLOSING_TAGS[pending[0]]:
+        write(pending[1])
+      pending = None
+
+  # each frame is `(content, tag name, closing tag)`, with no name for lists
+  # without a tag of their own.
+  stack = [(iter(content), None, '')]
+  while stack:
+    items, name, closing = stack[-1]
+    for content in items:
+      if isinstance(content, str):
+        if content:
+          settle(_end)
+          write(content)
+      elif content is None:
+        pass
+      elif type(content) is not list and isinstance(content, abc.Callable):
+        stack.append((iter((content(**context),)), None, ''))
+        break
+      elif isinstance(content, abc.Iterable):
+        tail = iter(content)
+        head = next(tail, _end)
+        while not isinstance(head, str) and isinstance(head, abc.Iterable):
+          stack.append((tail, None, ''))
+          tail = iter(head)
+          head = next(tail, _end)
+        if head is _end:
+          raise ValueError('render_minified: cannot render an empty list')
+        if isinstance(head, str):
+          first = next(tail, _end)
+          if first is _end or isinstance(first, (str, list)) or first is None:
+            opening = opening_tag(head, minify=True)
+          else:
+            try:
+              opening = opening_tag(head, first, minify=True)
+              first = _end
+            except TypeError:
+              opening = opening_tag(head, minify=True)
+          if first is not _end:
+            tail = itertools.chain((first,), tail)
+          tagname, _, _, tagclosing = tag_name(head)
+          settle(tagname)
+          write(opening)
+          stack.append((tail, tagname, tagclosing))
+        break
+      else:
+        settle(_end)
+        write(str(content))
+    else:
+      stack.pop()
+      if name is not None:
+        settle(_end if pending and pending[0] == 'p' and name in P_CLOSED_IN else None)
+        if name in OPTIONAL_CLOSING_TAGS:
+          pending = (name, closing)
+        else:
+          write(closing)
+  # the html could be followed by anything, so the last tag is always closed.
+  settle(_end)
+  return ''.join(l)
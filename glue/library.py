@@ -617,6 +617,10 @@ def NoopBlock(text):
   """
   return ['div', text]
 
+# placeholders for blocks, which are kept out of the paragraphs.
+paragraph_blocks = re.compile(f'(?m)(?:\\n|^)({BLOCK_PLACEHOLDER}\\d+{BLOCK_PLACEHOLDER})')
+paragraph_block = re.compile(f'^{BLOCK_PLACEHOLDER}\\d+{BLOCK_PLACEHOLDER}$')
+
 @block(nest=Nesting.SUB)
 def Paragraphs(text):
   """
@@ -628,10 +632,10 @@ def Paragraphs(text):
 
   Subscribes to the entire registry.
   """
-  return t.pipe(re.split(r'(?m)(?:\n|^)(\[\|\|\d+\|\|\])', text),
+  return t.pipe(paragraph_blocks.split(text),
                 tc.mapcat(lambda x: x.split('\n\n')),
                 tc.filter(lambda x: not not x),
-                tc.map(lambda x: x if re.match(r'^\[\|\|\d+\|\|\]$',x) else ['p', x.rstrip()]),
+                tc.map(lambda x: x if paragraph_block.match(x) else ['p', x.rstrip()]),
                 tc.cons('div'),
                 list)
 
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
 from typing import Mapping
-import operator as op
 from getopt import getopt
-from typing import Union
+import bisect
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, List, Callable, Iterable
 
-from glue.elements import Element, Inline, Block, Nesting, Display
+from glue.elements import Element, Inline, Block, Nesting, Display, Patterns, \
+  INLINE_PLACEHOLDER, BLOCK_PLACEHOLDER
 from glue.html import render
 from glue.registry import Registry
 from glue.util import *
@@ -13,8 +17,339 @@ from glue.util import *
 # This module contains all the functions that parse an input text string and
 # return HTML corresponding to the page that is generated.
 
+def unescaper(subinline: List[Inline]) -> Callable[[str], str]:
+  """
+  Function that will unescape text for a set of inline elements, so eg `\\*` -> `*`
+  if `*` is one of the characters the elements want to be escapable.
+  """
+  # combine all escaped characters from all subscribed inline objects.
+  escapes = ''.join(t.reduce(set.union,
+    (x.escape for x in subinline), set())).replace('[', '\\[').replace(']', '\\]')
+  return (t.partial(re.compile('\\\\(['+re.escape(escapes)+'])').sub, r'\1')
+          if len(escapes) > 0
+          else t.identity)
+
+
+class InlineMatcher:
+  """
+  Everything `parseinline` needs to scan text for a set of inline elements,
+  compiled once: the combined pattern, a table from the `lastindex` of a match
+  to the element (and groups) that produced it, and the function that unescapes
+  untouched text.
+
+  When it can tell which character every element starts with (see
+  `firstchars`), the matcher also buckets the elements by that character.
+  `search` then jumps straight to the next character that starts some element,
+  and only tries the elements of that bucket there, so plain text is skipped
+  without running any of the element patterns, and large registries don't slow
+  down every position in the text.
+  """
+  def __init__(self, subinline: List[Inline], bucketed: bool=True):
+    # a map of regexes to parsing function
+    self.inlines = [(self.pattern(x), (x.parser, x)) for x in subinline]
+    self.unescape = unescaper(subinline)
+    self.trigger = None
+    self.buckets = None
+
+    if len(self.inlines) == 0:
+      self.patt = None
+      self.dispatch = []
+      return
+
+    # combine all inline patterns into one regex.
+    # each pattern is wrapped in a capture group of its own. that group is the
+    # outermost one of its alternative, so it's always the last group to close,
+    # and `m.lastindex` of any match points straight at the element that made it.
+    self.patt = re.compile('|'.join(t.map(lambda x: '('+(
+      x[0])+')', self.inlines)), re.V1 | re.S | re.M)
+
+    # lastindex -> (parser, element, indices of the element's own groups).
+    self.dispatch = [None] * (self.patt.groups + 1)
+    i = 1
+    for regex, (parser, elem) in self.inlines:
+      n = num_groups(regex)
+      self.dispatch[i] = (parser, elem, tuple(range(i+1, i+1+n)))
+      i += n + 1
+
+    if not bucketed: return
+    starts = [firstchars(regex) for regex, _ in self.inlines]
+    # a pattern that could start with anything (or with a backslash, which
+    # would get mixed up with escapes) has to be searched for everywhere.
+    if any(x is None or '\\' in x for x in starts): return
+    chars = sorted(set().union(*starts))
+    self.trigger = re.compile('[' + ''.join(map(re.escape, chars)) + ']')
+    # each bucket keeps the elements in registry order, so the same element
+    # wins as with the combined pattern when several could match.
+    self.buckets = {c: type(self)([x for x, s in zip(subinline, starts) if c in s], bucketed=False)
+                    for c in chars}
+
+  def pattern(self, elem: Inline) -> str:
+    """The pattern that's matched for `elem`."""
+    return elem.regex.pattern
+
+  def encode(self, text: str) -> str:
+    """Turns text into what the patterns are matched against."""
+    return text
+
+  def raw(self, groups: tuple) -> tuple:
+    """Turns groups of a match back into the original text, for the element's parser."""
+    return groups
+
+  def groups(self, m, ids: tuple) -> tuple:
+    """The groups of match `m` that belong to the element, as a tuple."""
+    if len(ids) > 1: return m.group(*ids)
+    if len(ids) == 1: return (m.group(ids[0]),)
+    return ()
+
+  def search(self, text: str, pos: int):
+    """
+    Finds the first match of any element in `text` at or after `pos`, just like
+    `self.patt.search` would. Returns the match (or None) and the matcher whose
+    `dispatch` table goes with it.
+    """
+    if self.buckets is None:
+      return self.patt.search(text, pos), self
+
+    while True:
+      c = self.trigger.search(text, pos)
+      if c is None: return None, self
+      p = c.start()
+      bucket = self.buckets[text[p]]
+      # an escape prefix on a pattern starts matching at the backslashes before
+      # the character, so that an even number of them can be skipped over.
+      q = p
+      while q > pos and text[q-1] == '\\':
+        q -= 1
+      m = bucket.patt.match(text, q) if q < p else None
+      if m is None:
+        m = bucket.patt.match(text, p)
+      if m is not None:
+        return m, bucket
+      pos = p + 1
+
+
+# `SentinelMatcher` swaps escaped characters for the code point this far
+# into the supplementary private use area.
+SENTINEL = 0xF0000
+escaped_char = re.compile(r'\\([\x00-\uffff])', re.S)
+sentinel_char = re.compile('[\U000F0000-\U000FFFFF]')
+
+def guarded(regex: str):
+  """
+  The characters that the escape prefixes in `regex` keep from matching when
+  they're escaped, or None if one of them isn't followed by something simple.
+  """
+  chars = set()
+  for m in re.finditer(re.escape(ESCAPE_PREFIX), regex):
+    # the prefix can also sit at the end of a group, before what closes it.
+    rest = re.sub(r'^(?:\\K|\)[*+?]?)*', '', regex[m.end():])
+    c = firstchars(rest)
+    if c is None: return None
+    chars |= c
+  return chars
+
+
+class SentinelMatcher(InlineMatcher):
+  """
+  `InlineMatcher` for `parseinline_sentinel`. Text is encoded before it's
+  matched: in one pass, every escaped character that a pattern's escape prefix
+  guards against (or that an element escapes) is replaced by a sentinel code
+  point, and so is every escaped backslash, so that the backslashes left over
+  pair up the same way. With no escaped delimiters left in the text, the escape
+  prefix of `Patterns` is redundant, and it is stripped from every pattern, so
+  no backslash parity checks are run while matching.
+
+  Parsers still get the raw text of their groups, and sentinels in untouched
+  text become the escaped character if some element escapes it (as `unescape`
+  does), or go back to the original sequence otherwise.
+  """
+  def __init__(self, subinline: List[Inline], bucketed: bool=True):
+    super().__init__(subinline, bucketed)
+    escapes = t.reduce(set.union, (x.escape for x in subinline), set())
+    chars = [guarded(x.regex.pattern) for x in subinline]
+    # a pattern that has to match a backslash itself can't see it in encoded
+    # text, and neither can one whose escape prefixes aren't understood.
+    self.exact = (None not in chars and
+                  not any('\\\\' in regex for regex, _ in self.inlines))
+    encoded = set('\\').union(escapes, *(c for c in chars if c is not None))
+
+    def encode(m):
+      c = m.group(1)
+      return chr(SENTINEL + ord(c)) if c in encoded else m.group()
+    self.escaped = t.partial(escaped_char.sub, encode)
+
+    def restore(m):
+      c = chr(ord(m.group()) - SENTINEL)
+      return c if c in escapes else '\\' + c
+    self.unescape = t.partial(sentinel_char.sub, restore)
+
+  def pattern(self, elem: Inline) -> str:
+    return elem.regex.pattern.replace(ESCAPE_PREFIX, '')
+
+  def encode(self, text: str) -> str:
+    if '\\' not in text: return text
+    return self.escaped(text)
+
+  def raw(self, groups: tuple) -> tuple:
+    return tuple(sentinel_char.sub(lambda m: '\\' + chr(ord(m.group()) - SENTINEL), g)
+                 if isinstance(g, str) else g
+                 for g in groups)
+
+
+class TokenMatcher:
+  """
+  The compiled form of a set of inline elements for `parseinline_tokens`.
+
+  FRAME elements that declare `delimiters` are split into two tokens, their
+  start and their end, which the parser pairs up itself. Every other element
+  is one opaque token matched by its whole regex, like in `parseinline`.
+  All of them are combined into one pattern that is run over the text once.
+  """
+  def __init__(self, subinline: List[Inline]):
+    self.unescape = unescaper(subinline)
+
+    alternatives = []
+    # lastindex -> (parser, element, group indices) for opaque tokens
+    self.dispatch = [None]
+    # lastindex -> (delimiter, first element that the delimiter starts) for
+    # delimiter tokens
+    self.delims = [None]
+    seen = set()
+    for x in subinline:
+      if x.nest == Nesting.FRAME and x.delimiters is not None:
+        for d in x.delimiters:
+          if d in seen: continue
+          seen.add(d)
+          opener = next((y for y in subinline
+                         if y.nest == Nesting.FRAME and y.delimiters is not None
+                         and y.delimiters[0] == d), None)
+          alternatives.append(Patterns.escape.value.format(r'\K' + re.escape(d)))
+          self.dispatch.append(None)
+          self.delims.append((d, opener))
+      else:
+        n = num_groups(x.regex)
+        alternatives.append(x.regex.pattern)
+        i = len(self.dispatch)
+        self.dispatch.append((x.parser, x, tuple(range(i+1, i+1+n))))
+        self.delims.append(None)
+        self.dispatch.extend([None] * n)
+        self.delims.extend([None] * n)
+
+    self.patt = (re.compile('|'.join('(' + a + ')' for a in alternatives), re.V1 | re.S | re.M)
+                 if len(alternatives) > 0
+                 else None)
+    # end delimiter -> pattern that finds it where it isn't escaped
+    self.ends = {x.delimiters[1]: re.compile(Patterns.escape.value.format(r'\K' + re.escape(x.delimiters[1])),
+                                             re.V1 | re.S | re.M)
+                 for x in subinline if x.nest == Nesting.FRAME and x.delimiters is not None}
+    # element -> what its parser makes of `FRAME_BODY`, or None if the body
+    # isn't one of its leaves (see `template`).
+    self.templates = {}
+
+  def template(self, elem: Inline):
+    """
+    The html that `elem` wraps the body of a frame in, with `FRAME_BODY` in
+    place of the body, worked out the first time it's needed. None if the
+    parser changes its body, so that it can't be spliced in.
+    """
+    if elem not in self.templates:
+      html = unwind(elem.parser(FRAME_BODY))
+      self.templates[elem] = html if hasleaf(html, FRAME_BODY) else None
+    return self.templates[elem]
+
+  groups = InlineMatcher.groups
+
+
+class MatcherCache:
+  """
+  Cache of compiled `InlineMatcher`s (or `TokenMatcher`s), one per
+  (registry, block, parent).
+
+  Entries are stored in `registry.cache`, which the registry empties whenever
+  it is mutated (`|=`, `-=`, `+=`, or setting/deleting a key), so a stale
+  matcher is never returned. `hits` and `misses` count lookups over all
+  registries, so you can check that the cache is doing its job.
+  """
+  def __init__(self):
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, registry: Registry, block: Element, parent: Element=None,
+          kind: type=InlineMatcher) -> InlineMatcher:
+    key = (kind, id(block), id(parent))
+    entry = registry.cache.get(key)
+    # the entry holds on to block and parent, so their ids can't be reused
+    # while it exists, but check identity anyway to be safe.
+    if entry is not None and entry[0] is block and entry[1] is parent:
+      self.hits += 1
+      return entry[2]
+
+    self.misses += 1
+    matcher = kind(list(registry.subscriptions(block, parent)[0]))
+    registry.cache[key] = (block, parent, matcher)
+    return matcher
+
+  def reset_stats(self):
+    self.hits = 0
+    self.misses = 0
+
+matchers = MatcherCache()
+
+
+def aslists(html, meta=False):
+  """
+  The html the parser builds, with the `Node`s in it turned back into lists
+  (see `tolist`), which is what `parse` and the inline parsers return unless
+  they're asked for nodes. Everything else keeps its shape, and generators
+  stay just as lazy.
+  :param meta: give the nodes that an element made as `(elem, html)` tuples.
+  """
+  if isinstance(html, Node):
+    return tolist(html, meta)
+  if isinstance(html, tuple):
+    return (tolist(html, meta) if isinstance(html[1], Node)
+            else (html[0], aslists(html[1], meta)))
+  if isinstance(html, list):
+    return [aslists(x, meta) for x in html]
+  if isinstance(html, str) or not istag(html):
+    return html
+  return (aslists(x, meta) for x in html)
+
+
+def parsematch(registry: Registry, block: Element, parent: Element,
+               elem: Inline, parser: Callable, groups: tuple, reparse: Callable):
+  """
+  Builds the annotated output, `(elem, html)`, of one match of an inline element
+  from the groups that its regex captured. The leaf strings of the element's
+  html are parsed again with `reparse` (`parseinline` or `parseinline_tokens`)
+  according to the element's nesting policy, and the html is built as `Node`s
+  straight away, so the parser never holds a second copy of it.
+  """
+  # doing the parsing based on nesting type
+  if elem.nest == Nesting.FRAME:
+    # frames are simple, by default they have inherit behavior
+    # and deal with one group
+    return (elem, tonode(splicehtmlmap(lambda t: reparse(
+      registry, block, t, parent, nodes=True), parser(groups[0])), elem))
+  elif elem.nest == Nesting.NONE:
+    return (elem, tonode(parser(groups), elem))
+  elif elem.nest == Nesting.POST:
+    # post requires a tree-traversal to reparse all the body elements.
+    # the only difference is that we have to take into account the inheritance
+    # rules.
+    return (elem, tonode(
+      splicehtmlmap(
+        lambda t: reparse(
+          registry,
+          block if elem.subinline == ['inherit'] else elem,
+          t,
+          parent if elem.subinline == ['inherit'] else block,
+          nodes=True),
+        parser(groups)), elem))
+
+
 def parseinline(registry:Registry,
-                element:Union[Element,str], text:str, parent=None):
+                element:Union[Element,str], text:str, parent=None, nodes=False):
   """
   Parses a block of text for its subscribed inline styles.
   Always returns a list of html elements.
@@ -22,42 +357,58 @@ def parseinline(registry:Registry,
   that's being generated in parseblock
   so:
   ['div', *parseinline(registry, element, text)] is what you would do.
+  :param nodes: give the html of each match as the `Node` the parser builds,
+  in its `(elem, node)` tuple, rather than as annotated lists.
   """
-  if text == '': return ['']
+  html = scaninline(registry, element, text, parent, InlineMatcher, parseinline)
+  return html if nodes else aslists(html, meta=True)
 
+
+def parseinline_sentinel(registry:Registry,
+                         element:Union[Element,str], text:str, parent=None, nodes=False):
+  """
+  `parseinline`, with escaped characters swapped for sentinels before the text
+  is matched, and patterns without the escape prefix (see `SentinelMatcher`).
+  The output is the same, except for a couple of corner cases: an odd run of
+  backslashes in plain text, `\\\\\\*`, is left as it is here, where `parseinline`
+  unescapes the second backslash and the star as if they were a pair; and
+  patterns that look at escaped characters some other way than through the
+  escape prefix (eg, the bracket matching in links) see them as sentinels.
+
+  Elements whose patterns have to match a backslash themselves are parsed
+  with `parseinline` instead, and so is text that has sentinel code points in
+  it already, since they couldn't be told apart from the ones put there.
+  """
   block = registry[element] if isinstance(element, str) else element
-  subinline = list(registry.inline_subscriptions(block.subinline, parent))
+  if (not matchers.get(registry, block, parent, kind=SentinelMatcher).exact
+      or sentinel_char.search(text)):
+    return parseinline(registry, block, text, parent, nodes)
+  html = scaninline(registry, block, text, parent, SentinelMatcher, parseinline_sentinel)
+  return html if nodes else aslists(html, meta=True)
 
-  # a map of regexes to parsing function
-  inlines = [(x.regex, (x.parser, x)) for x in subinline]
 
-  # combine all escaped characters from all subscribed inline objects.
-  escapes = ''.join(t.reduce(set.union,
-    (x.escape for x in subinline), set())).replace('[', '\\[').replace(']', '\\]')
-  # function that will unescape body code so eg `\\\*` -> `\*`
-  unescape = ((lambda t: re.compile('\\\\(['+re.escape(escapes)+'])').sub(r'\1', t))
-              if len(escapes) > 0
-              else t.identity)
+def scaninline(registry:Registry, element:Union[Element,str], text:str, parent,
+               kind:type, reparse:Callable):
+  """
+  The scanning loop behind `parseinline`: `kind` is the type of matcher to use,
+  and `reparse` is what the insides of matched elements are parsed with.
+  """
+  if text == '': return ['']
+
+  block = registry[element] if isinstance(element, str) else element
+  matcher = matchers.get(registry, block, parent, kind=kind)
+  unescape = matcher.unescape
 
   # if there are no inline styles declared in the registry, then we need
   # to handle that as a special case before all the regex stuff.
-  if len(inlines) == 0:
+  if matcher.patt is None:
     return [text]
-  
-  # combine all inline patterns into one regex.
-  # might not be efficient for very complex parsers....
-  patt = re.compile('|'.join(t.map(lambda x: '(?:'+(
-    x[0] if isinstance(x[0], str) else x[0].pattern)+')', inlines)), re.V1 | re.S | re.M)
-
-  # how many groups are in each regex, in order, so we can assign the final
-  # match to the right parser function.
-  grouplengths = list(
-    t.cons(0, t.accumulate(op.add, t.map(lambda x: num_groups(x[0]), inlines))))
 
+  text = matcher.encode(text)
   ind = 0
   l = []
   while ind < len(text):
-    m = patt.search(text, ind)
+    m, found = matcher.search(text, ind)
     if m is None:
       l.append(unescape(text[ind:]))
       break
@@ -67,43 +418,153 @@ def parseinline(registry:Registry,
       l.append(unescape(text[ind:m.span()[0]]))
     
     # figure out which parser the match is corresponding to.
-    # first not-None group index.
-    groupind = indexby(lambda x: x is not None, m.groups())
-    # the index of the regex in `inlines` that the groupind corresponds to
-    matchind = indexby(lambda x: x >= groupind, grouplengths)
-    parser, elem = inlines[matchind][1]
-    # stripping all the groups corresponding to the matched sub-regex
-    groups = m.groups()[grouplengths[matchind]:
-                        grouplengths[min(m.re.groups, matchind+1)]]
-
-    # doing the parsing based on nesting type
-    if elem.nest == Nesting.FRAME:
-      # frames are simple, by default they have inherit behavior
-      # and deal with one group
-      l.append((elem, list(splicehtmlmap(lambda t: parseinline(
-        registry, block, t, parent), parser(groups[0]) )) ) )
-    elif elem.nest == Nesting.NONE:
-      l.append((elem, parser(groups)))
-    elif elem.nest == Nesting.POST:
-      # post requires a tree-traversal to reparse all the body elements.
-      # the only difference is that we have to take into account the inheritance
-      # rules.
-      l.append((elem, list(
-        splicehtmlmap(
-          lambda t: parseinline(
-            registry,
-            block if elem.subinline == ['inherit'] else elem,
-            t,
-            parent if elem.subinline == ['inherit'] else block),
-          parser(groups)))))
+    parser, elem, ids = found.dispatch[m.lastindex]
+    groups = matcher.raw(found.groups(m, ids))
+
+    node = parsematch(registry, block, parent, elem, parser, groups, reparse)
+    if node is not None:
+      l.append(node)
 
     ind = m.span()[1]
 
   return l
 
 
-def parseblock(registry:Registry, block:Block, text:str, args=None, parent=None):
-  """parses text at the block level. ASSUMES VALIDATED REGISTRY."""
+# stands in for the body of a delimited frame when its parser is called by
+# `parseinline_tokens`, since the body has been parsed already by then.
+FRAME_BODY = '\ue0ffframe-body\ue0ff'
+
+def parseinline_tokens(registry:Registry,
+                       element:Union[Element,str], text:str, parent=None, nodes=False):
+  """
+  Alternative to `parseinline` that makes a single pass over the text.
+
+  `parseinline` matches a whole FRAME element, eg `*bold*`, and then parses its
+  body again, so text nested n levels deep is scanned n times. Here the start
+  and end of delimited elements (see `Inline.delimiters`) are separate tokens,
+  and the nesting is worked out with a stack as the tokens go by:
+  - a token that starts a frame opens it, if the frame's end delimiter comes
+    before the end of the frame it's in. The frame ends at the first of them,
+    just like its regex would.
+  - tokens are only looked for in the body of the innermost open frame, so
+    none of them can swallow its end delimiter. When there are no more, the
+    frame is closed, and the search goes on after its end delimiter.
+  - everything else, like a start without an end, is plain text.
+
+  Other elements are matched whole, and parsed as in `parseinline`. This gives
+  the same output as `parseinline`, except:
+  - for overlapping syntax that the regexes resolve by backtracking - eg, in
+    `__text_` an unclosed `__` is plain text here, while `parseinline` falls
+    back to matching `_` there.
+  - at the start of a frame's body, which `parseinline` parses as a string of
+    its own, so `^` matches there, and eg a `Display.BLOCK` header can start
+    the body. Here it's the middle of the text, and `^` doesn't match.
+  """
+  if text == '': return ['']
+
+  block = registry[element] if isinstance(element, str) else element
+  matcher = matchers.get(registry, block, parent, TokenMatcher)
+  if matcher.patt is None:
+    return [text]
+
+  def resolve(children):
+    # plain text is kept as slices of `text` until here, so that neighbouring
+    # bits of text can be glued back together before unescaping them.
+    l = []
+    for c in children:
+      if isinstance(c, slice) and len(l) > 0 and isinstance(l[-1], slice) and l[-1].stop == c.start:
+        l[-1] = slice(l[-1].start, c.stop)
+      else:
+        l.append(c)
+    return [matcher.unescape(text[c]) if isinstance(c, slice) else c for c in l]
+
+  def close(frame, end):
+    elem, opening, _, children, _ = frame
+    html = matcher.template(elem)
+    if html is None:
+      # the parser changed its body, so it has to be parsed the old way.
+      return parsematch(registry, block, parent, elem, elem.parser,
+                        (text[opening.stop:end],), parseinline_tokens)
+    body = resolve(children) or ['']
+    return (elem, tonode(splicehtmlmap(
+      lambda t: body if t == FRAME_BODY else parseinline_tokens(registry, block, t, parent, nodes=True),
+      html), elem))
+
+  # where each end delimiter is in the text, and isn't escaped, found in one
+  # pass the first time a frame needs it, rather than searched for again from
+  # every start.
+  ends = {}
+  def endof(d, start, stop):
+    found = ends.get(d)
+    if found is None:
+      found = ends[d] = [m.start() for m in matcher.ends[d].finditer(text, overlapped=True)]
+    i = bisect.bisect_left(found, start)
+    return found[i] if i < len(found) and found[i] + len(d) <= stop else None
+
+  # each frame is [element, slice of the opening token, end delimiter, children,
+  # where the end delimiter is]
+  stack = [[None, None, None, [], len(text)]]
+  ind = 0
+  while True:
+    # tokens are only looked for up to the end of the innermost frame, which
+    # sees its body on its own, like the regex of the frame's element does.
+    frame = stack[-1]
+    m = matcher.patt.search(text, ind, frame[4])
+    if m is None:
+      if len(stack) == 1:
+        break
+      if frame[4] > ind:
+        frame[3].append(slice(ind, frame[4]))
+      stack.pop()
+      stack[-1][3].append(close(frame, frame[4]))
+      ind = frame[4] + len(frame[2])
+      continue
+
+    if m.start() > ind:
+      frame[3].append(slice(ind, m.start()))
+    ind = m.end()
+
+    delim = matcher.delims[m.lastindex]
+    if delim is None:
+      parser, elem, ids = matcher.dispatch[m.lastindex]
+      node = parsematch(registry, block, parent, elem, parser,
+                        matcher.groups(m, ids), parseinline_tokens)
+      if node is not None:
+        frame[3].append(node)
+      continue
+
+    d, opener = delim
+    end = endof(opener.delimiters[1], m.end(), frame[4]) if opener is not None else None
+    if end is not None:
+      stack.append([opener, slice(m.start(), m.end()), opener.delimiters[1], [], end])
+    else:
+      frame[3].append(slice(m.start(), m.end()))
+
+  if ind < len(text):
+    stack[-1][3].append(slice(ind, len(text)))
+
+  html = resolve(stack[0][3])
+  return html if nodes else aslists(html, meta=True)
+
+
+def parseblock(registry:Registry, block:Block, text:str, args=None, parent=None,
+               inline:Callable=parseinline):
+  """
+  parses text at the block level. ASSUMES VALIDATED REGISTRY.
+  `inline` is the function used to parse inline elements, `parseinline` or
+  `parseinline_tokens`.
+  """
+  return parsespan(registry, block, text, 0, len(text), args=args, inline=inline)
+
+
+def parsespan(registry:Registry, block:Block, source:str, start:int, end:int,
+              children:list=None, args=None, inline:Callable=parseinline):
+  """
+  `parseblock` for the body `source[start:end]` of a block, where `children` is
+  the `blocktree` of that body if it's known already. The whole document is
+  scanned for blocks once, and nested blocks reuse that tree instead of being
+  split again; the body is only sliced out for blocks whose parser needs it.
+  """
   # handle default args
   if args is None:
     kwopts = {}
@@ -114,67 +575,116 @@ def parseblock(registry:Registry, block:Block, text:str, args=None, parent=None)
 
 
   def postparseinline(block, text, meta=False):
-    html = parseinline(registry, block, text)
+    html = inline(registry, block, text, nodes=True)
     if meta is False: return map(unpack, html)
     return html
 
-  def postparse(block, text, meta=False):
-    subblocks = list(splitblocks(text))
-    if len(subblocks) == 1 and isinstance(subblocks[0], str):
+  def postparse(block, source, start, end, children=None, meta=False):
+    subblocks = blocktree(source, start, end) if children is None else children
+    if len(subblocks) == 1 and not isinstance(subblocks[0], BlockSpan):
       # there are no subblocks, so return one level up!
-      return postparseinline(block, subblocks[0], meta)
-      
-    l = []
-    for b in subblocks:
-      if isinstance(b, list):
-        blockname, *classnames = b[0].split('.')
-        if blockname not in registry:  # means block name is not in registry
-          raise ValueError('Parser Error: Block `{}` is not in registry'.format(b[0]))
-        sub = parseblock(registry, registry[blockname], b[2], args=b[1])
-        if len(classnames) > 0:
-          # have to incur this cost otherwise will not be able to append 
-          # the classnames. There is a pure generator version of this 
-          # that I could write, but not interested in debugging that right now. 
-          sub = unwind(sub)
-          sub[0] += f'.{".".join(classnames)}'
-        if meta:
-          l.append((registry[blockname], sub))
-        else:
-          l.append(sub)
-      elif isinstance(b, str):
-        l += postparseinline(block, b, meta)
+      yield from postparseinline(block, source[subblocks[0][0]:subblocks[0][1]], meta)
+      return
 
-    return l
+    # children are parsed as they're asked for, so that the parse of each one
+    # can be let go of as soon as it's been used.
+    for b in subblocks:
+      if isinstance(b, BlockSpan):
+        sub = parsechild(registry, source, b, inline)
+        yield sub if meta else sub[1]
+      else:
+        yield from postparseinline(block, source[b[0]:b[1]], meta)
   
   if block.nest == Nesting.NONE:
     # separate pathway, we just parse the block
-    return block.parser(text, *opts, **kwopts)
+    return block.parser(source[start:end], *opts, **kwopts)
   
   elif block.nest == Nesting.POST:
     # parse block first, then call parseblock on the children.
-    return splicehtmlmap(t.partial(postparse, block), block.parser(text, *opts, **kwopts))
+    return splicehtmlmap(lambda leaf: postparse(block, leaf, 0, len(leaf)),
+                         block.parser(source[start:end], *opts, **kwopts))
   
   elif block.nest == Nesting.SUB:
-    blocks = postparse(block, text, meta=True)
-    # make sub directory, and string only array:
-    subtext = []
-    subs = {}
-    i = 1
-    for e in blocks:
-      if isinstance(e, str):
-        subtext.append(e)
-      elif isinstance(e, (list, tuple)):
-        substr = ('[|{}|]' if isinstance(e[0], Inline) and e[0].display is Display.INLINE else '[||{}||]').format(i)
-        subs[substr] = unpack(e[1])
-        subtext.append(substr)
-        i += 1
-    return splicehtmlmap(
-      lambda text: [subs[x] if x.startswith('[|') and x.endswith('|]') else x
-                 for x in re.split(r'(\[\|\|?\d+\|?\|\])', text) if x != ''],
-      block.parser(''.join(subtext), *opts, **kwopts))
-
-
-def parse(registry: Registry, text: str, topblock:Block=None):
+    return splicesubs(block, postparse(block, source, start, end, children, meta=True),
+                      opts, kwopts)
+
+
+def parsechild(registry:Registry, source:str, b:BlockSpan, inline:Callable=parseinline):
+  """
+  Parses a block found inside another block's body.
+  :return: `(block, html)`, the block from the registry and its parsed html,
+  as `Node`s.
+  """
+  blockname, *classnames = b.name.split('.')
+  if blockname not in registry:  # means block name is not in registry
+    raise ValueError('Parser Error: Block `{}` is not in registry'.format(b.name))
+  elem = registry[blockname]
+  sub = tonode(parsespan(registry, elem, source, b.start, b.end, b.children,
+                         args=b.args, inline=inline), elem)
+  if len(classnames) > 0:
+    # the node was only just made, so it's still ours to change.
+    sub.tag += f'.{".".join(classnames)}'
+  return elem, sub
+
+
+# placeholder marks that were in the text already.
+placeholder_marks = re.compile(f'[{INLINE_PLACEHOLDER}{BLOCK_PLACEHOLDER}]')
+
+def splicesubs(block:Block, blocks:list, opts=(), kwopts=None):
+  """
+  The last step of parsing a SUB block: everything the children parsed to is
+  swapped out for a placeholder, `block.parser` runs on the resulting text, and
+  the children's html is spliced back in where the placeholders ended up.
+  :param blocks: the block's children, as strings and `(elem, html)` tuples.
+  """
+  # children go in a list, and their number in the text.
+  subtext = []
+  subs = []
+  def escape(m):
+    # a mark from the text is a child of its own, so it can't be confused
+    # with the marks around a placeholder.
+    subs.append(m.group())
+    return f'{INLINE_PLACEHOLDER}{len(subs) - 1}{INLINE_PLACEHOLDER}'
+
+  for e in blocks:
+    if isinstance(e, str):
+      if INLINE_PLACEHOLDER in e or BLOCK_PLACEHOLDER in e:
+        e = placeholder_marks.sub(escape, e)
+      subtext.append(e)
+    elif isinstance(e, (list, tuple)):
+      mark = (INLINE_PLACEHOLDER if isinstance(e[0], Inline) and e[0].display is Display.INLINE
+              else BLOCK_PLACEHOLDER)
+      subtext.append(f'{mark}{len(subs)}{mark}')
+      subs.append(tonode(e))
+
+  def splice(text):
+    if INLINE_PLACEHOLDER not in text and BLOCK_PLACEHOLDER not in text:
+      return [text] if text != '' else []
+    # placeholders have a mark on both sides, so splitting on the marks puts
+    # the children's numbers at every odd index.
+    parts = text.replace(BLOCK_PLACEHOLDER, INLINE_PLACEHOLDER).split(INLINE_PLACEHOLDER)
+    l = []
+    for i, x in enumerate(parts):
+      if i % 2:
+        x = subs[int(x)]
+      elif x == '':
+        continue
+      # put escaped marks back together with the text around them.
+      if isinstance(x, str) and l and isinstance(l[-1], str):
+        l[-1] += x
+      else:
+        l.append(x)
+    return l
+
+  text = ''.join(subtext)
+  # the pieces of text aren't needed once they've been joined, and letting go
+  # of them before the block's parser runs keeps them out of the peak.
+  del subtext
+  return splicehtmlmap(splice, block.parser(text, *opts, **(kwopts or {})))
+
+
+def parse(registry: Registry, text: str, topblock:Block=None, inline:Callable=parseinline,
+          workers:int=1, chunksize:int=1 << 16, nodes:bool=False):
   """Parse input text with the known blocks/inline elements in registry.
   All config parameters are pretty much setup inside registry, although you can
   force `parse` to use a different block as the top context block if you wish.
@@ -182,9 +692,204 @@ def parse(registry: Registry, text: str, topblock:Block=None):
   :param registry: the `Registry` object available
   :param text: the text you want to parse into HTML
   :param topblock: Block (in the registry) that is considered the outermost context of the text.
-  :return: list-style html.
+  :param inline: the inline parser to use, `parseinline` (default) or `parseinline_tokens`.
+  :param workers: number of processes to parse with, see `parseparallel`.
+  `None` means one per core.
+  :param chunksize: roughly how many characters of the document each process is sent at a time.
+  :param nodes: return the html as the `Node`s that the parser builds it with,
+  rather than turning them back into lists, which the renderers don't need.
+  :return: list-style html, or a `Node` with `nodes`.
+  """
+  if workers != 1:
+    html = parseparallel(registry, text, topblock, inline, workers, chunksize)
+  else:
+    html = parseblock(registry, topblock or registry.top, text, inline=inline)
+  return tonode(html) if nodes else aslists(html)
+
+
+def parsestream(registry: Registry, lines: Iterable[str], topblock:Block=None,
+                inline:Callable=parseinline, nodes:bool=False):
+  """
+  `parse` for a document that's read a bit at a time, eg. from a file object.
+  The lines are grouped into chunks with `splitstream`, and each chunk is
+  parsed once it's been read. The html is a generator that only asks for the
+  next chunk once everything before it has been consumed, so rendering it
+  keeps about one top level block or paragraph in memory at a time.
+
+  The chunks are parsed separately with the top block, and their children are
+  put in a single copy of its tag, so this needs a `Nesting.SUB` top block that
+  just wraps its children (`Paragraphs`, say). Any other top block is given the
+  whole text at once. The html matches `parse` apart from a few corner cases,
+  the main one being that inline elements can't span a paragraph break.
+  With `nodes`, the children of the top tag are `Node`s, as in `parse`.
+  """
+  convert = tonode if nodes else aslists
+  block = topblock or registry.top
+  if block.nest != Nesting.SUB:
+    yield from map(convert, parseblock(registry, block, ''.join(lines), inline=inline))
+    return
+
+  first = True
+  for chunk in splitstream(lines):
+    html = iter(parseblock(registry, block, chunk, inline=inline))
+    tag = next(html)
+    if first:
+      yield tag
+      yield from map(convert, html)
+      first = False
+    else:
+      for i, e in enumerate(html):
+        # the top tag's attributes were given with the first chunk.
+        if not (i == 0 and isinstance(e, dict)):
+          yield convert(e)
+
+  if first:
+    yield from map(convert, parseblock(registry, block, '', inline=inline))
+
+
+# registry, top block and inline parser of a `parseparallel` worker process.
+# they're handed over when the process starts, since elements can't be pickled,
+# and elements are sent back by their key in the registry (which needn't be
+# their name), along with a table of those keys.
+_worker = None
+
+def initworker(registry: Registry, block: Block, inline: Callable):
+  global _worker
+  _worker = (registry, block, inline, {id(e): k for k, e in reversed(registry.items())})
+
+
+def parsechunks(chunks: list) -> list:
+  """
+  Parses a group of top level chunks of a document, in a worker process.
+  :param chunks: text, or `(name, args, body)` for blocks.
+  :return: the chunks' html, as strings and `(registry key, html)` tuples,
+  with the html as lists, since the nodes' elements can't be pickled.
+  """
+  registry, block, inline, keys = _worker
+  l = []
+  for c in chunks:
+    if isinstance(c, str):
+      l += (e if isinstance(e, str) else (keys[id(e[0])], tolist(e[1]))
+            for e in inline(registry, block, c, nodes=True))
+    else:
+      name, args, body = c
+      elem, html = parsechild(registry, body, BlockSpan(name, args, 0, len(body), None), inline)
+      l.append((keys[id(elem)], tolist(html)))
+  return l
+
+
+def parseparallel(registry: Registry, text: str, topblock:Block=None, inline:Callable=parseinline,
+                  workers:int=None, chunksize:int=1 << 16):
   """
-  return parseblock(registry, topblock or registry.top, text)
+  `parse`, with the top level chunks of the document (the text and blocks
+  `splitblocks` would return) spread over a pool of processes. Consecutive
+  chunks are grouped until there's about `chunksize` characters of them, each
+  group is parsed in a worker, and the results are put back together in order,
+  so the html is the same as the serial version.
+
+  Only a `Nesting.SUB` top block can be split up like this, and the workers
+  are forked, so any other top block, a platform without `fork`, or a document
+  that fits in one chunk, is just parsed serially.
+  """
+  block = topblock or registry.top
+  if block.nest != Nesting.SUB or 'fork' not in multiprocessing.get_all_start_methods():
+    return parseblock(registry, block, text, inline=inline)
+
+  groups = [[]]
+  size = 0
+  for b in blocktree(text):
+    if size >= chunksize:
+      groups.append([])
+      size = 0
+    if isinstance(b, BlockSpan):
+      groups[-1].append((b.name, b.args, text[b.start:b.end]))
+      size += b.end - b.start
+    else:
+      groups[-1].append(text[b[0]:b[1]])
+      size += b[1] - b[0]
+
+  if len(groups) == 1:
+    return parseblock(registry, block, text, inline=inline)
+
+  with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                           initializer=initworker, initargs=(registry, block, inline)) as pool:
+    parts = list(pool.map(parsechunks, groups))
+
+  return splicesubs(block, [e if isinstance(e, str) else (registry[e[0]], e[1])
+                            for part in parts for e in part])
+
+
+def digest(text: str) -> bytes:
+  """Content hash used to recognise text that's been parsed before."""
+  return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class ParseSession:
+  """
+  Parses successive versions of a document that is being edited, eg. for a
+  live preview, re-parsing only what changed since the last call to `parse`.
+
+  The document is split into its top level chunks (text and blocks, as
+  `splitblocks` does), and the parse of each chunk is kept, keyed by a hash of
+  its content. On the next parse only chunks that haven't been seen before are
+  parsed again, and the top block's own parser is run over the result.
+  That's only possible for `Nesting.SUB` top blocks - any other top block is
+  re-parsed in full, whenever the text changes, as a single chunk.
+
+  Changing the registry throws away everything that was kept.
+  """
+  def __init__(self, registry: Registry, topblock:Block=None, inline:Callable=parseinline):
+    self.registry = registry
+    self.block = topblock or registry.top
+    self.inline = inline
+    self.version = registry.version
+    # content key -> parsed chunk, for the chunks of the last parse.
+    self.chunks = {}
+
+  def parsechunk(self, source: str, b) -> list:
+    """Parses one top level chunk of `source`, to a list of its (meta) html."""
+    if isinstance(b, BlockSpan):
+      block, html = parsechild(self.registry, source, b, self.inline)
+      return [(block, unpack(html))]
+    return [e if isinstance(e, str) else (e[0], unpack(e[1]))
+            for e in self.inline(self.registry, self.block, source[b[0]:b[1]], nodes=True)]
+
+  def parse(self, text: str):
+    """
+    Parses the new version of the document.
+
+    :param text: the whole text of the document.
+    :return: `(html, changed)`, the html of the whole document as `parse` would
+    return it, and the indices of the top level chunks that were parsed again.
+    """
+    if self.registry.version != self.version:
+      self.version = self.registry.version
+      self.chunks = {}
+
+    if self.block.nest != Nesting.SUB:
+      key = digest(text)
+      if key not in self.chunks:
+        self.chunks = {key: unwind(aslists(parseblock(self.registry, self.block, text, inline=self.inline)))}
+        return self.chunks[key], [0]
+      return self.chunks[key], []
+
+    chunks = {}
+    keys = []
+    changed = []
+    for i, b in enumerate(blocktree(text)):
+      key = ((b.name, tuple(b.args), digest(text[b.start:b.end]))
+             if isinstance(b, BlockSpan) else digest(text[b[0]:b[1]]))
+      if key not in chunks:
+        if key in self.chunks:
+          chunks[key] = self.chunks[key]
+        else:
+          chunks[key] = self.parsechunk(text, b)
+      if key not in self.chunks:
+        changed.append(i)
+      keys.append(key)
+
+    self.chunks = chunks
+    return aslists(splicesubs(self.block, t.concat(chunks[k] for k in keys))), changed
 
 
 macro_pattern = re.compile(r'(?<!\\)(?:\\\\)*\K\$\{([\w-\.]+)\}')
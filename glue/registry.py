@@ -4,8 +4,13 @@
 
 from collections import OrderedDict
 import copy
+import functools
+import hashlib
+import itertools
+import types
+import enum
+from typing import Union, List, Tuple, Mapping, Iterable
 import toolz as t
-from typing import Union, List, Mapping, Iterable
 from glue.elements import *
 
 class Registry(OrderedDict, Mapping[str, Element]):
@@ -19,14 +24,72 @@ class Registry(OrderedDict, Mapping[str, Element]):
   r = Registry(...)
   r |= {'name': {'property': 'new-value'}}
   r -= ['name1', 'name2']
+
+  Every mutation gives the registry a new `version`, and empties `cache`, which
+  is where the parser keeps anything it derives from the registry's contents
+  (eg, compiled inline matchers). Versions are unique across all registries,
+  copies included, so a version number alone identifies a registry state.
+  The registry's own derived tables (`all_inline`, `all_block`, and the
+  resolved `subscriptions` of each element) live in `cache` too, so they're
+  only worked out once per version.
   """
 
   TOP = 'TOP'
+  _versions = itertools.count()
 
   def __init__(self, *args:Union[Inline, Block], top=None, **kwargs):
     super().__init__([(x.name, x) for x in args])
     if top is not None:
       self[Registry.TOP] = top
+    self.touch()
+
+  def __setitem__(self, key, value):
+    super().__setitem__(key, value)
+    self.touch()
+
+  def __delitem__(self, key):
+    super().__delitem__(key)
+    self.touch()
+
+  # the mutators that OrderedDict has besides setting and deleting items go
+  # through `touch` too.
+  def pop(self, *args):
+    try:
+      return super().pop(*args)
+    finally:
+      self.touch()
+
+  def popitem(self, last=True):
+    try:
+      return super().popitem(last)
+    finally:
+      self.touch()
+
+  def clear(self):
+    super().clear()
+    self.touch()
+
+  def setdefault(self, key, default=None):
+    if key not in self:
+      self[key] = default
+    return self[key]
+
+  def update(self, *args, **kwargs):
+    try:
+      super().update(*args, **kwargs)
+    finally:
+      self.touch()
+
+  def move_to_end(self, key, last=True):
+    try:
+      super().move_to_end(key, last)
+    finally:
+      self.touch()
+
+  def touch(self):
+    """Marks the registry as changed, dropping everything cached against it."""
+    self.version = next(Registry._versions)
+    self.cache = {}
 
   def __iadd__(self, other):
     if not all(isinstance(x, (Inline, Block)) for x in other):
@@ -104,13 +167,19 @@ class Registry(OrderedDict, Mapping[str, Element]):
   def set_top(self, e: Element):
     self[Registry.TOP] = e
 
+  def cached(self, key, f):
+    """`f()`, worked out once per version of the registry and kept in `cache`."""
+    if key not in self.cache:
+      self.cache[key] = f()
+    return self.cache[key]
+
   @property
-  def all_inline(self) -> List[Inline]:
-    return t.filter(lambda x: isinstance(x, Inline), self.values())
+  def all_inline(self) -> Tuple[Inline]:
+    return self.cached('all_inline', lambda: tuple(x for x in self.values() if isinstance(x, Inline)))
 
   @property
-  def all_block(self) -> List[Block]:
-    return t.filter(lambda x: isinstance(x, Block), self.values())
+  def all_block(self) -> Tuple[Block]:
+    return self.cached('all_block', lambda: tuple(x for x in self.values() if isinstance(x, Block)))
 
   def inline_subscriptions(self, names:List[str], parent:Element=None) -> List[Inline]:
     l = []
@@ -126,6 +195,66 @@ class Registry(OrderedDict, Mapping[str, Element]):
              for x in names if x not in ('all', 'inherit'))
     return l
 
+  def block_subscriptions(self, names:List[str], parent:Element=None) -> List[Block]:
+    """Like `inline_subscriptions`, for the `Block`s in a `sub` list."""
+    l = []
+    if 'all' in names:
+      l.extend(self.all_block)
+    if parent is not None and 'inherit' in names:
+      if 'all' not in names and 'all' in parent.sub:
+        l += self.all_block
+      l.extend(self.block_subscriptions([x for x in parent.sub if x not in ('all', 'inherit')]))
+
+    l.extend(x for x in (self.get(x) if isinstance(x, str) else x
+                         for x in names if x not in ('all', 'inherit'))
+             if isinstance(x, Block))
+    return l
+
+  def subscriptions(self, e: Element, parent:Element=None) -> Tuple[Tuple[Inline], Tuple[Block]]:
+    """
+    The table of what `e` subscribes to when it's inside `parent`: a tuple of
+    its inline elements and one of its blocks, with 'all' and 'inherit' worked
+    out. It's only resolved again after the registry changes.
+    """
+    key = ('subscriptions', id(e), id(parent))
+    entry = self.cache.get(key)
+    # the elements are kept in the entry, so ids can't be reused while it's here.
+    if entry is None or entry[0] is not e or entry[1] is not parent:
+      entry = (e, parent, (tuple(self.inline_subscriptions(e.subinline, parent)),
+                           tuple(self.block_subscriptions(e.sub, parent))))
+      self.cache[key] = entry
+    return entry[2]
+
+  @property
+  def fingerprint(self) -> str:
+    """
+    A hash of the registry's contents: the names, types and settings (regexes,
+    opts, nesting, subscriptions, assets...) of its elements, and the code of
+    their parsers, including what the parsers' closures and defaults hold. Unlike
+    `version`, it's the same in every process and every run for the same
+    elements, so it can be kept with things made using the registry, to tell
+    whether they're still valid.
+    """
+    def f():
+      h = hashlib.blake2b(digest_size=16)
+      for k, v in self.fingerprints.items():
+        h.update(k.encode() + b'\0' + v.encode())
+      return h.hexdigest()
+    return self.cached('fingerprint', f)
+
+  @property
+  def fingerprints(self) -> Mapping[str, str]:
+    """The `fingerprint` of each element on its own, by key, in order."""
+    def f():
+      d = OrderedDict()
+      for k, e in self.items():
+        h = hashlib.blake2b(digest_size=16)
+        hashinto(h, type(e).__name__)
+        hashinto(h, vars(e), set())
+        d[k] = h.hexdigest()
+      return d
+    return self.cached('fingerprints', f)
+
   @property
   def assets(self) -> str:
     """
@@ -150,3 +279,78 @@ class Registry(OrderedDict, Mapping[str, Element]):
         return False
 
     return True
+
+
+# the callables `hashinto` looks through to the code underneath.
+CALLABLES = (types.FunctionType, types.MethodType, functools.partial, t.curry)
+
+def hashinto(h, x, seen=None):
+  """
+  Feeds a description of `x` into the hash `h`, one that doesn't change from
+  one process to the next (`repr`s with addresses in them are avoided).
+  Elements inside `x` are described by their name, and functions by their code,
+  defaults, closures and the functions they call by a global name, whatever
+  module those come from. Partials, curried functions and bound methods are
+  described by what they wrap and what's bound into them.
+  Functions only reached as an attribute (`util.helper`, `t.map`) are not
+  followed; neither are builtins, which have no code to describe.
+  :param seen: ids of the functions and objects already described, to stop cycles.
+  """
+  seen = set() if seen is None else seen
+  if x is None or isinstance(x, (str, bytes, int, float, complex, enum.Enum)):
+    h.update(repr(x).encode())
+  elif isinstance(x, Element):
+    h.update(b'element ' + x.name.encode())
+  elif isinstance(x, (list, tuple)):
+    h.update(b'[')
+    for y in x:
+      hashinto(h, y, seen)
+    h.update(b']')
+  elif isinstance(x, dict):
+    h.update(b'{')
+    for k, v in x.items():
+      hashinto(h, k, seen)
+      hashinto(h, v, seen)
+    h.update(b'}')
+  elif isinstance(x, (set, frozenset)):
+    for y in sorted(map(repr, x)):
+      h.update(y.encode())
+  elif hasattr(x, 'pattern') and hasattr(x, 'flags'):
+    h.update(b'pattern ' + repr((x.pattern, x.flags)).encode())
+  elif id(x) in seen:
+    h.update(b'seen')
+  elif isinstance(x, types.CodeType):
+    h.update(x.co_code)
+    hashinto(h, x.co_names, seen)
+    hashinto(h, x.co_consts, seen)
+  elif isinstance(x, types.FunctionType):
+    seen.add(id(x))
+    hashinto(h, x.__code__, seen)
+    hashinto(h, x.__defaults__, seen)
+    hashinto(h, x.__kwdefaults__, seen)
+    for cell in x.__closure__ or ():
+      try:
+        hashinto(h, cell.cell_contents, seen)
+      except ValueError:
+        h.update(b'empty')
+    # helpers the parser calls are part of what it does.
+    for name in x.__code__.co_names:
+      g = x.__globals__.get(name)
+      if isinstance(g, CALLABLES):
+        hashinto(h, g, seen)
+  elif isinstance(x, types.MethodType):
+    seen.add(id(x))
+    h.update(b'method')
+    hashinto(h, x.__func__, seen)
+    hashinto(h, x.__self__, seen)
+  elif isinstance(x, (functools.partial, t.curry)):
+    seen.add(id(x))
+    h.update(type(x).__name__.encode())
+    hashinto(h, x.func, seen)
+    hashinto(h, x.args, seen)
+    hashinto(h, x.keywords or {}, seen)
+  else:
+    seen.add(id(x))
+    h.update(type(x).__qualname__.encode())
+    if hasattr(x, '__dict__'):
+      hashinto(h, vars(x), seen)
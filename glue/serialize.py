@@ -0,0 +1,377 @@
+# Compact binary form of the parser's html, for caching parsed documents
+# between parsing and rendering. Strings that keep coming back (tags, attribute
+# keys and element names) are stored once in a table and referred to by index,
+# tags are length prefixed so a reader can skip over them, and elements are
+# stored by their key in a registry and looked up in it again when loading.
+#
+# The layout is `MAGIC`, the string table (a count, then each string as its
+# length and utf-8 bytes) and then the root. Numbers are unsigned LEB128
+# varints, apart from the lengths of tags and lists, which are 4 bytes little
+# endian so they can be filled in once the children have been written. Each
+# record starts with a type byte:
+#
+#   STR   length, utf-8 text
+#   NONE
+#   TAG   tag, length of the rest, attrs (count + 1, or 0 for no dict), children
+#   LIST  length of the rest, children (a list of tags with no tag of its own)
+#   ELEM  element key, then the record of its html: an `(elem, html)` tuple
+#
+# Attribute values are STR or NONE records too, or TRUE, FALSE, INT (a zigzag
+# varint), FLOAT (8 byte double), ARRAY (count, values) or DICT (count, then
+# key and value pairs).
+
+import struct
+import toolz as t
+
+from glue.util import Node, istag
+
+MAGIC = b'GLU\x01'
+
+STR, NONE, TAG, LIST, ELEM, TRUE, FALSE, INT, FLOAT, ARRAY, DICT = range(11)
+
+_length = struct.Struct('<I')
+_double = struct.Struct('<d')
+_end = object()
+
+
+def write_varint(buf: bytearray, n: int):
+  while n >= 0x80:
+    buf.append(n & 0x7f | 0x80)
+    n >>= 7
+  buf.append(n)
+
+def read_varint(data, i: int):
+  """`(n, i)`, the varint at `data[i]` and the index after it."""
+  n = data[i]
+  if n < 0x80:
+    return n, i + 1
+  n, shift = 0, 0
+  while True:
+    b = data[i]
+    i += 1
+    n |= (b & 0x7f) << shift
+    if b < 0x80:
+      return n, i
+    shift += 7
+
+
+def dumps(html, registry=None) -> bytes:
+  """
+  Serializes html the way the parser returns it (cottonmouth lists, `Node`s,
+  `(elem, html)` tuples and generators, in any mix) to bytes.
+  Generators are consumed. Lists and tuples in attribute values come back as lists.
+  :param registry: where the elements are from. They're written as their key
+  in it, which needn't be their name. Without one, their names are written.
+  """
+  keys = element_keys(registry)
+  strings = {}
+  def intern(s: str) -> int:
+    i = strings.get(s)
+    if i is None:
+      if not isinstance(s, str):
+        raise TypeError('{!r} is not a string, and cannot be a tag or key'.format(s))
+      i = strings[s] = len(strings)
+    return i
+
+  buf = bytearray()
+  def value(v):
+    if isinstance(v, str):
+      s = v.encode()
+      buf.append(STR)
+      write_varint(buf, len(s))
+      buf.extend(s)
+    elif v is None: buf.append(NONE)
+    elif v is True: buf.append(TRUE)
+    elif v is False: buf.append(FALSE)
+    elif isinstance(v, int):
+      buf.append(INT)
+      write_varint(buf, v << 1 if v >= 0 else (-v << 1) - 1)
+    elif isinstance(v, float):
+      buf.append(FLOAT)
+      buf.extend(_double.pack(v))
+    elif isinstance(v, dict):
+      buf.append(DICT)
+      write_varint(buf, len(v))
+      for k, x in v.items():
+        write_varint(buf, intern(k))
+        value(x)
+    elif isinstance(v, (list, tuple)):
+      buf.append(ARRAY)
+      write_varint(buf, len(v))
+      for x in v:
+        value(x)
+    else:
+      raise TypeError('{!r} cannot be serialized as an attribute value'.format(v))
+
+  def tag(tag, attrs):
+    """Writes the start of a tag, and returns where its length goes."""
+    buf.append(TAG)
+    write_varint(buf, intern(tag))
+    start = len(buf)
+    buf.extend(b'\0\0\0\0')
+    if attrs is None:
+      buf.append(0)
+    else:
+      write_varint(buf, len(attrs) + 1)
+      for k, v in attrs.items():
+        write_varint(buf, intern(k))
+        value(v)
+    return start
+
+  def element(elem):
+    buf.append(ELEM)
+    write_varint(buf, intern(elem if isinstance(elem, str) else keys(elem)))
+
+  def record(x):
+    """Writes `x`, or the start of it, and returns its children and where its length goes, if any."""
+    elem = None
+    while isinstance(x, tuple):
+      elem, x = x
+      if elem is not None:
+        element(elem)
+    if isinstance(x, str):
+      value(x)
+      return None
+    if x is None:
+      buf.append(NONE)
+      return None
+    if isinstance(x, Node):
+      # the parser's nodes are in `(elem, node)` tuples with their own element.
+      if x.elem is not None and x.elem is not elem:
+        element(x.elem)
+      return iter(x.children), tag(x.tag, x.attrs)
+    if not (isinstance(x, list) or istag(x)):
+      raise TypeError('{!r} is not convertible into html'.format(x))
+
+    it = iter(x)
+    head = next(it, _end)
+    if head is _end or not isinstance(head, str):
+      buf.append(LIST)
+      start = len(buf)
+      buf.extend(b'\0\0\0\0')
+      return (iter(()) if head is _end else t.cons(head, it)), start
+    first = next(it, _end)
+    if isinstance(first, dict):
+      return it, tag(head, first)
+    return (iter(()) if first is _end else t.cons(first, it)), tag(head, None)
+
+  # each frame is `(children, where the length of their parent goes)`
+  stack = [(iter((html,)), None)]
+  while stack:
+    items, start = stack[-1]
+    for x in items:
+      if type(x) is str:
+        # the most common case, written here to save a call.
+        x = x.encode()
+        buf.append(STR)
+        write_varint(buf, len(x))
+        buf += x
+        continue
+      sub = record(x)
+      if sub is not None:
+        stack.append(sub)
+        break
+    else:
+      stack.pop()
+      if start is not None:
+        _length.pack_into(buf, start, len(buf) - start - 4)
+
+  out = bytearray(MAGIC)
+  write_varint(out, len(strings))
+  for s in strings:
+    s = s.encode()
+    write_varint(out, len(s))
+    out += s
+  out += buf
+  return bytes(out)
+
+def read_header(data):
+  """`(strings, i)`, the string table of serialized html and the index of its root."""
+  if data[:len(MAGIC)] != MAGIC:
+    raise ValueError('not serialized glue html (bad magic number)')
+  n, i = read_varint(data, len(MAGIC))
+  strings = []
+  for _ in range(n):
+    size, i = read_varint(data, i)
+    strings.append(str(data[i:i+size], 'utf-8'))
+    i += size
+  return strings, i
+
+def element_keys(registry):
+  """The key of each element in `registry`, or its name without a registry."""
+  if registry is None:
+    return lambda elem: elem.name
+  keys = {id(e): k for k, e in reversed(registry.items())}
+  def key(elem):
+    try:
+      return keys[id(elem)]
+    except KeyError:
+      raise KeyError('{} is not in the registry'.format(elem.name)) from None
+  return key
+
+def registry_elements(registry):
+  """
+  Looks up elements by key in `registry` (including its top element). Without
+  a registry, keys are used in place of the elements.
+  """
+  if registry is None:
+    return lambda key: key
+  elements = dict(registry)
+  def element(key):
+    try:
+      return elements[key]
+    except KeyError:
+      raise KeyError('there is no element {} in the registry'.format(key)) from None
+  return element
+
+def read_value(data, i: int, strings):
+  """`(value, i)`, the attribute value at `data[i]` and the index after it."""
+  kind = data[i]
+  i += 1
+  if kind == STR:
+    n, i = read_varint(data, i)
+    return str(data[i:i+n], 'utf-8'), i + n
+  if kind == NONE: return None, i
+  if kind == TRUE: return True, i
+  if kind == FALSE: return False, i
+  if kind == INT:
+    n, i = read_varint(data, i)
+    return (n >> 1) ^ -(n & 1), i
+  if kind == FLOAT:
+    return _double.unpack_from(data, i)[0], i + 8
+  if kind == ARRAY:
+    n, i = read_varint(data, i)
+    l = []
+    for _ in range(n):
+      v, i = read_value(data, i, strings)
+      l.append(v)
+    return l, i
+  if kind == DICT:
+    n, i = read_varint(data, i)
+    d = {}
+    for _ in range(n):
+      k, i = read_varint(data, i)
+      d[strings[k]], i = read_value(data, i, strings)
+    return d, i
+  raise ValueError('bad attribute value record {} at {}'.format(kind, i - 1))
+
+def read_attrs(data, i: int, strings):
+  """`(attrs, i)`, the attrs of a tag (None if it has no dict) and the index after them."""
+  n, i = read_varint(data, i)
+  if n == 0:
+    return None, i
+  attrs = {}
+  for _ in range(n - 1):
+    k, i = read_varint(data, i)
+    attrs[strings[k]], i = read_value(data, i, strings)
+  return attrs, i
+
+def wrap(elems, x):
+  """`x` in an `(elem, html)` tuple for each of `elems`, the first one outermost."""
+  for elem in reversed(elems):
+    x = (elem, x)
+  return x
+
+
+def loads(data, registry=None):
+  """
+  The html in bytes from `dumps`, as cottonmouth lists, with `(elem, html)`
+  tuples where it had elements (`tonode` makes nodes from it).
+  :param registry: where the elements are looked up by key (see `dumps`).
+  Without one, the tuples have the keys instead.
+  """
+  strings, i = read_header(data)
+  element = registry_elements(registry)
+  root = []
+  parent, end = root, len(data)
+  # each frame is `(list, where its children end)`
+  stack = [(parent, end)]
+  # the elements of the next record, outermost first
+  elems = []
+  while True:
+    if i >= end:
+      stack.pop()
+      if not stack:
+        break
+      parent, end = stack[-1]
+      continue
+    kind = data[i]
+    i += 1
+    if kind == STR:
+      n, i = read_varint(data, i)
+      x = str(data[i:i+n], 'utf-8')
+      i += n
+    elif kind == TAG or kind == LIST:
+      if kind == TAG:
+        n, i = read_varint(data, i)
+      length, = _length.unpack_from(data, i)
+      i += 4
+      children = i + length
+      if kind == LIST:
+        x = []
+      else:
+        attrs, i = read_attrs(data, i, strings)
+        x = [strings[n]] if attrs is None else [strings[n], attrs]
+      parent.append(wrap(elems, x) if elems else x)
+      elems = []
+      parent, end = x, children
+      stack.append((parent, end))
+      continue
+    elif kind == NONE:
+      x = None
+    elif kind == ELEM:
+      n, i = read_varint(data, i)
+      elems.append(element(strings[n]))
+      continue
+    else:
+      raise ValueError('bad record {} at {}'.format(kind, i - 1))
+    parent.append(wrap(elems, x) if elems else x)
+    elems = []
+  if len(root) != 1:
+    raise ValueError('serialized html should have one root, not {}'.format(len(root)))
+  return root[0]
+
+
+def lazyloads(data, registry=None):
+  """
+  `loads`, but tags are generators (like the parser's) that only read their
+  part of `data` when they're iterated, so subtrees that are never looked at
+  are skipped over without being read.
+  """
+  strings, i = read_header(data)
+  return lazy_record(data, i, strings, registry_elements(registry))[0]
+
+def lazy_record(data, i: int, strings, element):
+  """`(html, i)`, the html at `data[i]` and the index after it, without reading its children."""
+  elems = []
+  while data[i] == ELEM:
+    n, i = read_varint(data, i + 1)
+    elems.append(element(strings[n]))
+  kind = data[i]
+  i += 1
+  if kind == STR or kind == NONE:
+    x, i = read_value(data, i - 1, strings)
+  elif kind == TAG:
+    n, i = read_varint(data, i)
+    length, = _length.unpack_from(data, i)
+    x = lazy_tag(data, i + 4, i + 4 + length, strings[n], strings, element)
+    i += 4 + length
+  elif kind == LIST:
+    length, = _length.unpack_from(data, i)
+    x = lazy_children(data, i + 4, i + 4 + length, strings, element)
+    i += 4 + length
+  else:
+    raise ValueError('bad record {} at {}'.format(kind, i - 1))
+  return (wrap(elems, x) if elems else x), i
+
+def lazy_tag(data, i: int, end: int, tag: str, strings, element):
+  yield tag
+  attrs, i = read_attrs(data, i, strings)
+  if attrs is not None:
+    yield attrs
+  yield from lazy_children(data, i, end, strings, element)
+
+def lazy_children(data, i: int, end: int, strings, element):
+  while i < end:
+    x, i = lazy_record(data, i, strings, element)
+    yield x
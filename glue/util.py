@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from typing import Mapping
+from typing import Mapping, NamedTuple, List, Iterable
 from collections import defaultdict
 import regex as re
 import inspect
@@ -8,19 +8,64 @@ import toolz as t
 
 # ----------------------- GENERAL UTILITIES ------------------------------
 
+def foldtree(tree, step, build=None):
+  """
+  Builds a value bottom up from a tree, with an explicit stack instead of
+  recursion, so that trees of any depth can be handled.
+
+  `step(x)` is called on each node, top down and in order, and returns
+  `(None, value)` if `x` is a leaf, or `(children, build)` otherwise: `children`
+  is iterated, and then `build` is called with the list of their values to make
+  the value of `x`.
+
+  :param build: if given, `tree` is the children of the root instead, and
+  `build` makes the root's value.
+  """
+  if build is None:
+    tree, build = step(tree)
+    if tree is None:
+      return build
+  stack = [(iter(tree), [], build)]
+  while True:
+    children, values, build = stack[-1]
+    for x in children:
+      sub, value = step(x)
+      if sub is None:
+        values.append(value)
+      else:
+        stack.append((iter(sub), [], value))
+        break
+    else:
+      stack.pop()
+      value = build(values)
+      if not stack:
+        return value
+      stack[-1][1].append(value)
+
 def unwind(g):
   """
   Unwinds a nested generator expression, returning built nested list.
+  `Node`s are already built, and are returned as they are.
   """
-  l = []
-  for e in g:
-    if (isinstance(e, (list, types.GeneratorType, map, zip, filter))
-        or inspect.isgenerator(e)
-        or inspect.isgeneratorfunction(e)):
-      l.append(unwind(e))
-    else:
+  if isinstance(g, Node):
+    return g
+  # lists are filled in as their items are unwound, so this doesn't need the
+  # generality of `foldtree`.
+  root = []
+  stack = [(iter(g), root)]
+  while stack:
+    items, l = stack[-1]
+    for e in items:
+      if (isinstance(e, (list, types.GeneratorType, map, zip, filter))
+          or inspect.isgeneratorfunction(e)):
+        sub = []
+        l.append(sub)
+        stack.append((iter(e), sub))
+        break
       l.append(e)
-  return l
+    else:
+      stack.pop()
+  return root
 
 def cut(i, s):
   """cuts a string into two parts by a specified index"""
@@ -39,6 +84,95 @@ def num_groups(regex):
   """the number of groups that a regex will capture."""
   return re.compile(regex).groups
 
+def class_end(pattern: str, i: int):
+  """Index of the `]` that closes the character class opened at `pattern[i]`."""
+  i += 1
+  if pattern[i:i+1] == '^': i += 1
+  # a `]` right at the start of a class is a literal.
+  if pattern[i:i+1] == ']': i += 1
+  while i < len(pattern) and pattern[i] != ']':
+    i += 2 if pattern[i] == '\\' else 1
+  return i
+
+def matching_paren(pattern: str, i: int):
+  """
+  Index of the `)` that closes the group opened at `pattern[i]`, or None if there
+  isn't one. Skips over escapes and character classes.
+  """
+  depth = 0
+  while i < len(pattern):
+    c = pattern[i]
+    if c == '\\':
+      i += 1
+    elif c == '[':
+      i = class_end(pattern, i)
+    elif c == '(':
+      depth += 1
+    elif c == ')':
+      depth -= 1
+      if depth == 0: return i
+    i += 1
+  return None
+
+def toplevel_alternation(pattern: str) -> bool:
+  """Whether `pattern` has a `|` that isn't inside a group or a character class."""
+  i = 0
+  while i < len(pattern):
+    c = pattern[i]
+    if c == '\\':
+      i += 1
+    elif c == '[':
+      i = class_end(pattern, i)
+    elif c == '(':
+      i = matching_paren(pattern, i)
+      if i is None: return True
+    elif c == '|':
+      return True
+    i += 1
+  return False
+
+ESCAPE_PREFIX = r'(?<!\\)(?:\\\\)*'
+
+def firstchars(regex):
+  r"""
+  The set of characters that any match of `regex` has to start with (after the
+  escape prefix from `Patterns` and `^`, which don't consume anything of their
+  own), or None if that can't be worked out from the pattern.
+  Only simple patterns are understood - a literal character or escaped
+  punctuation, possibly inside leading groups - but that's what the patterns
+  of almost all inline elements look like.
+
+  >>> firstchars(r'(?<!\\)(?:\\\\)*\K\*(.*?)\*')
+  {'*'}
+  """
+  if not isinstance(regex, str):
+    if regex.flags & re.IGNORECASE: return None
+    regex = regex.pattern
+  p = regex
+  if p.startswith(ESCAPE_PREFIX): p = p[len(ESCAPE_PREFIX):]
+  if p.startswith(r'\K'): p = p[2:]
+  if p.startswith('^'): p = p[1:]
+  if p == '' or toplevel_alternation(p): return None
+
+  if p[0] == '(':
+    # a leading group that isn't optional: look inside of it.
+    if p.startswith('(?') and not p.startswith('(?:') and not p.startswith('(?P<'): return None
+    end = matching_paren(p, 0)
+    if end is None or p[end+1:end+2] in ('?', '*') or p[end+1:end+3] in ('{0', '{,'): return None
+    inner = p[3:end] if p.startswith('(?:') else p[p.index('>')+1:end] if p.startswith('(?P<') else p[1:end]
+    return firstchars(inner)
+
+  if p[0] == '\\':
+    if len(p) < 2 or p[1].isalnum(): return None
+    c, rest = p[1], p[2:]
+  elif p[0] in '.[])|?*+{}$':
+    return None
+  else:
+    c, rest = p[0], p[1:]
+
+  if rest[:1] in ('?', '*') or rest[:2] in ('{0', '{,'): return None
+  return {c}
+
 def indexby(pred, lst):
   """gives index of first item in list for which pred(item) is True"""
   return next((i for i, j in enumerate(lst) if pred(j)), len(lst))
@@ -93,67 +227,138 @@ def indented_tree_h(tags: list, indent:int =0, ch:str ='  '):
   """
   if len(tags) == 0: return ''
   yield ch*indent + tags[0]
-  for subtag in tags[1:]:
-    if isinstance(subtag, list):
-      yield from indented_tree_h(subtag, indent+1, ch=ch)
-    else: 
-      yield ch*(indent+1) + subtag
+  stack = [(iter(tags[1:]), indent+1)]
+  while stack:
+    subtags, indent = stack[-1]
+    for subtag in subtags:
+      if isinstance(subtag, list):
+        if len(subtag) > 0:
+          yield ch*indent + subtag[0]
+          stack.append((iter(subtag[1:]), indent+1))
+          break
+      else:
+        yield ch*indent + subtag
+    else:
+      stack.pop()
 
 
-def splitblocks(text: str):
+class BlockSpan(NamedTuple):
+  """
+  A block found by `blocktree`. `name` and `args` come from its `---name args`
+  line, and `start`/`end` are the offsets of its body in the text that was
+  scanned, so the body is only sliced out if someone needs it.
+  `children` is the body, already split up the same way.
   """
-  A state machine type parser that can split the original document into nested blocks.
+  name: str
+  args: List[str]
+  start: int
+  end: int
+  children: list
+
+
+block_marker = re.compile(r'^(?:(---[\w_=\- \.]+)|(\.\.\.))[ \t]*(?:\n|$)', re.M)
+
+def blocktree(text: str, start: int=0, end: int=None):
+  """
+  Scans `text[start:end]` for blocks, in one pass, and returns the whole tree.
+
+  A block starts with a `---name args` line and ends with a `...` line, and
+  blocks can be nested. Plain text is returned as `(start, end)` offsets into
+  `text`, and blocks as `BlockSpan`s, whose children are split up likewise.
+  A block that is never closed is treated like `splitblocks` always has: the
+  rest of the text after its first line is plain text.
 
-  It scans for groups of --- and ... on their own lines, and then uses those tokens
-  to make a tree of blocks for the parser.
   :param text: raw text from the input file to the glue parser
-  :return: a `X = str | [X]` type structure that represents the structure of the AST of the document.
+  :return: a `X = (int, int) | BlockSpan(..., children=[X])` list.
   """
-  # tokenize
-  tokens = re.split(re.compile(r'^(?:(---[\w_=\- \.]+)|(\.\.\.))[ \t]*(?:\n|$)', re.M), text)
+  end = len(text) if end is None else end
+  root = []
+  # each frame is (name, args, body start, children)
+  stack = []
+  pos = start
+  for m in block_marker.finditer(text, start, end):
+    children = stack[-1][3] if stack else root
+    if m.start() > pos:
+      children.append((pos, m.start()))
+    pos = m.end()
 
-  l = []
-  token = ''
-  block = ''
-  lineno = 1
-  i = 0
-  level = 0
-  while i < len(tokens):
-    if tokens[i] is None and tokens[i+1] == '...':
-      # end of block
-      level -= 1
-      if level < 0:
-        # end with no beginning
-        raise ValueError('Block closing "..." found with no corresponding opening. at line {}'.format(lineno))
-      elif level == 0:
-        b = block.split(maxsplit=1)
-        l.append([b[0], b[1].split() if len(b) > 1 else [], token])
-        token = ''
-      else:
-        token += tokens[i+1] + "\n"
-      i += 2
-      lineno += 1
-    elif re.match(r'^---[\w_=\- \.]+$', tokens[i]):
+    if m.group(1) is not None:
       # begin of a new block
-      level += 1
-      if level == 1:
-        block = tokens[i][3:]
-        if len(token) > 0:
-          l.append(token)
-          token = ''
-      else:
-        token += tokens[i] + "\n"
-      i += 2
-      lineno += 1
+      b = m.group(1)[3:].split(maxsplit=1)
+      stack.append((b[0], b[1].split() if len(b) > 1 else [], m.end(), []))
     else:
-      token += tokens[i]
-      lineno += tokens[i].count('\n')
-      i += 1
+      # end of block
+      if len(stack) == 0:
+        raise ValueError('Block closing "..." found with no corresponding opening. at line {}'.format(
+          text.count('\n', 0, m.start()) + 1))
+      name, args, body, grandchildren = stack.pop()
+      (stack[-1][3] if stack else root).append(BlockSpan(name, args, body, m.start(), grandchildren))
 
-  if len(token) > 0:
-    l.append(token)
+  if len(stack) > 0:
+    # the outermost block was never closed, so its body is just text.
+    if end > stack[0][2]:
+      root.append((stack[0][2], end))
+  elif end > pos:
+    root.append((pos, end))
 
-  return l
+  return root
+
+
+def splitblocks(text: str):
+  """
+  Splits the original document into its top level blocks.
+
+  It scans for groups of --- and ... on their own lines (see `blocktree`), and
+  returns the text and blocks at the top level, with the bodies sliced out.
+  :param text: raw text from the input file to the glue parser
+  :return: a `X = str | [name, args, body]` type structure that represents the top level of the document.
+  """
+  return [[b.name, b.args, text[b.start:b.end]] if isinstance(b, BlockSpan) else text[b[0]:b[1]]
+          for b in blocktree(text)]
+
+
+def splitstream(lines: Iterable[str]):
+  """
+  Groups the lines of a document into chunks as they're read, so a document
+  can be parsed a bit at a time. A chunk ends after a top level block is
+  closed, or at a paragraph break (a blank line) in top level text.
+
+  Blank lines are only cut at where splitting the whole text on `\\n\\n` would
+  have cut, so parsing the chunks one after the other with a SUB top block like
+  `Paragraphs` gives the same paragraphs as parsing the whole text at once.
+
+  :param lines: lines of the document, with their line endings (eg, a file).
+  :return: generator of chunks of text.
+  """
+  chunk = []
+  depth = 0
+  # number of newlines in a row at the end of the chunk, in top level text.
+  newlines = 0
+  for lineno, line in enumerate(lines, 1):
+    m = block_marker.match(line)
+    # a block right after a paragraph break stays with it, since its
+    # placeholder takes one of the newlines before it.
+    if depth == 0 and newlines >= 2 and newlines % 2 == 0 and line != '\n' and m is None:
+      yield ''.join(chunk)
+      chunk = []
+      newlines = 0
+
+    chunk.append(line)
+    if m is not None and m.group(1) is not None:
+      depth += 1
+    elif m is not None:
+      if depth == 0:
+        raise ValueError('Block closing "..." found with no corresponding opening. at line {}'.format(lineno))
+      depth -= 1
+      if depth == 0:
+        yield ''.join(chunk)
+        chunk = []
+        newlines = 0
+    elif depth == 0:
+      newlines = newlines + 1 if line == '\n' else int(line.endswith('\n'))
+
+  if len(chunk) > 0:
+    yield ''.join(chunk)
 
 
 def splicehtmlmap(f, html):
@@ -201,7 +406,7 @@ def unpack(html):
   """
   Unpacks the annotated HTML style form returned by `parseinline`.
   Gives the raw HTML in cottonmouth template form.
-  This function is a noop on cottonmouth html.
+  This function is a noop on cottonmouth html, and on `Node`s.
   
   :param html: Annotated HTML as returned by parseinline. For each snippet of
   HTML generated by some inline or block element, the html param should contain
@@ -210,16 +415,178 @@ def unpack(html):
   :return: `(elem, [html...])` -> `[html...]` for each element in HTML. the tag
   name and attribute list are ignored.
   """
-  if istag(html):
-    return [unpack(x) for x in html]
-  elif isinstance(html, tuple):
-    if isinstance(html[1][1], dict):
-      return [html[1][0], html[1][1], *map(unpack, html[1][2:])]
-    return [html[1][0], *map(unpack, html[1][1:])]
-  elif isinstance(html, list):
-    return [html[0], *map(unpack, html[1:])]
-  else:
-    return html
+  def step(html):
+    if isinstance(html, Node):
+      return None, html
+    elif istag(html):
+      return html, list
+    elif isinstance(html, tuple):
+      if isinstance(html[1], Node):
+        return None, html[1]
+      if isinstance(html[1][1], dict):
+        head = [html[1][0], html[1][1]]
+        return html[1][2:], lambda body: head + body
+      head = [html[1][0]]
+      return html[1][1:], lambda body: head + body
+    elif isinstance(html, list):
+      head = [html[0]]
+      return html[1:], lambda body: head + body
+    else:
+      return None, html
+  return foldtree(html, step)
+
+class Node:
+  """
+  Compact form of a tag in the parser's html: `tag` is the cottonmouth tag
+  string (`div.class#id`), `attrs` its attribute dict (None if it had none),
+  `children` a tuple of strings and `Node`s, and `elem` the element whose
+  parser made it, if known.
+
+  A node reads like the cottonmouth list it stands for, `[tag, attrs, *children]`
+  (iterating, indexing, comparing to a list), so it can be rendered like one,
+  and `unwind` and `unpack` leave it alone. The parser builds the html of the
+  elements it matches as nodes (see `parse`'s `nodes`), `tonode` converts
+  parser output to nodes, and `tolist` converts nodes back to lists.
+
+  Nodes are meant to be read only: all nodes without attributes share the same
+  empty `attrs` dict. They hash by their tag and children, and are pickled
+  without their element, since elements can't be pickled.
+  """
+  __slots__ = ('tag', 'attrs', 'children', 'elem')
+
+  def __init__(self, tag: str, attrs: dict=None, children: tuple=(), elem=None):
+    self.tag = tag
+    self.attrs = attrs
+    self.children = children
+    self.elem = elem
+
+  def __iter__(self):
+    yield self.tag
+    if self.attrs is not None:
+      yield self.attrs
+    yield from self.children
+
+  def __eq__(self, other):
+    if isinstance(other, list):
+      return self.aslist() == other
+    return (isinstance(other, Node) and self.tag == other.tag and
+            self.attrs == other.attrs and self.children == other.children)
+
+  def __hash__(self):
+    return hash((self.tag, self.children))
+
+  def __reduce__(self):
+    return Node, (self.tag, self.attrs, self.children)
+
+  def __len__(self):
+    return 1 + (self.attrs is not None) + len(self.children)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return self.aslist()[i]
+    n = len(self)
+    if i < 0:
+      i += n
+    if not 0 <= i < n:
+      raise IndexError('Node index out of range')
+    if i == 0:
+      return self.tag
+    if self.attrs is not None:
+      if i == 1:
+        return self.attrs
+      i -= 1
+    return self.children[i - 1]
+
+  def __repr__(self):
+    return f'Node({self.tag!r}, {self.attrs!r}, {self.children!r})'
+
+  def aslist(self) -> list:
+    """This node as a cottonmouth list, with the children left as they are."""
+    return [self.tag, *(() if self.attrs is None else (self.attrs,)), *self.children]
+
+
+_end = object()
+# `attrs` of every node that was given an empty attribute dict.
+NO_ATTRS = {}
+
+def tonode(html, elem=None):
+  """
+  Converts html the way the parser returns it (cottonmouth lists, `(elem, html)`
+  tuples, generators, maps, in any mix) to `Node`s, in one pass. This does the
+  job of `unwind` and `unpack` together. Lists of tags with no tag of their own
+  stay lists, and strings are left as they are.
+  """
+  def step(html, elem=None):
+    while isinstance(html, tuple):
+      elem, html = html[0], html[1]
+    # strings are most of the leaves, and `istag` is slow to say no to them.
+    if isinstance(html, str) or not (isinstance(html, list) or istag(html)):
+      return None, html
+
+    it = iter(html)
+    head = next(it, _end)
+    if head is _end:
+      return None, []
+    if not isinstance(head, str):
+      return t.cons(head, it), list
+
+    first = next(it, _end)
+    if first is _end:
+      return None, Node(head, None, (), elem)
+    if isinstance(first, dict):
+      attrs = first or NO_ATTRS
+      return it, lambda children: Node(head, attrs, tuple(children), elem)
+    return t.cons(first, it), lambda children: Node(head, None, tuple(children), elem)
+  children, build = step(html, elem)
+  return build if children is None else foldtree(children, step, build)
+
+
+def tolist(html, meta=False):
+  """
+  Compatibility adapter for code that wants cottonmouth lists: turns every
+  `Node` in `html` back into a list. `(elem, html)` tuples are kept.
+  :param meta: give the nodes that an element made as `(elem, html)` tuples
+  too, the annotated form that `parseinline` returns.
+  """
+  def step(html):
+    elem = None
+    if isinstance(html, tuple):
+      elem, html = html
+      if not isinstance(html, Node):
+        return [html], lambda children: (elem, children[0])
+    elif isinstance(html, Node) and meta:
+      elem = html.elem
+    if isinstance(html, Node):
+      head = [html.tag] if html.attrs is None else [html.tag, html.attrs]
+      if elem is None:
+        return html.children, lambda children: head + children
+      return html.children, lambda children: (elem, head + children)
+    if isinstance(html, list):
+      return html, list
+    return None, html
+  return foldtree(html, step)
+
+
+def iscomponent(tag: str) -> bool:
+  """Whether `tag` (without ids and classes) is a component in the "AST", ie, it starts with a capital."""
+  return 'A' <= tag[:1] <= 'Z'
+
+
+def ast_attrs(idsclasses: Mapping[str, str], attrs: Mapping[str, str]) -> dict:
+  """
+  The attrs of an "AST" element: the ids and classes from the tag name are merged into `attrs`,
+  empty attributes are dropped, and a dict style becomes a css string.
+  """
+  attrs = dict(attrs)
+  attrs['id'] = (attrs.get('id', '') + ' ' + idsclasses.get('id', '')).strip()
+  attrs['class'] = (attrs.get('class', '') + ' ' + idsclasses.get('class', '')).strip()
+  # remove the empty attributes to avoid clutter and save bytes.
+  attrs = dict(t.valfilter(lambda x: not (isinstance(x, str) and x.strip() == ''), attrs))
+  # special handling for the "style" attribute, since that can be a dictionary
+  return t.valmap(lambda val:' '.join('{}: {};'.format(k,v) for k,v in val.items())
+                  if isinstance(val, dict) else val,
+                  attrs)
+
 
 def assemble_ast(tag:str, idsclasses: Mapping[str, str], attrs: Mapping[str, str], body: list):
   """
@@ -233,17 +600,8 @@ def assemble_ast(tag:str, idsclasses: Mapping[str, str], attrs: Mapping[str, str
   :param body:
   :return:
   """
-  iscomponent = re.match(r'^[A-Z]', tag)
-  attrs['id'] = (attrs.get('id', '') + ' ' + idsclasses.get('id', '')).strip()
-  attrs['class'] = (attrs.get('class', '') + ' ' + idsclasses.get('class', '')).strip()
-  # remove the empty attributes to avoid clutter and save bytes.
-  attrs = dict(t.valfilter(lambda x: not (isinstance(x, str) and x.strip() == ''), attrs))
-  # special handling for the "style" attribute, since that can be a dictionary
-  attrs = t.valmap(lambda val:' '.join('{}: {};'.format(k,v) for k,v in val.items())
-                   if isinstance(val, dict) else val,
-                   attrs)
-  
-  if iscomponent:
+  attrs = ast_attrs(idsclasses, attrs)
+  if iscomponent(tag):
     return {'name': tag, 'props': attrs, 'children': body}
   else:
     return {'tag': tag, 'attrs': attrs, 'body': body}
@@ -260,31 +618,51 @@ def template_to_ast(html):
   Eg, in Elm this makes things a lot easier.
   
   """
-  if isinstance(html, str): return html
-  if isinstance(html, list):
-    hasattrs = len(html) > 1 and isinstance(html[1], dict)
-    tag, idsclasses = parsetag(html[0])
-    # combine attrs with idsclasses in the tag name. only modifies these two properties explicitly, so that
-    # other attrs and data for components is untouched.
-    attrs = html[1] if hasattrs else {}
-    return assemble_ast(tag, idsclasses, attrs, [template_to_ast(x) for x in html[(2 if hasattrs else 1):] if x is not None])
-  
-  if istag(html):
-    tag,html = t.peek(html)
-    if istag(tag):
-      return map(template_to_ast, html)
-    # this looks confusing, but it's to leave the generator at the right place,
-    # and also extract the tag and attrs.
-    # because I have to check the type of the next element, and optionally consume it if it's the right one
-    # I end up assigning next(html) to a particular variable twice.
-    tag, idsclasses = parsetag(next(html))
-    try:
-      attrs, html = t.peek(html)
-      attrs = next(html) if isinstance(attrs, dict) else {}
-    except StopIteration:
-      attrs = {}
-      html = iter([])
-    return assemble_ast(tag, idsclasses, attrs, [template_to_ast(x) for x in html if x is not None])
-  
-  else: raise ValueError('template_to_ast: Cannot convert the following type of value: ' + str(html))
+  def step(html):
+    if isinstance(html, str): return None, html
+    if isinstance(html, Node):
+      tag, idsclasses = parsetag(html.tag)
+      attrs = dict(html.attrs or {})
+      return ((x for x in html.children if x is not None),
+              lambda body: assemble_ast(tag, idsclasses, attrs, body))
+    if isinstance(html, list):
+      hasattrs = len(html) > 1 and isinstance(html[1], dict)
+      tag, idsclasses = parsetag(html[0])
+      # combine attrs with idsclasses in the tag name. only modifies these two properties explicitly, so that
+      # other attrs and data for components is untouched.
+      attrs = html[1] if hasattrs else {}
+      return ((x for x in html[(2 if hasattrs else 1):] if x is not None),
+              lambda body: assemble_ast(tag, idsclasses, attrs, body))
+
+    if istag(html):
+      tag,html = t.peek(html)
+      if istag(tag):
+        return None, map(template_to_ast, html)
+      # this looks confusing, but it's to leave the generator at the right place,
+      # and also extract the tag and attrs.
+      # because I have to check the type of the next element, and optionally consume it if it's the right one
+      # I end up assigning next(html) to a particular variable twice.
+      tag, idsclasses = parsetag(next(html))
+      try:
+        attrs, html = t.peek(html)
+        attrs = next(html) if isinstance(attrs, dict) else {}
+      except StopIteration:
+        attrs = {}
+        html = iter([])
+      return ((x for x in html if x is not None),
+              lambda body: assemble_ast(tag, idsclasses, attrs, body))
+
+    else: raise ValueError('template_to_ast: Cannot convert the following type of value: ' + str(html))
+  return foldtree(html, step)
   
+
+def hasleaf(html, leaf: str) -> bool:
+  """Whether the string `leaf` is one of the leaves of cottonmouth style `html`."""
+  stack = [html]
+  while stack:
+    html = stack.pop()
+    if isinstance(html, str):
+      if html == leaf: return True
+    elif isinstance(html, Node): stack.extend(html.children)
+    elif isinstance(html, (list, tuple)): stack.extend(html)
+  return False
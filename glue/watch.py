@@ -0,0 +1,213 @@
+# Watching a directory of documents, and rebuilding the outputs of the ones
+# that change, in one long running process. The registry (and everything the
+# parser has worked out from it) stays loaded between rebuilds, so an edit
+# costs a conversion, not a new interpreter and all of its imports.
+#
+# Files are polled for changes to their modification time or size, so this
+# needs nothing outside the standard library.
+
+import importlib
+import os
+import os.path as path
+import sys
+import time
+import regex as re
+
+from glue.build import convertfile, outputs
+from glue.elements import Block, Inline
+from glue.library import Standard
+
+# the extensions of the documents that are watched.
+SOURCE_EXTENSIONS = ('.glu',)
+
+
+def scan(roots, extensions=SOURCE_EXTENSIONS, exclude=()) -> dict:
+  """
+  The documents under the directories `roots`, skipping the directories in
+  `exclude` (eg, where the outputs go).
+  :return: dict of path to `(modification time, size)`.
+  """
+  exclude = {path.abspath(d) for d in exclude}
+  files = {}
+  for root in roots:
+    for directory, dirs, names in os.walk(root):
+      dirs[:] = [d for d in dirs if path.abspath(path.join(directory, d)) not in exclude]
+      for name in names:
+        if name.endswith(extensions):
+          f = path.join(directory, name)
+          try:
+            st = os.stat(f)
+          except FileNotFoundError:
+            continue
+          files[f] = (st.st_mtime_ns, st.st_size)
+  return files
+
+
+def changed_elements(old, new):
+  """
+  The elements that are different between the registries `old` and `new`
+  (from either of them), by comparing their `fingerprints`, as `(key, element)`
+  pairs, along with the blocks that parse an inline element whose escapes or
+  subscriptions changed (see `reaches`). None means that everything could have
+  changed: the top block (or an inline element it parses) or the order of the
+  elements.
+  """
+  a, b = old.fingerprints, new.fingerprints
+  if a.get(old.TOP) != b.get(new.TOP) or [k for k in a if k in b] != [k for k in b if k in a]:
+    return None
+  before = [(k, old[k]) for k in a if a[k] != b.get(k)]
+  after = [(k, new[k]) for k in b if b[k] != a.get(k)]
+  changed = before + after
+
+  # an inline element's escapes, and what it nests, change how the text of
+  # every block it's parsed in reads (eg, whether `\*` is unescaped), not just
+  # the text it matches.
+  for registry, other, pairs in ((old, new, before), (new, old, after)):
+    for k, e in pairs:
+      if reaches(e, other.get(k)):
+        for pair in subscribers(registry, e):
+          if pair[0] == registry.TOP:
+            return None
+          if pair not in changed:
+            changed.append(pair)
+  return changed
+
+def reaches(e, other) -> bool:
+  """
+  Whether the change from the element `e` to `other` (None if it's gone)
+  reaches past the text `e` matches: an inline element whose escapes or
+  subscriptions are different.
+  """
+  if not isinstance(e, Inline):
+    return False
+  if other is None:
+    return bool(e.escape)
+  names = lambda sub: [x if isinstance(x, str) else x.name for x in sub]
+  return set(e.escape) != set(other.escape) or names(e.sub) != names(other.sub)
+
+def subscribers(registry, elem: Inline) -> list:
+  """
+  The blocks of `registry` that `elem` is parsed in, directly or inside the
+  inline elements they subscribe to, as `(key, block)` pairs.
+  """
+  pairs = []
+  for k, b in registry.items():
+    if not isinstance(b, Block):
+      continue
+    seen, stack = set(), [(x, b) for x in registry.subscriptions(b)[0]]
+    while stack:
+      x, parent = stack.pop()
+      if x is elem:
+        pairs.append((k, b))
+        break
+      if (id(x), id(parent)) not in seen:
+        seen.add((id(x), id(parent)))
+        stack.extend((y, x) for y in registry.subscriptions(x, parent)[0])
+  return pairs
+
+def uses(text: str, elements) -> bool:
+  """
+  Whether `text` might use any of `elements`, `(key, element)` pairs: a block
+  whose `---key` starts a line (documents name blocks by their key in the
+  registry), or an inline element whose regex matches somewhere.
+  """
+  for k, e in elements:
+    if isinstance(e, Block) and re.search(r'^---' + re.escape(k) + r'(?![\w\-])', text, re.M):
+      return True
+    if isinstance(e, Inline) and e.regex.search(text):
+      return True
+  return False
+
+
+class Watcher:
+  """
+  Keeps the outputs of the documents under `roots` (see `build`) up to date.
+  Each `poll` converts the documents that were added or changed since the last
+  one (all of them, the first time), and removes the outputs of deleted ones.
+
+  With a registry `module`, its file is watched too: when it changes, the
+  module is reloaded, and only the documents that might use an element that's
+  different in the new registry are converted again.
+  """
+  def __init__(self, roots, languages=('html',), out: str='.', module: str=None,
+               cache: str=None, extensions=SOURCE_EXTENSIONS):
+    self.roots = list(roots)
+    self.languages = list(languages)
+    self.out = out
+    self.cache = cache
+    self.extensions = extensions
+    self.root = path.commonpath([path.abspath(r) for r in self.roots])
+    self.module = importlib.import_module(module) if module else None
+    self.registry = self.module.registry if self.module else Standard
+    self.modulestat = self.stat(self.module)
+    self.files = {}
+
+  @staticmethod
+  def stat(module):
+    if module is None or not getattr(module, '__file__', None):
+      return None
+    st = os.stat(module.__file__)
+    return st.st_mtime_ns, st.st_size
+
+  def reload(self):
+    """
+    Reloads the registry module if its file has changed.
+    :return: the elements that changed (see `changed_elements`), or [] if nothing did.
+    """
+    modulestat = self.stat(self.module)
+    if modulestat == self.modulestat:
+      return []
+    self.modulestat = modulestat
+    importlib.invalidate_caches()
+    old = self.registry
+    self.registry = importlib.reload(self.module).registry
+    return changed_elements(old, self.registry)
+
+  def poll(self):
+    """
+    Brings the outputs up to date.
+    :return: list of `(file, error)` for each file that was converted, where
+    error is a description of what went wrong, or None.
+    """
+    results = []
+    try:
+      elements = self.reload()
+    except Exception as e:
+      # keep the registry that worked, and try again when the module changes.
+      results.append((self.module.__file__, '{}: {}'.format(type(e).__name__, e)))
+      elements = []
+
+    files = scan(self.roots, self.extensions, exclude=[d for d in (self.out, self.cache) if d is not None])
+    for f in self.files.keys() - files.keys():
+      for target in outputs(f, self.languages, self.out, self.root).values():
+        if path.exists(target):
+          os.remove(target)
+
+    for f, st in sorted(files.items()):
+      if elements is None or self.files.get(f) != st or (elements and self.affected(f, elements)):
+        try:
+          convertfile(self.registry, f, self.languages, self.out, self.root, self.cache,
+                      self.registry.fingerprint if self.cache is not None else None)
+          results.append((f, None))
+        except Exception as e:
+          results.append((f, '{}: {}'.format(type(e).__name__, e)))
+    self.files = files
+    return results
+
+  @staticmethod
+  def affected(file: str, elements) -> bool:
+    try:
+      with open(file) as f:
+        return uses(f.read(), elements)
+    except (OSError, UnicodeDecodeError):
+      return True
+
+  def run(self, interval: float=0.5, log=sys.stderr):
+    """Polls every `interval` seconds, until interrupted, writing what happened to `log`."""
+    try:
+      while True:
+        for f, error in self.poll():
+          print(f'{f}: {error}' if error else f'built {f}', file=log, flush=True)
+        time.sleep(interval)
+    except KeyboardInterrupt:
+      pass
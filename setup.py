@@ -10,6 +10,6 @@ setup(
   url="https://github.com/vshesh/glue",
   packages=['glue', 'test'],
   license='GPLv3',
-  install_requires=['regex', 'libsass', 'simplejson', 'toolz', 'ruamel.yaml', 'inflection', 'bs4']
+  install_requires=['regex', 'libsass', 'simplejson', 'toolz', 'ruamel.yaml', 'inflection']
 )
 
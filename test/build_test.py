@@ -0,0 +1,59 @@
+import pytest
+
+from glue.library import Standard
+from glue.codegen import toprettyhtml, toelm
+from glue.build import *
+
+TEXT = 'Some *bold* and a [link](http://a.com).\n\nMore _text_.\n'
+
+@pytest.fixture
+def docs(tmp_path):
+  (tmp_path / 'docs' / 'sub').mkdir(parents=True)
+  files = [tmp_path / 'docs' / 'one.glu', tmp_path / 'docs' / 'sub' / 'two_things.glu']
+  for f in files:
+    f.write_text(TEXT)
+  return tmp_path, [str(f) for f in files]
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_build(docs, workers):
+  tmp, files = docs
+  out = tmp / 'site'
+  assert list(build(Standard, files, ['html', 'elm'], str(out), workers)) == [(f, None) for f in files]
+  assert (out / 'one.html').read_text() == toprettyhtml(Standard, TEXT) + '\n'
+  assert (out / 'sub' / 'two_things.elm').read_text() == component('elm', 'TwoThings', toelm(Standard, TEXT)) + '\n'
+
+def test_build_failures(docs):
+  tmp, files = docs
+  bad = tmp / 'docs' / 'bad.glu'
+  bad.write_bytes(b'\xff\xfe')
+  results = list(build(Standard, [files[0], str(bad), files[1]], ['html'], str(tmp / 'site'), 2))
+  assert [f for f, error in results] == [files[0], str(bad), files[1]]
+  assert results[0][1] is None and results[2][1] is None
+  assert results[1][1].startswith('UnicodeDecodeError')
+  assert not (tmp / 'site' / 'bad.html').exists()
+
+def test_build_languages(docs):
+  with pytest.raises(ValueError):
+    build(Standard, docs[1], ['html', 'latex'])
+
+def test_build_cache(docs, monkeypatch):
+  import glue.build
+  tmp, files = docs
+  out, cache = str(tmp / 'site'), str(tmp / 'cache')
+  assert all(e is None for f, e in build(Standard, files, ['html', 'mithril'], out, 1, cache=cache))
+  html = (tmp / 'site' / 'one.html').read_text()
+
+  converted = []
+  real = glue.build.convert
+  monkeypatch.setattr(glue.build, 'convert', lambda r, s, languages, name: converted.append(languages) or real(r, s, languages, name))
+  (tmp / 'site' / 'one.html').unlink()
+  assert all(e is None for f, e in build(Standard, files, ['html', 'mithril'], out, 1, cache=cache))
+  assert converted == [] and (tmp / 'site' / 'one.html').read_text() == html
+
+  (tmp / 'docs' / 'one.glu').write_text(TEXT + '\nAnother paragraph.\n')
+  list(build(Standard, files, ['html', 'mithril', 'elm'], out, 1, cache=cache))
+  assert converted == [['html', 'mithril', 'elm'], ['elm']]
+
+  from glue.elements import SingleGroupInline
+  list(build(Standard + [SingleGroupInline('custom', '%%', '%%', 'span')], files, ['html'], out, 1, cache=cache))
+  assert converted[2:] == [['html'], ['html']]
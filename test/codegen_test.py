@@ -3,7 +3,7 @@ from hypothesis import given
 from hypothesis.strategies import text, integers
 import string
 
-from glue.util import unwind
+from glue.util import unwind, tonode
 from glue.codegen import *
 
 def test_render_imba_attrs_empty():
@@ -20,4 +20,57 @@ def test_render_imba_attrs_double(t, t2):
 
 @given(text())
 def test_render_imba_attrs_style(t):
-  assert render_imba_attrs({'style': {t: 1}}) == f'[{t}:1] '
\ No newline at end of file
+  assert render_imba_attrs({'style': {t: 1}}) == f'[{t}:1] '
+
+def test_render_deep():
+  html = 'leaf'
+  for _ in range(10000):
+    html = ['div', html]
+  assert render_mithril(html) == "m('div', " * 10000 + "'leaf'" + ')' * 10000
+  assert render_imba(html).splitlines()[-1] == '\t' * 10000 + "'leaf'"
+  assert render_mithril(tonode(html)) == render_mithril(html)
+
+def test_render_elm():
+  assert render_elm(['div', {'id': 'x', 'style': {'a': 1}}, 'text', ['br']]) == (
+    'Html.node "div" [attribute "id" "x", attribute "style" "a:1;"] [text "text", Html.node "br" [] []]')
+
+def test_emitters_read_parser_output():
+  html = lambda: ('Block', ['div', ('Bold', ['strong', {}, 'a']), (x for x in ['p', 'b'])])
+  assert render_mithril(html()) == "m('div', m('strong', {}, 'a'), m('p', 'b'))"
+  assert render_imba(html()) == "<div>\n\t<strong >\n\t\t'a'\n\t<p>\n\t\t'b'"
+
+def test_js_literal():
+  assert js_literal({'a': 'True story', 'b': None, 'c': [1, (2, 3)], 'd': False}) == (
+    '{"a": "True story", "b": null, "c": [1, [2, 3]], "d": false}')
+  assert js_literal('a b') == '"a\\u2028b"'
+  assert render_mithril(['p', {'title': 'False alarm', 'style': {'a': 1}}, 'x']) == (
+    'm(\'p\', {"title": "False alarm", "style": "a:1;"}, \'x\')')
+  # uppercase components format their props like tags do.
+  assert render_mithril(['Chart', {'style': {'a': 1}, 'live': True}]) == (
+    'm(Chart, {"style": "a:1;", "live": true})')
+
+def test_render_ast():
+  from glue.library import Standard
+  from glue.util import template_to_ast
+  import io
+  html = ['div#x.y', {'style': {'a': 1}}, None, 'a "b"', ['Chart', {'k': [1, None]}], ['br']]
+  assert render_ast(html) == js_literal(template_to_ast(html)) == (
+    '{"tag": "div", "attrs": {"style": "a: 1;", "id": "x", "class": "y"}, "body": ["a \\"b\\"", '
+    '{"name": "Chart", "props": {"k": [1, null]}, "children": []}, {"tag": "br", "attrs": {}, "body": []}]}')
+  text = 'Some *bold* and a [link](http://a.com).\n\nMore _text_.\n'
+  assert toast(Standard, text) == js_literal(template_to_ast(tonode(parse(Standard, text))))
+  assert ''.join(streamast(Standard, io.StringIO(text))) == toast(Standard, text)
+  deep = 'leaf'
+  for _ in range(10000):
+    deep = ['div', deep]
+  assert render_ast(deep).count('"body": [') == 10000
+
+def test_tomany():
+  from glue.library import Standard
+  text = 'Some *bold* and a [link](http://a.com).\n\nMore _text_.\n'
+  code = tomany(Standard, text, ['html', 'mithril', 'elm', 'ast'])
+  assert list(code) == ['html', 'mithril', 'elm', 'ast']
+  assert code == {'html': toprettyhtml(Standard, text), 'mithril': tomithril(Standard, text),
+                  'elm': toelm(Standard, text), 'ast': toast(Standard, text)}
+  with pytest.raises(ValueError):
+    tomany(Standard, text, ['html', 'latex'])
@@ -3,7 +3,9 @@
 # note, html.py is copied from cottonmouth, so the tests are not *that*
 # rigorous. I copied the unittest test case from cottonmouth.py as well.
 
+import io
 import unittest
+from unittest import mock
 
 from glue.html import *
 from bs4 import BeautifulSoup
@@ -102,6 +104,113 @@ class TestHTML(unittest.TestCase):
     assert render(['tag', {'class': 'name'}]) == u'<tag class="name"></tag>'
     assert render(['tag', {'class': ['name']}]) == u'<tag class="name"></tag>'
 
+  def test_deep_nesting(self):
+    html = 'leaf'
+    for _ in range(10000):
+      html = ['div', {}, html]
+    self.assertEqual(render(html), '<div>' * 10000 + 'leaf' + '</div>' * 10000)
+    html = ['br']
+    for _ in range(10000):
+      html = [html, 'text']
+    self.assertEqual(render(['p', html]), '<p><br>' + 'text' * 10000 + '</p>')
+
+  def test_render_chunks(self):
+    html = ['ul', *(['li', str(i)] for i in range(100))]
+    chunks = list(render_chunks(html, size=50))
+    self.assertEqual(''.join(chunks), render(html))
+    self.assertTrue(all(len(c) >= 50 for c in chunks[:-1]))
+    self.assertTrue(all(len(c) < 50 + len('<li>99</li>') for c in chunks))
+    self.assertEqual(b''.join(render_chunks(['p', 'ü'], encoding='utf-8')), '<p>ü</p>'.encode('utf-8'))
+    self.assertEqual(list(render_chunks(['p', ''])), ['<p></p>'])
+
+  def test_render_file(self):
+    html = ['ul', *(['li', str(i)] for i in range(100))]
+    text, binary = io.StringIO(), io.BytesIO()
+    render_file(text, html, size=10)
+    render_file(binary, ['p', 'ü'])
+    self.assertEqual(text.getvalue(), render(html))
+    self.assertEqual(binary.getvalue(), '<p>ü</p>'.encode('utf-8'))
+
+  def test_render_pretty(self):
+    self.assertEqual(
+      render_pretty(['div', ['h1', 'Title'], ['p', 'some ', ['strong', 'bold'], ' text'],
+                     '\n', ['#quote', ['p', 'a'], 'tail']]),
+      '<div>\n'
+      '  <h1>Title</h1>\n'
+      '  <p>some <strong>bold</strong> text</p>\n'
+      '  <div id="quote">\n'
+      '    <p>a</p>\n'
+      '    tail\n'
+      '  </div>\n'
+      '</div>')
+
+  def test_render_pretty_preformatted(self):
+    self.assertEqual(render_pretty(['div', ['pre', ['code', 'a\n  b\n']], ['textarea', ' x ']]),
+                     '<div>\n  <pre><code>a\n  b\n</code></pre>\n  <textarea> x </textarea>\n</div>')
+    self.assertEqual(render_pretty(['p', 'a'], ['p', 'b']), '<p>a</p>\n<p>b</p>')
+
+  def test_render_pretty_phrasing(self):
+    # critic markup's ins and del, and the obsolete inline tags, stay in the text.
+    from glue.library import Standard
+    from glue.parser import parse
+    self.assertEqual(render_pretty(parse(Standard, 'a{++b++}c {--d--}e')),
+                     '<div>\n  <p>a<ins>b</ins>c <del>d</del>e</p>\n</div>')
+    self.assertEqual(render_pretty(['p', 'x', ['strike', 'b'], 'y', ['tt', 'c'], ['font', 'd'], ['nobr', 'e']]),
+                     '<p>x<strike>b</strike>y<tt>c</tt><font>d</font><nobr>e</nobr></p>')
+
+  def test_render_minified_attributes(self):
+    self.assertEqual(
+      render_minified(['input#', {'class': '', 'checked': True, 'disabled': False, 'type': 'radio',
+                                  'title': 'a b', 'alt': 'say "hi"', 'style': {'margin': '0 auto', 'flex': 1}}]),
+      '<input checked type=radio title="a b" alt=\'say "hi"\' style="margin:0 auto;flex:1">')
+
+  def test_render_minified_closing_tags(self):
+    self.assertEqual(render_minified(['ul', ['li', 'a'], ['li', 'b']], ['p', 'c']),
+                     '<ul><li>a<li>b</ul><p>c</p>')
+    self.assertEqual(render_minified(['div', ['p', 'a'], ['p', 'b'], ['div', 'c'], ['p', 'd'], ['span', 'e']]),
+                     '<div><p>a<p>b<div>c</div><p>d</p><span>e</span></div>')
+    self.assertEqual(render_minified(['a', ['p', 'a']], ['div', ['p', 'b'], ' ']),
+                     '<a><p>a</p></a><div><p>b</p> </div>')
+    self.assertEqual(render_minified(['dl', ['dt', 'a'], ['dd', 'b'], ['dt', 'c']]),
+                     '<dl><dt>a<dd>b<dt>c</dt></dl>')
+    self.assertEqual(render_minified(['table', ['tbody', ['tr', ['td', 1], ['th', 2]], ['tr', ['td', 3]]]]),
+                     '<table><tbody><tr><td>1<th>2<tr><td>3</table>')
+
+
+class TestFastHTML(TestHTML):
+  """All of the above, with `render_fast` as `render`."""
+  def setUp(self):
+    patcher = mock.patch.dict(globals(), render=render_fast)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_same_as_render(self):
+    from glue.library import Standard
+    from glue.parser import parse
+    text = ''.join(f'# Title {i}\n\nSome *bold* text, a [link](u) and `code`.\n'
+                   f'![image](/a.png)\n\n---blockquote\nA _quote_.\n...\n' for i in range(20))
+    html = parse(Standard, text)
+    self.assertEqual(render_fast(html), ''.join(render_content(parse(Standard, text))))
+
+  def test_attribute_cache(self):
+    self.assertEqual(render_fast(['p', {'a': True}], ['p', {'a': 1}], ['p', {'style': {'a': 1.0}}]),
+                     '<p a="True"></p><p a="1"></p><p style="a:1.0;"></p>')
+    self.assertEqual(render_fast(['p.x', {'class': ['y']}], ['p.x', {'class': ['y']}]),
+                     '<p class="y x"></p><p class="y x"></p>')
+
+  def test_styled_openings_are_cached(self):
+    from glue.html import _openings
+    from glue.library import Standard
+    from glue.parser import parse
+    _openings.clear()
+    html = render_fast(parse(Standard, '![image](/a.png)'))
+    self.assertIn('style="', html)
+    styled = [k for k in _openings if any(v[0] is dict for _, v in k[1:])]
+    self.assertTrue(styled)
+    self.assertEqual(render_fast(['p', {'style': {'a': 1, 'b': 2}}], ['p', {'style': {'b': 2, 'a': 1}}],
+                                 ['p', {'style': {'a': True}}]),
+                     '<p style="a:1;b:2;"></p><p style="b:2;a:1;"></p><p style="a:True;"></p>')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -2,7 +2,7 @@ import pytest
 
 from glue.parser import *
 from glue.library import Bold, Italic, Monospace, Link, Paragraphs, Standard, block, inline
-from glue.util import unwind
+from glue.util import unwind, Node
 
 sample = Registry(Bold, Italic, Monospace, Paragraphs)
 
@@ -25,6 +25,30 @@ def test_parseinline_nosub(s: str):
   assert parseinline(sample, Paragraphs, s) == [s]
 
 
+def test_parse_nodes():
+  # the parser builds nodes as it goes, with the elements that made them.
+  (elem, html), = parseinline(sample, Paragraphs, '*`text`*', nodes=True)
+  assert elem is Bold and isinstance(html, Node) and html.elem is Bold
+  assert html.children[0].elem is Monospace and html.children[0] == ['code', {}, 'text']
+  text = 'a *b*\n---blockquote.x\nb\n...\n'
+  node = parse(Standard, text, nodes=True)
+  quote = node[2]
+  assert isinstance(quote, Node) and quote.tag == 'div.blockquote.x' and quote.elem is Standard['blockquote']
+  assert node == unwind(parse(Standard, text))
+
+
+def test_parse_lists():
+  import json, pickle
+  # nodes don't get out of the parser unless they're asked for.
+  text = '# T\n\nSome *b* `c`.\n\n---blockquote\nq *c*\n...\n'
+  html = unwind(parse(Standard, text))
+  assert json.loads(json.dumps(html)) == html
+  assert pickle.loads(pickle.dumps(html)) == html
+  assert 'Node' not in repr(html)
+  assert unwind(list(parsestream(Standard, text.splitlines(True)))) == html
+  assert 'Node' not in repr(unwind(ParseSession(Standard).parse(text)[0]))
+
+
 def test_parseinline_basic():
   assert parseinline(sample, Paragraphs, '*text*') == [(Bold, ['strong', {}, 'text'])]
   assert parseinline(sample, Paragraphs, '*`text`*') == [
@@ -54,9 +78,101 @@ def test_parseinline_none():
                      '@*bold* _italic_ abc@') == [(InlineNone, ['p', '*bold* _italic_ abc'])]
 
 
+def test_parseinline_dispatch():
+  @inline(r'@@', nest=Nesting.NONE, sub=[])
+  def NoGroups(groups):
+    return ['hr', str(len(groups))]
+
+  @inline(r'%(a)(b)?(c)%', nest=Nesting.NONE, sub=[])
+  def ManyGroups(groups):
+    return ['span', ''.join(g or '-' for g in groups)]
+
+  assert parseinline(sample + [NoGroups, ManyGroups], Paragraphs, '*x*@@%ac%_y_') == [
+    (Bold, ['strong', {}, 'x']), (NoGroups, ['hr', '0']),
+    (ManyGroups, ['span', 'a-c']), (Italic, ['em', {}, 'y'])]
+
+
 def test_parseinline_embedded():
   assert parseinline(sample, Paragraphs, 'text *bold* text') == ['text ', (Bold, ['strong', {}, 'bold']), ' text']
 
+
+def test_parseinline_matcher_cache():
+  r = Registry(Bold, Italic, Paragraphs)
+  matchers.reset_stats()
+  assert parseinline(r, Paragraphs, '*a* _b_') == [
+    (Bold, ['strong', {}, 'a']), ' ', (Italic, ['em', {}, 'b'])]
+  misses = matchers.misses
+  assert misses > 0
+
+  parseinline(r, Paragraphs, '*a* _b_')
+  assert matchers.misses == misses
+  assert matchers.hits > 0
+
+  # mutating the registry has to invalidate the compiled matchers.
+  r += [Monospace]
+  assert parseinline(r, Paragraphs, '`c`') == [(Monospace, ['code', {}, 'c'])]
+  assert matchers.misses > misses
+
+@given(text(alphabet='ab *_`~^{}[]()!\\#\n.<>:@MT'), integers(min_value=0, max_value=20))
+def test_matcher_buckets(s: str, pos: int):
+  matcher = matchers.get(Standard, Paragraphs)
+  assert matcher.buckets is not None
+  m, found = matcher.search(s, pos)
+  expected = matcher.patt.search(s, pos)
+  assert (m and m.span()) == (expected and expected.span())
+  if m is not None:
+    assert found.dispatch[m.lastindex][1] is matcher.dispatch[expected.lastindex][1]
+
+
+# the token based parser should agree with parseinline on everything that
+# isn't ambiguous syntax.
+@pytest.mark.parametrize('s', [
+  '', '**', '*text*', '*`text`*', '*text**text2*', 'text *bold* text', '*a _b* c_', '_a *b* c_',
+  '*a\n\nb*', r'*\**', r'\*a*', r'\\*a*', 'x ^{2} y _{3}', '__abc__', '{~~a~>b~~}',
+  '[link](http://google.com)', '[*link*](http://google.com)', 'T[text](tooltip)', '.[cls](text *b*)',
+  '{++add++} {--del--} {==hi==}{>>c<<}', '<span.x: hello *b*>', '# Header ![img](imgurl)', '# h1\n## h2',
+  # tokens that overlap the end of the frame they're in.
+  '^{x++}', '^{++}x]}', '^{x++} ++}', '*a *b* c*', '~{== [](](^{}==}{=={>>)'])
+def test_parseinline_tokens(s):
+  assert list(map(unpack, parseinline_tokens(Standard, Paragraphs, s))) == list(map(unpack, parseinline(Standard, Paragraphs, s)))
+  assert unwind(parse(Standard, s, inline=parseinline_tokens)) == unwind(parse(Standard, s))
+
+
+@given(words, words)
+def test_parseinline_tokens_nested(s1: str, s2: str):
+  s = '*{0} _{1} `{0}`_ {1}*'.format(s1, s2)
+  assert parseinline_tokens(sample, Paragraphs, s) == parseinline(sample, Paragraphs, s)
+
+
+def test_parseinline_tokens_unclosed():
+  assert parseinline_tokens(sample, Paragraphs, '*a _b') == ['*a _b']
+  assert parseinline_tokens(sample, Paragraphs, '*a _b*') == [(Bold, ['strong', {}, 'a _b'])]
+
+
+@pytest.mark.parametrize('s', [
+  '', r'\*a\*', r'\\*a*', r'*a\*b*', r'`a\`b`', r'\`a`', r'<b:x\>', r'\[a](b)', r'[a\](b)](c)',
+  r'\\', '\\', r'a\qb', '*text*', '*`text`*', 'text *bold* _it_ ^{2} __u__', '{~~a~>b~~}',
+  '[*link*](http://google.com)', 'T[text](tooltip)', '<span.x: hello *b*>', '# Header ![img](imgurl)',
+  # text with sentinel code points in it already.
+  '\U000F002A', '\U000F0041 *b\U000F005C* \\*', '[a\U000F005D](b)'])
+def test_parseinline_sentinel(s):
+  assert list(map(unpack, parseinline_sentinel(Standard, Paragraphs, s))) == list(map(unpack, parseinline(Standard, Paragraphs, s)))
+  assert unwind(parse(Standard, s, inline=parseinline_sentinel)) == unwind(parse(Standard, s))
+
+
+def test_sentinel_matcher():
+  matcher = SentinelMatcher([Bold, Monospace])
+  assert matcher.exact
+  assert ESCAPE_PREFIX not in matcher.patt.pattern
+  # escaped backslashes are paired off, so the star after them isn't escaped.
+  encoded = matcher.encode(r'\*a\\*')
+  assert '\\' not in encoded and encoded.count('*') == 1
+  assert matcher.raw((encoded,)) == (r'\*a\\*',)
+  assert matcher.unescape(encoded) == r'*a\\*'
+  # an element that matches a backslash can't be parsed this way.
+  Backslash = inline(r'\\\\')(lambda groups: ['br'])
+  assert not SentinelMatcher([Bold, Backslash]).exact
+
 # ------------------ PARSEBLOCK TESTS ----------------------------------------
 
 def test_parseblock_empty():
@@ -105,6 +221,11 @@ def test_parseblock_nestingpost():
   assert unwind(parseblock(Registry(IdentityBlock, Paragraphs), IdentityBlock,
                            'hello\n---paragraphs\nhello\n...\n')) == ['div', 'hello\n', ['div', ['p', 'hello']]]
 
+def test_parseblock_placeholder_text():
+  # text that looks like a placeholder is left alone.
+  assert unwind(parse(Standard, '*a* [|0|] b [||1||]\n')) == [
+    'div', ['p', ['strong', {}, 'a'], ' [|0|] b [||1||]']]
+
 # -------------- PARSE Inline Inside a Inline element with display: block
 
 def test_parse_header():
@@ -125,6 +246,90 @@ def test_regex_clash(s: str):
     'div', ['p', ['span', {'style': 'text-decoration:underline;'}, s]]]
 
 
+def test_parse_parallel():
+  doc = ('# Title\n\nsome *bold* text [link](url)\n---paragraphs\nnested\n...\n'
+         'more _text_ here\n---blockquote.quote\nquoted\n...\n') * 20
+  assert unwind(parse(Standard, doc, workers=2, chunksize=100)) == unwind(parse(Standard, doc))
+  # top blocks that aren't SUB are parsed serially.
+  Verbatim = block(nest=Nesting.NONE)(lambda text: ['pre', text])
+  assert parse(Registry(Verbatim), doc, Verbatim, workers=2, chunksize=100) == ['pre', doc]
+
+
+def test_placeholder_marks_in_text():
+  assert unwind(parse(Standard, 'icon \ue001 here')) == ['div', ['p', 'icon \ue001 here']]
+  doc = 'x \ue0001\ue000 y *b*\n\n\ue001 0\ue001\n\n---blockquote\n\ue000\ue001 *c*\n...\n'
+  assert unwind(parse(Standard, doc)) == [
+    'div', ['p', 'x \ue0001\ue000 y ', ['strong', {}, 'b']], ['p', '\ue001 0\ue001'],
+    ['div.blockquote', ['p', '\ue000\ue001 ', ['strong', {}, 'c']]]]
+  assert unwind(parse(Standard, doc * 10, workers=2, chunksize=20)) == unwind(parse(Standard, doc * 10))
+
+
+def test_parse_parallel_renamed():
+  # elements come back from the workers by their key, which isn't their name here.
+  renamed = (Standard - [Bold]) | {'strong-star': Bold, 'quote': Standard['blockquote']}
+  doc = '*x* para\n\n---quote\nq *r*\n...\n' * 50
+  html = unwind(parse(renamed, doc, workers=2, chunksize=64))
+  assert html == unwind(parse(renamed, doc))
+  assert html[1] == ['p', ['strong', {}, 'x'], ' para']
+
+
+def test_parsestream():
+  doc = ('# Title\n\nsome *bold* text [link](url)\n---paragraphs\nnested\n\nparagraphs\n...\n'
+         'more _text_ here\n\n\n---blockquote.quote\nquoted\n...\n\n\n\nend\n')
+  assert unwind(parsestream(Standard, doc.splitlines(True))) == unwind(parse(Standard, doc))
+  assert unwind(parsestream(Standard, [])) == unwind(parse(Standard, ''))
+
+
+def test_parsestream_lazy():
+  read = []
+  def lines():
+    for line in ['first\n', '\n', 'second\n', '\n', 'third\n']:
+      read.append(line)
+      yield line
+
+  html = parsestream(Standard, lines())
+  assert next(html) == 'div'
+  assert unwind(next(html)) == ['p', 'first']
+  assert len(read) == 3
+
+
+# ------------- ParseSession test
+
+def test_parsesession():
+  doc = '# Title\n\nsome *bold* text\n---paragraphs\nnested\n...\nmore _text_ here\n'
+  session = ParseSession(Standard)
+  html, changed = session.parse(doc)
+  assert unwind(html) == unwind(parse(Standard, doc))
+  assert changed == [0, 1, 2]
+
+  edit = doc.replace('more', 'less')
+  html, changed = session.parse(edit)
+  assert unwind(html) == unwind(parse(Standard, edit))
+  assert changed == [2]
+
+  # moving chunks around doesn't need a parse
+  swap = 'less _text_ here\n---paragraphs\nnested\n...\n'
+  html, changed = session.parse(swap)
+  assert unwind(html) == unwind(parse(Standard, swap))
+  assert changed == []
+
+
+def test_parsesession_registry_change():
+  reg = Registry(Paragraphs, Bold, top=Paragraphs)
+  session = ParseSession(reg)
+  assert session.parse('*a* _b_')[1] == [0]
+  reg += [Italic]
+  html, changed = session.parse('*a* _b_')
+  assert changed == [0]
+  assert unwind(html) == ['div', ['p', ['strong', {}, 'a'], ' ', ['em', {}, 'b']]]
+
+
+def test_parsesession_not_sub():
+  session = ParseSession(Registry(IdentityBlock), IdentityBlock)
+  assert session.parse('hello')[1] == [0]
+  assert session.parse('hello')[1] == []
+
+
 # ------------- MACROExpand test
 
 @given(words)
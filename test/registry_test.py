@@ -24,6 +24,20 @@ def test_registry_subscriptions():
   assert set(r.inline_subscriptions([Bold.name, Monospace.name])) == {Bold, Monospace}
   assert set(r.inline_subscriptions([])) == set()
   assert set(r.inline_subscriptions(['inherit'], Paragraphs)) == {Monospace, Italic, Bold}
+  assert set(r.block_subscriptions(['all'])) == {Paragraphs}
+  assert set(r.block_subscriptions([Bold.name, Paragraphs.name])) == {Paragraphs}
+
+
+def test_registry_subscription_table():
+  r = Registry(Monospace, Italic, Paragraphs)
+  inline, blocks = r.subscriptions(Paragraphs)
+  assert set(inline) == {Monospace, Italic} and blocks == (Paragraphs,)
+  assert r.subscriptions(Paragraphs) is r.subscriptions(Paragraphs)
+  assert r.all_inline is r.all_inline
+
+  r += [Bold]
+  assert set(r.subscriptions(Paragraphs)[0]) == {Monospace, Italic, Bold}
+  assert set(r.subscriptions(Bold, Paragraphs)[0]) == {Monospace, Italic, Bold}
 
 
 def test_registry_merge():
@@ -106,4 +120,91 @@ def test_registry_validate():
   r2 = Registry(NoopBlock, top=NoopBlock)
   assert r2.validate() == True
   r2 = Registry(NoopBlock, Monospace, top=NoopBlock)
-  assert r2.validate() == True
\ No newline at end of file
+  assert r2.validate() == True
+
+def test_registry_version():
+  r = Registry(Monospace, Italic, Bold, Paragraphs)
+  v = r.version
+  r.cache['x'] = 1
+
+  r |= {'monospace': {'escape': '!'}}
+  assert r.version != v
+  assert r.cache == {}
+
+  v = r.version
+  r -= [Italic]
+  assert r.version != v
+
+  v = r.version
+  r += [Italic]
+  assert r.version != v
+
+  c = r + [Link]
+  assert c.version != r.version
+
+
+def test_registry_mutators_touch():
+  from glue.parser import parse
+  from glue.util import unwind
+  r = Registry(Monospace, Italic, Bold, Paragraphs, top=Paragraphs)
+  assert unwind(parse(r, '*a*')) == ['div', ['p', ['strong', {}, 'a']]]
+  r.pop('bold')
+  assert unwind(parse(r, '*a*')) == ['div', ['p', '*a*']]
+  for mutate in (lambda: r.update(bold=Bold), lambda: r.move_to_end('bold', last=False),
+                 lambda: r.setdefault('link', Link), lambda: r.popitem(), lambda: r.clear()):
+    v = r.version
+    r.cache['x'] = 1
+    mutate()
+    assert r.version != v and r.cache == {}
+
+
+def test_registry_fingerprint():
+  import subprocess, sys
+  from glue.elements import SingleGroupInline
+  r = Registry(Monospace, Italic, Bold, Paragraphs)
+  f = r.fingerprint
+  assert Registry(Monospace, Italic, Bold, Paragraphs).fingerprint == f
+  # the same in another process, unlike `version`.
+  assert subprocess.run([sys.executable, '-c', 'from glue.library import *; from glue.registry import *; '
+                         'print(Registry(Monospace, Italic, Bold, Paragraphs).fingerprint)'],
+                        capture_output=True, text=True).stdout.strip() == f
+  assert (r | {'monospace': {'escape': '!'}}).fingerprint != f
+  assert (r - [Italic]).fingerprint != f
+  assert (r + [Link]).fingerprint != f
+  custom = lambda cls: r + [SingleGroupInline('custom', '%%', '%%', 'span', {'class': cls})]
+  assert custom('a').fingerprint == custom('a').fingerprint != custom('b').fingerprint
+
+def test_registry_fingerprint_callables():
+  import functools, types
+  import toolz as t
+  from glue.elements import Inline
+  def custom(a, b=1, text=''):
+    return ['span', text]
+  base = Inline(r'%%(.*?)%%', custom)
+  fp = lambda parser: Registry(base._replace(parser=parser)).fingerprint
+  assert fp(functools.partial(custom, 1)) == fp(functools.partial(custom, 1)) != fp(functools.partial(custom, 2))
+  assert fp(functools.partial(custom, b=1)) != fp(functools.partial(custom, b=2))
+  @t.curry
+  def curried(a, text):
+    return ['span', a, text]
+  assert fp(curried(1)) == fp(curried(1)) != fp(curried(2))
+
+  class Holder:
+    def __init__(self, x):
+      self.x = x
+    def parse(self, text):
+      return ['span', self.x, text]
+  assert fp(Holder(1).parse) == fp(Holder(1).parse) != fp(Holder(2).parse)
+
+  # helpers from another module, called by their global name.
+  def helpers(body):
+    m = types.ModuleType('helpers')
+    exec(body, m.__dict__)
+    return m.helper
+  def calling(helper):
+    g = {'helper': helper}
+    exec('def parser(text):\n  return helper(text)', g)
+    return g['parser']
+  upper = helpers('def helper(text):\n  return text.upper()')
+  lower = helpers('def helper(text):\n  return text.lower()')
+  assert fp(calling(upper)) == fp(calling(upper)) != fp(calling(lower))
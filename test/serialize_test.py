@@ -0,0 +1,85 @@
+import pytest
+from hypothesis import given
+from hypothesis.strategies import text
+
+from glue.library import Standard, Bold, Italic
+from glue.parser import parse, parseinline
+from glue.html import render_fast
+from glue.util import unwind, unpack, tonode, tolist
+from glue.serialize import *
+
+def test_roundtrip_attr_values():
+  html = ['x', {'a': 1, 'b': -5, 'c': 2.5, 'd': [True, None, 'x', (1, 2)], 'e': {'k': 'v'}, 'f': -10**30},
+          ['y', {}], ['z'], [], [['p'], 'q'], None]
+  assert loads(dumps(html)) == ['x', {'a': 1, 'b': -5, 'c': 2.5, 'd': [True, None, 'x', [1, 2]], 'e': {'k': 'v'},
+                                      'f': -10**30},
+                                ['y', {}], ['z'], [], [['p'], 'q'], None]
+
+@given(text())
+def test_roundtrip_text(s):
+  assert loads(dumps(['p', {s: s}, s])) == ['p', {s: s}, s]
+
+def test_elements_by_key():
+  html = ['p', *parseinline(Standard, Standard.top, 'a *b* [l](u) c')]
+  data = dumps(html, Standard)
+  assert loads(data, Standard) == html
+  assert loads(data)[2] == ('bold', ['strong', {}, 'b'])
+  assert tolist(tonode(loads(data, Standard))) == tolist(tonode(html))
+  # nodes keep their elements too.
+  assert dumps(tonode(html), Standard) == data
+
+def test_renamed_elements():
+  renamed = (Standard - [Bold]) | {'strong-star': Bold}
+  html = ['p', *parseinline(renamed, renamed.top, 'a *b* c')]
+  data = dumps(html, renamed)
+  assert loads(data)[2] == ('strong-star', ['strong', {}, 'b'])
+  assert loads(data, renamed) == html
+  assert list(lazyloads(data, renamed))[2][0] is Bold
+  with pytest.raises(KeyError):
+    dumps(html, Standard - [Bold])
+
+def test_nested_elements():
+  html = ['div', (Bold, (Italic, ['p', 'a'])), (Bold, (Italic, 'b'))]
+  data = dumps(html, Standard)
+  assert loads(data, Standard) == html
+  top = list(lazyloads(data, Standard))
+  assert top[2] == (Bold, (Italic, 'b'))
+  assert top[1][0] is Bold and top[1][1][0] is Italic and list(top[1][1][1]) == ['p', 'a']
+
+def test_tags_are_interned():
+  data = dumps(['div', *(['p', {'class': 'x'}, 'a'] for _ in range(100))])
+  assert data.count(b'class') == 1
+
+def test_parser_output():
+  text = '# Title\n\nSome *bold* and a [link](http://a.com).\n\n---aside\nAn *aside*.\n...\n'
+  html = unwind(parse(Standard, text))
+  assert loads(dumps(parse(Standard, text))) == html
+  # the parser's nodes keep the elements that made them.
+  out = loads(dumps(parse(Standard, text, nodes=True), Standard), Standard)
+  assert unpack(out) == html
+  elem, aside = out[-1]
+  assert elem is Standard['aside'] and aside[0] == 'aside'
+  assert aside[1][:2] == ['p', 'An ']
+  assert render_fast(tonode(lazyloads(dumps(html, Standard), Standard))) == render_fast(html)
+
+def test_lazyloads_skips_subtrees():
+  top = list(lazyloads(dumps(['div', ('bold', ['p', 'a']), ['p', {'id': 'x'}, 'b'], 'c']), Standard))
+  assert top[0] == 'div' and top[1][0] is Standard['bold'] and top[3] == 'c'
+  assert list(top[2]) == ['p', {'id': 'x'}, 'b']
+  assert list(top[1][1]) == ['p', 'a']
+
+def test_deep():
+  html = 'leaf'
+  for _ in range(10000):
+    html = ['div', html]
+  data = dumps(html)
+  assert dumps(loads(data)) == data
+  assert dumps(lazyloads(data)) == data
+
+def test_errors():
+  with pytest.raises(ValueError):
+    loads(b'<p>not this</p>')
+  with pytest.raises(TypeError):
+    dumps(['p', {'a': object()}])
+  with pytest.raises(KeyError):
+    loads(dumps(('NotAnElement', ['p'])), Standard)
@@ -27,6 +27,18 @@ def test_indexby():
   assert indexby(lambda x: x > 5, [1,4,5,6]) == 3
   assert indexby(lambda x: not isinstance(x, int), ['']) == 0
 
+def test_firstchars():
+  assert firstchars(r'(?<!\\)(?:\\\\)*\K\*(.*?)\*') == {'*'}
+  assert firstchars(r'^(\#{1,6})([^\n]*)$') == {'#'}
+  assert firstchars(r'\@([^@]+)\@') == {'@'}
+  assert firstchars(r'(?:ab)+') == {'a'}
+  # anything that could start in more than one way is unknown.
+  for p in [r'a|b', r'(a|b)c', r'[ab]c', r'a?b', r'(a)?b', r'\dx', r'x{0,3}', r'(?i)a', '']:
+    assert firstchars(p) is None
+  assert toplevel_alternation(r'a[|]b') is False
+  assert toplevel_alternation(r'a(b|c)') is False
+  assert toplevel_alternation(r'a\|b|c') is True
+
 def test_fills():
   assert fills([1,1,1],1) == 1
   assert fills([2,1,1],3) == 2
@@ -167,13 +179,141 @@ def test_splitblocks_sidebyside():
     '---side-by-side\n---list |\nfirst item | hello  \n... | \n...') == [
            ['side-by-side', [], '---list |\nfirst item | hello  \n... | \n']]
 
+def test_blocktree_nestblock():
+  tree = blocktree(nestblock)
+  assert tree[0] == (0, len('some text\n'))
+  outer = tree[1]
+  assert (outer.name, outer.args) == ('block', [])
+  assert nestblock[outer.start:outer.end] == splitblocks(nestblock)[1][2]
+  # nested blocks are already split up, with offsets into the original
+  text, inner = outer.children
+  assert nestblock[text[0]:text[1]] == blockcontents
+  assert (inner.name, nestblock[inner.start:inner.end]) == ('block', blockcontents)
+  assert inner.children == [(inner.start, inner.end)]
+
+def test_blocktree_unclosed():
+  # unclosed blocks are plain text after their first line
+  assert splitblocks('a\n---b\nc\n---d\ne\n...\n') == ['a\n', 'c\n---d\ne\n...\n']
+  assert splitblocks('---b') == []
+  # offsets are into the whole text, even when scanning only part of it
+  assert blocktree('a\n---b\nc\n...\nd', 2) == [BlockSpan('b', [], 7, 9, [(7, 9)]), (13, 14)]
+
+
+def test_splitstream():
+  lines = 'a\nb\n\nc\n---block\nx\n\n---block\ny\n...\n...\n\n\nd\n\n\ne'.splitlines(True)
+  assert list(splitstream(lines)) == [
+    'a\nb\n\n', 'c\n---block\nx\n\n---block\ny\n...\n...\n', '\n\n', 'd\n\n\ne']
+  assert ''.join(splitstream(nestblock.splitlines(True))) == nestblock
+
+def test_splitstream_error():
+  with pytest.raises(ValueError) as e:
+    list(splitstream(['---b\n', '...\n', '\n', '...\n']))
+  assert 'line 4' in str(e.value)
+
+
 # ----------------------- testing unpack ------------------------------
 
 def test_unpack():
   assert unpack(
     ['h1', 'blah blah', ('Image', ['img', {'src': 'imageurl'}])]) == [
     'h1', 'blah blah', ['img', {'src': 'imageurl'}]]
-  
+
+def test_unpack_node():
+  node = Node('p', None, ('text',))
+  assert unpack(node) is node
+  assert unwind(node) is node
+  assert unpack(('Bold', node)) is node
+
+# ----- test nodes
+
+def test_tonode():
+  html = (x for x in ['div', {'id': 'x'}, 'a', ('Bold', ['strong', {}, 'b']), 'c'])
+  node = tonode(html)
+  assert isinstance(node, Node)
+  assert node.tag == 'div' and node.attrs == {'id': 'x'}
+  assert node.children == ('a', Node('strong', {}, ('b',), 'Bold'), 'c')
+  assert node.children[1].elem == 'Bold'
+  assert node == ['div', {'id': 'x'}, 'a', ['strong', {}, 'b'], 'c']
+  assert tolist(node) == unwind(unpack(['div', {'id': 'x'}, 'a', ('Bold', ['strong', {}, 'b']), 'c']))
+
+
+def test_tonode_shapes():
+  assert tonode('text') == 'text'
+  assert tonode([]) == []
+  assert tonode(['br']) == Node('br')
+  assert tonode([['p', 'a'], ['p', 'b']]) == [Node('p', None, ('a',)), Node('p', None, ('b',))]
+  assert list(tonode(['p', {}, 'a'])) == ['p', {}, 'a']
+  assert len(tonode(['p', 'a', 'b'])) == 3
+  assert tonode(['p', 'a', 'b'])[1:] == ['a', 'b']
+
+
+def test_node_indexing():
+  node = Node('p', {'id': 'x'}, ('a', Node('b'), 'c'))
+  assert [node[i] for i in range(len(node))] == list(node) == node[:]
+  assert node[-1] == 'c' and node[-5] == 'p' and Node('p', None, ('a',))[1] == 'a'
+  for i in (5, -6):
+    with pytest.raises(IndexError):
+      node[i]
+
+
+def test_node_hash_pickle():
+  import pickle
+  node = tonode(('Bold', ['strong', {'style': {'a': 1}}, 'b', ['em', 'c']]))
+  assert hash(node) == hash(tonode(['strong', {}, 'b', ['em', 'c']]))
+  assert len({node, tonode(['strong', {'style': {'a': 1}}, 'b', ['em', 'c']])}) == 1
+  # elements can't be pickled, so nodes come back without them.
+  copy = pickle.loads(pickle.dumps(node))
+  assert copy == node and copy.elem is None and copy.children[1].attrs is None
+
+
+def test_tolist_meta():
+  html = ['div', 'a', ('Bold', ['strong', {}, 'b', ('Code', ['code', 'c'])])]
+  node = tonode(html)
+  assert tolist(node) == ['div', 'a', ['strong', {}, 'b', ['code', 'c']]]
+  assert tolist(node, meta=True) == html
+  assert tolist(('Bold', node.children[1]), meta=True) == html[2]
+  assert tolist(('Bold', node.children[1])) == ('Bold', ['strong', {}, 'b', ['code', 'c']])
+
+
+@given(text())
+def test_tonode_tolist_roundtrip(s: str):
+  html = ['div', ['p', {'class': ['a']}, s], ['hr']]
+  assert tolist(tonode(html)) == html
+
+
+def deep(n: int, leaf='leaf'):
+  """`n` nested divs around `leaf`, way past the recursion limit."""
+  html = leaf
+  for _ in range(n):
+    html = ['div', {}, html]
+  return html
+
+def depth(html, body=lambda x: x[2]) -> int:
+  """How many divs deep `deep` like html is, without recursing."""
+  n = 0
+  while not isinstance(html, str):
+    html, n = body(html), n + 1
+  return n
+
+def test_deep_trees():
+  assert depth(unwind(deep(10000))) == 10000
+  gen = 'leaf'
+  for _ in range(10000):
+    gen = (x for x in ['div', {}, gen])
+  assert depth(unwind(gen)) == 10000
+  annotated = 'leaf'
+  for _ in range(10000):
+    annotated = ('Block', ['div', {}, annotated])
+  assert depth(unpack(annotated)) == 10000
+  assert depth(tonode(deep(10000)), lambda n: n.children[0]) == 10000
+  assert depth(tolist(tonode(deep(10000)))) == 10000
+  assert depth(template_to_ast(deep(10000)), lambda x: x['body'][0]) == 10000
+  assert hasleaf(deep(10000), 'leaf') and not hasleaf(deep(10000), 'other')
+  tags = 'leaf'
+  for _ in range(10000):
+    tags = ['div', tags]
+  assert indented_tree(tags).splitlines()[-1] == '  ' * 10000 + 'leaf'
+
 # ----- test template2ast
 
 @given(text())
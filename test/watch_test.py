@@ -0,0 +1,126 @@
+import os
+import sys
+
+from glue.library import Standard
+from glue.codegen import toprettyhtml
+from glue.watch import *
+
+MODULE = '''
+from glue.library import Standard
+from glue.elements import SingleGroupInline
+registry = Standard + [SingleGroupInline('custom', '%%', '%%', 'span', {{'class': '{}'}})]
+'''
+
+ESCAPES = '''
+from glue.library import Standard
+from glue.elements import SingleGroupInline
+registry = Standard + [SingleGroupInline('custom', '%%', '%%', 'span')._replace(escape={})]
+'''
+
+def touch(f, text):
+  f.write_text(text)
+  # a different modification time, even on filesystems with coarse times.
+  st = os.stat(f)
+  os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def test_watcher(tmp_path):
+  (tmp_path / 'docs' / 'sub').mkdir(parents=True)
+  a, b = tmp_path / 'docs' / 'a.glu', tmp_path / 'docs' / 'sub' / 'b.glu'
+  a.write_text('Some *bold*.\n')
+  b.write_text('More _text_.\n')
+  (tmp_path / 'docs' / 'notes.txt').write_text('not a document')
+  out = tmp_path / 'docs' / 'site'
+  w = Watcher([str(tmp_path / 'docs')], ['html'], str(out))
+
+  assert w.poll() == [(str(a), None), (str(b), None)]
+  assert (out / 'sub' / 'b.html').read_text() == toprettyhtml(Standard, 'More _text_.\n') + '\n'
+  assert w.poll() == []
+
+  touch(a, 'Some *more bold*.\n')
+  assert w.poll() == [(str(a), None)]
+  assert 'more bold' in (out / 'a.html').read_text()
+
+  b.unlink()
+  assert w.poll() == [] and not (out / 'sub' / 'b.html').exists()
+
+def test_watcher_reloads_registry(tmp_path, monkeypatch):
+  (tmp_path / 'docs').mkdir()
+  module = tmp_path / 'watched_registry.py'
+  module.write_text(MODULE.format('one'))
+  monkeypatch.syspath_prepend(str(tmp_path))
+  a, b = tmp_path / 'docs' / 'a.glu', tmp_path / 'docs' / 'b.glu'
+  a.write_text('Some %%custom%% text.\n')
+  b.write_text('Plain text.\n')
+  out = tmp_path / 'site'
+  w = Watcher([str(tmp_path / 'docs')], ['html'], str(out), module='watched_registry')
+  try:
+    assert len(w.poll()) == 2
+    assert 'class="one"' in (out / 'a.html').read_text()
+
+    touch(module, MODULE.format('three'))
+    assert w.poll() == [(str(a), None)]
+    assert 'class="three"' in (out / 'a.html').read_text()
+
+    touch(module, 'registry = ')
+    assert [f for f, error in w.poll()] == [str(module)]
+    assert 'class="three"' in (out / 'a.html').read_text()
+  finally:
+    sys.modules.pop('watched_registry', None)
+
+def test_watcher_escape_changes(tmp_path, monkeypatch):
+  # only the escapes change, which matters to text the element doesn't match.
+  (tmp_path / 'docs').mkdir()
+  module = tmp_path / 'escaping_registry.py'
+  module.write_text(ESCAPES.format(['%']))
+  monkeypatch.syspath_prepend(str(tmp_path))
+  a, b = tmp_path / 'docs' / 'a.glu', tmp_path / 'docs' / 'b.glu'
+  a.write_text('Some %%custom%% text.\n')
+  b.write_text('Plain \\@ text.\n')
+  out = tmp_path / 'site'
+  w = Watcher([str(tmp_path / 'docs')], ['html'], str(out), module='escaping_registry')
+  try:
+    assert len(w.poll()) == 2
+    assert 'Plain \\@ text.' in (out / 'b.html').read_text()
+
+    touch(module, ESCAPES.format(['%', '@']))
+    assert w.poll() == [(str(a), None), (str(b), None)]
+    assert 'Plain @ text.' in (out / 'b.html').read_text()
+  finally:
+    sys.modules.pop('escaping_registry', None)
+
+def test_changed_escapes():
+  from glue.elements import SingleGroupInline
+  from glue.library import Bold, Paragraphs
+  from glue.registry import Registry
+  custom = lambda escape: SingleGroupInline('custom', '%%', '%%', 'span')._replace(escape=escape)
+  # the top block only parses `custom` inside `---note`.
+  registry = lambda escape: (
+    Registry(Bold, custom(escape), top=Paragraphs._replace(sub=['note'], subinline=[])) |
+    {'note': Paragraphs._replace(sub=['custom'], subinline=['custom'])})
+  old, new = registry(['%']), registry(['%', '@'])
+  changed = changed_elements(old, new)
+  assert changed == [('custom', old['custom']), ('custom', new['custom']), ('note', new['note'])]
+  assert uses('a\n---note\nb \\@ c\n...\n', changed) and not uses('a \\@ b\n', changed)
+  # the top block parses everything in the standard registry.
+  assert changed_elements(Standard + [custom(['%'])], Standard + [custom(['%', '@'])]) is None
+  assert changed_elements(Standard + [custom(['%'])], Standard + [custom(['%'])._replace(sub=[])]) is None
+
+def test_changed_elements():
+  from glue.elements import SingleGroupInline
+  custom = lambda cls: SingleGroupInline('custom', '%%', '%%', 'span', {'class': cls})
+  old, new = Standard + [custom('a')], Standard + [custom('b')]
+  assert changed_elements(old, new) == [('custom', old['custom']), ('custom', new['custom'])]
+  assert changed_elements(old, Standard + [custom('a')]) == []
+  assert changed_elements(Standard, Standard - [Standard['blockquote']]) == [('blockquote', Standard['blockquote'])]
+  # without bold, `\*` stays as it is everywhere.
+  assert changed_elements(Standard, Standard - [Standard['bold']]) is None
+  assert uses('a %%b%% c', [('custom', custom('a'))]) and not uses('a b c', [('custom', custom('a'))])
+
+def test_uses_registry_keys():
+  # documents use blocks by their key in the registry, which needn't be their name.
+  old = Standard | {'note': Standard['blockquote']}
+  new = Standard | {'note': Standard['paragraphs']}
+  changed = changed_elements(old, new)
+  assert changed == [('note', Standard['blockquote']), ('note', Standard['paragraphs'])]
+  assert uses('a\n---note\nb\n...\n', changed)
+  assert not uses('a\n---blockquote\nb\n...\n', changed)